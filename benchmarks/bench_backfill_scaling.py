@@ -0,0 +1,44 @@
+# Measure how the process-pool backfill scales with the number of worker processes
+#
+# Usage (from the repository root):
+#     python -m benchmarks.bench_backfill_scaling --days 16 --rows 20000 --workers 1 2 4 8
+
+import argparse
+import os
+import tempfile
+import time
+from benchmarks.fake_api_server import run_fake_api_process
+from executor_func.utils.backfill import run_backfill
+
+DATETIME_NOW = "2025-06-01 00:00:00"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=16)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--server-workers", type=int, default=os.cpu_count())
+    opts = parser.parse_args()
+
+    end_date = f"2025-05-{opts.days:02d}"
+    print(f"{os.cpu_count()} CPUs, {opts.days} days x 2 platforms x {opts.rows} rows")
+    with run_fake_api_process(opts.server_workers) as reporting_url:
+        url = f"{reporting_url}?rows={opts.rows}"
+        baseline = None
+        for workers in opts.workers:
+            with tempfile.TemporaryDirectory() as root:
+                start = time.perf_counter()
+                results = run_backfill(
+                    url, "2025-05-01", end_date, DATETIME_NOW, root, max_workers=workers
+                )
+                seconds = time.perf_counter() - start
+            baseline = baseline or seconds
+            print(
+                f"{workers:>3} workers: {seconds:.1f}s, speedup x{baseline / seconds:.2f} "
+                f"({sum(r['rows'] for r in results)} rows)"
+            )
+
+
+if __name__ == "__main__":
+    main()
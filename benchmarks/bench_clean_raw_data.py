@@ -0,0 +1,51 @@
+# Compare the legacy list-of-dicts clean_raw_data with the precompiled column-oriented schema
+#
+# Usage (from the repository root):
+#     python -m benchmarks.bench_clean_raw_data --rows 10000 100000 1000000
+
+import argparse
+import time
+import pandas as pd
+from benchmarks.synthetic import make_rows
+from executor_func.utils.configs import config
+from executor_func.utils.read import clean_raw_data
+from executor_func.utils.schema import _to_camel_case
+
+
+def _legacy_clean_raw_data(data, datetime_now):
+    df_raw = pd.DataFrame(data)
+    df_raw = df_raw.astype({col: "int64" for col in config["integer_cols"]})
+    df_raw = df_raw.astype({col: "float64" for col in config["float_cols"]})
+    df_raw = df_raw[config["ordered_columns"]]
+    df_raw.columns = [_to_camel_case(col) for col in df_raw.columns]
+    df_raw["createdAt"] = pd.to_datetime(datetime_now)
+    return df_raw
+
+
+def _best_of(func, data, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(data, "2025-05-31 00:00:00")
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    opts = parser.parse_args()
+
+    for num_rows in opts.rows:
+        data = make_rows(num_rows)
+        legacy = _best_of(_legacy_clean_raw_data, data, opts.repeat)
+        schema = _best_of(clean_raw_data, data, opts.repeat)
+        print(
+            f"{num_rows:>9} rows: legacy {legacy:.3f}s, schema {schema:.3f}s, "
+            f"speedup x{legacy / schema:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# Compare serial and pooled deletion of staged files against a fake bucket with per-call latency
+#
+# Usage (from the repository root):
+#     python -m benchmarks.bench_cleanup --latency 0.02 --files 60 600
+
+import argparse
+import time
+from orchestrator_func.utils.write import clean_all_temp_files
+
+
+class _FakeBlob:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def delete(self):
+        time.sleep(self.latency)
+
+
+class _FakeStorageClient:
+    def __init__(self, num_files, latency):
+        self.num_files = num_files
+        self.latency = latency
+
+    def list_blobs(self, bucket_name, prefix=None):
+        return (_FakeBlob(self.latency) for _ in range(self.num_files))
+
+
+def _serial(client):
+    start = time.perf_counter()
+    for blob in client.list_blobs("bucket", prefix="temp_data"):
+        blob.delete()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--files", type=int, nargs="+", default=[60, 600])
+    parser.add_argument("--workers", type=int, default=8)
+    opts = parser.parse_args()
+
+    for num_files in opts.files:
+        client = _FakeStorageClient(num_files, opts.latency)
+        serial_seconds = _serial(client)
+        summary = clean_all_temp_files("bucket", max_workers=opts.workers, client=client)
+        print(
+            f"{num_files:>6} files: serial {serial_seconds:.2f}s, "
+            f"pooled {summary['seconds']:.2f}s ({opts.workers} workers, {opts.latency}s per delete)"
+        )
+
+
+if __name__ == "__main__":
+    main()
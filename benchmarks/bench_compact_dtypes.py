@@ -0,0 +1,43 @@
+# Compare the memory of the default and compact cleaned frames per million rows, against the 2Gi
+# memory limit of the executor, along with their cleaning time and staged Parquet size
+#
+# Usage (from the repository root):
+#     python -m benchmarks.bench_compact_dtypes --rows 1000000
+
+import argparse
+import os
+import tempfile
+import time
+from benchmarks.synthetic import make_rows
+from executor_func.utils.read import clean_raw_data
+from executor_func.utils.staging import get_staging_format
+
+EXECUTOR_MEMORY_BYTES = 2 * 1024**3
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    opts = parser.parse_args()
+
+    data = make_rows(opts.rows)
+    per_million = 1_000_000 / opts.rows
+    with tempfile.TemporaryDirectory() as root:
+        for compact in (False, True):
+            start = time.perf_counter()
+            df = clean_raw_data(data, "2025-05-31 00:00:00", compact=compact)
+            seconds = time.perf_counter() - start
+            frame_bytes = df.memory_usage(deep=True).sum()
+            path = os.path.join(root, f"compact_{compact}.parquet")
+            get_staging_format("parquet").write(df, path)
+            print(
+                f"{'compact' if compact else 'default':>8}: "
+                f"{frame_bytes * per_million / 2**20:.0f} MiB per 1M rows in memory, "
+                f"{os.path.getsize(path) * per_million / 2**20:.0f} MiB staged, clean {seconds:.2f}s, "
+                f"{EXECUTOR_MEMORY_BYTES / frame_bytes * opts.rows / 1e6:.1f}M rows per 2Gi"
+            )
+            del df
+
+
+if __name__ == "__main__":
+    main()
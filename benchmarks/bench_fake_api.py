@@ -0,0 +1,39 @@
+# Compare the row throughput of the faker and fast generators of the fake FASS API
+#
+# Usage (from the repository root):
+#     python -m benchmarks.bench_fake_api --rows 100000 1000000
+
+import argparse
+import time
+import requests
+from benchmarks.fake_api_server import run_fake_api
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--modes", nargs="+", default=["faker", "fast"])
+    opts = parser.parse_args()
+
+    with run_fake_api() as reporting_url, requests.Session() as session:
+        for rows in opts.rows:
+            for mode in opts.modes:
+                url = (
+                    f"{reporting_url}?start_date=2025-05-01&end_date=2025-05-31"
+                    f"&platform=ios&rows={rows}&mode={mode}"
+                )
+                start = time.perf_counter()
+                num_bytes = 0
+                with session.get(url, stream=True) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_content(chunk_size=1 << 20):
+                        num_bytes += len(chunk)
+                seconds = time.perf_counter() - start
+                print(
+                    f"{rows:>9} rows {mode:>5}: {seconds:.2f}s, "
+                    f"{rows / seconds:,.0f} rows/s, {num_bytes / 1024 / 1024:.0f} MiB"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# Compare sequential and concurrent platform fetches against a delayed local fake FASS API
+#
+# Usage (from the repository root):
+#     python -m benchmarks.bench_fetch_platforms --delay 1.0 --platforms ios android
+
+import argparse
+import time
+from benchmarks.fake_api_server import run_fake_api
+from executor_func.utils.read import fetch_platforms, get_with_url, get_session
+
+
+def _sequential(url, platforms):
+    session = get_session()
+    return {
+        platform: get_with_url(f"{url}&platform={platform}", session)
+        for platform in platforms
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--delay", type=float, default=1.0)
+    parser.add_argument("--platforms", nargs="+", default=["ios", "android"])
+    parser.add_argument("--repeat", type=int, default=3)
+    opts = parser.parse_args()
+
+    with run_fake_api() as reporting_url:
+        url = (
+            f"{reporting_url}?start_date=2025-05-01&end_date=2025-05-01"
+            f"&delay_seconds={opts.delay}"
+        )
+        for name, fetch in [("sequential", _sequential), ("concurrent", fetch_platforms)]:
+            timings = []
+            for _ in range(opts.repeat):
+                start = time.perf_counter()
+                results = fetch(url, opts.platforms)
+                timings.append(time.perf_counter() - start)
+                assert all(len(rows) > 0 for rows in results.values())
+            print(
+                f"{name:>10}: best {min(timings):.3f}s, "
+                f"mean {sum(timings) / len(timings):.3f}s "
+                f"({len(opts.platforms)} platforms, {opts.delay}s delay)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# Measure the cold-start cost of the executor and orchestrator: module import time and the first
+# fetch-and-clean call of the executor, each in a fresh interpreter
+#
+# Usage (from the repository root):
+#     python -m benchmarks.bench_import_time --top 10
+
+import argparse
+import os
+import subprocess
+import sys
+from benchmarks.fake_api_server import run_fake_api
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FUNCTIONS = ["executor_func", "orchestrator_func"]
+
+# Imports main like the Functions Framework does, then runs the first fetch and clean of a
+# handler call, so the dependencies deferred to that code path are paid for as well
+COLD_CALL = """
+import sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from utils.read import fetch_platforms, clean_raw_data
+results = fetch_platforms(sys.argv[1], ["ios", "android"])
+for rows in results.values():
+    clean_raw_data(rows, "2025-05-01 00:00:00")
+done = time.perf_counter()
+print(f"{imported - start:.3f} {done - imported:.3f}")
+"""
+
+
+def import_times(function_dir):
+    """
+    Imports main in a fresh interpreter with -X importtime.
+
+    Args:
+        function_dir (str): The folder of the Cloud Function.
+
+    Returns:
+        dict: A mapping of module name to cumulative import time, in seconds.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=os.path.join(ROOT, function_dir),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        times[module.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    opts = parser.parse_args()
+
+    for function_dir in FUNCTIONS:
+        runs = [import_times(function_dir) for _ in range(opts.repeat)]
+        best = min(runs, key=lambda times: times["main"])
+        print(f"{function_dir}: import main best {best['main']:.3f}s over {opts.repeat} runs")
+        top = sorted(best.items(), key=lambda item: item[1], reverse=True)[1 : opts.top + 1]
+        for module, seconds in top:
+            print(f"    {seconds:.3f}s {module}")
+
+    with run_fake_api() as reporting_url:
+        url = f"{reporting_url}?start_date=2025-05-01&end_date=2025-05-01"
+        timings = []
+        for _ in range(opts.repeat):
+            completed = subprocess.run(
+                [sys.executable, "-c", COLD_CALL, url],
+                cwd=os.path.join(ROOT, "executor_func"),
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            timings.append([float(t) for t in completed.stdout.split()[-2:]])
+    imported, first_call = min(timings, key=sum)
+    print(f"executor_func: cold call import {imported:.3f}s + first fetch and clean {first_call:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
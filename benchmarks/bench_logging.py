@@ -0,0 +1,57 @@
+# Compare the cost of a log entry written with print(json.dumps(...)) and with the buffered logger,
+# for entries that are written, filtered out by level, and dropped by rate limiting
+#
+# Usage (from the repository root):
+#     python -m benchmarks.bench_logging --entries 100000
+
+import argparse
+import json
+import os
+import time
+from executor_func.utils.logger import Logger
+
+ARGS = {
+    "url": "https://fass-api.example.com/reporting?start_date=2025-05-01&end_date=2025-05-07",
+    "datetime_now": "2025-05-07 12:00:00",
+    "start_date": "2025-05-01",
+    "end_date": "2025-05-07",
+    "batch_load": False,
+    "scheduler_id": "7d",
+    "platforms": ["ios", "android"],
+}
+
+
+def _time(log_once, entries):
+    start = time.perf_counter()
+    for i in range(entries):
+        log_once(i)
+    return (time.perf_counter() - start) / entries * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=100_000)
+    opts = parser.parse_args()
+
+    with open(os.devnull, "w") as devnull:
+        written = Logger(level="INFO", rate_limit_burst=opts.entries, stream=devnull)
+        filtered = Logger(level="INFO", stream=devnull)
+        limited = Logger(level="INFO", stream=devnull)
+
+        def _print(i):
+            entry = {"severity": "INFO", "message": f"Sending POST request {i}", "custom_property": f"Data: {ARGS}"}
+            print(json.dumps(entry), file=devnull)
+
+        scenarios = {
+            "print(json.dumps)": _print,
+            "logger, written": lambda i: written.info(f"Sending POST request {i}", ARGS),
+            "logger, below level": lambda i: filtered.debug(f"Sending POST request {i}", ARGS),
+            "logger, rate limited": lambda i: limited.info(f"Sending POST request {i}", ARGS, rate_key="Sending POST request"),
+        }
+        for name, log_once in scenarios.items():
+            print(f"{name:>22}: {_time(log_once, opts.entries):.2f}us per entry")
+        written.flush()
+
+
+if __name__ == "__main__":
+    main()
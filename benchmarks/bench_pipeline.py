@@ -0,0 +1,266 @@
+# Run the whole orchestrator -> executor -> staging -> load flow locally for each schedule: both
+# Cloud Functions run in this process against the fake FASS API, a filesystem-backed GCS and a
+# recording BigQuery, and every run reports its wall time, API calls, objects written and peak RSS
+#
+# Usage (from the repository root):
+#     python -m benchmarks.bench_pipeline --schedules 2h 7d 1m --repeat 1
+
+import argparse
+import contextlib
+import http.server
+import importlib
+import importlib.util
+import json
+import os
+import pkgutil
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import psutil
+from benchmarks.fake_api_server import run_fake_api_process
+from benchmarks.local_gcp import LocalGcsFileSystem, LocalStorageClient, RecordingBigQueryClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GCS_BUCKET = "bench-bucket"
+
+
+def load_function(function_dir):
+    """
+    Imports the main module of a Cloud Function next to the other one. Both import their own
+    `utils` package, so it is aliased to the function's package while main is loaded.
+
+    Args:
+        function_dir (str): The folder of the Cloud Function, e.g. "executor_func".
+
+    Returns:
+        module: The main module of the function.
+    """
+    package = importlib.import_module(f"{function_dir}.utils")
+    aliases = {"utils": package}
+    for module in pkgutil.iter_modules(package.__path__):
+        aliases[f"utils.{module.name}"] = importlib.import_module(f"{function_dir}.utils.{module.name}")
+    saved = {name: sys.modules.pop(name) for name in list(sys.modules) if name.split(".")[0] == "utils"}
+    sys.modules.update(aliases)
+    try:
+        spec = importlib.util.spec_from_file_location(
+            f"{function_dir}.main", os.path.join(ROOT, function_dir, "main.py")
+        )
+        main = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(main)
+    finally:
+        for name in aliases:
+            sys.modules.pop(name, None)
+        sys.modules.update(saved)
+    return main
+
+
+class _Request:
+    """flask.Request stand-in exposing the JSON body, as the Functions Framework does."""
+
+    def __init__(self, body):
+        self.body = body
+
+    def get_json(self, silent=False):
+        return self.body
+
+
+class _ExecutorServer:
+    """
+    Serves the executor handler over HTTP, one thread per call, so the orchestrator dispatches to it
+    exactly as to the Cloud Function and the executors of a run overlap.
+
+    Args:
+        handler (callable): The executor handler, call_api.
+    """
+
+    def __init__(self, handler):
+        self.active = 0
+        self.errors = []
+        self.condition = threading.Condition()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server.condition:
+                    server.active += 1
+                try:
+                    handler(_Request(body))
+                    self.send_response(200)
+                except Exception as err:
+                    server.errors.append(repr(err))
+                    self.send_response(500)
+                finally:
+                    with server.condition:
+                        server.active -= 1
+                        server.condition.notify_all()
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/"
+
+    def wait_idle(self, timeout=None):
+        """Blocks until no executor call is running."""
+        with self.condition:
+            return self.condition.wait_for(lambda: self.active == 0, timeout)
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _PeakRss:
+    """Samples the resident set size of this process in a background thread and keeps the peak."""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+        self.stop = threading.Event()
+
+    def _sample(self):
+        while not self.stop.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            self.stop.wait(self.interval)
+
+    def __enter__(self):
+        self.baseline = self.process.memory_info().rss
+        self.peak = self.baseline
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.thread.join()
+
+
+@contextlib.contextmanager
+def local_pipeline(reporting_url, poll_seconds=None):
+    """
+    Loads both Cloud Functions in this process and wires them to the local GCP stand-ins.
+
+    Args:
+        reporting_url (str): The URL of the /reporting endpoint of the fake FASS API.
+        poll_seconds (float): Overrides the completion poll interval of both functions.
+
+    Yields:
+        dict: The orchestrator and executor main modules, the executor server and the storage
+            and BigQuery stand-ins.
+    """
+    from executor_func.utils import clients as executor_clients
+    from executor_func.utils import read as executor_read
+    from executor_func.utils.configs import config as executor_config
+    from orchestrator_func.utils import clients as orchestrator_clients
+    from orchestrator_func.utils import read as orchestrator_read
+    from orchestrator_func.utils.configs import config as orchestrator_config
+
+    root = tempfile.mkdtemp(prefix="bench_pipeline_")
+    storage_client = LocalStorageClient(root)
+    bigquery_client = RecordingBigQueryClient(storage_client)
+    clients = {"storage": storage_client, "bigquery": bigquery_client}
+    LocalGcsFileSystem.install(storage_client)
+    executor_clients.set_client_factory(clients.__getitem__)
+    orchestrator_clients.set_client_factory(clients.__getitem__)
+    orchestrator_config["base_url"] = reporting_url
+    if poll_seconds:
+        executor_config["completion_poll_seconds"] = poll_seconds
+        orchestrator_config["completion_poll_seconds"] = poll_seconds
+    api_calls = {"count": 0}
+
+    def _count_call(response, *args, **kwargs):
+        api_calls["count"] += 1
+
+    executor_read.get_session().hooks["response"].append(_count_call)
+    os.environ["GCS_BUCKET"] = GCS_BUCKET
+    os.environ["K_SERVICE"] = "fass-executor-test"
+    executor_main = load_function("executor_func")
+    try:
+        with _ExecutorServer(executor_main.call_api) as executor_server:
+            os.environ["EXECUTOR_URL"] = executor_server.url
+            orchestrator_main = load_function("orchestrator_func")
+            # a local token stands in for the Google-signed ID token of the executor audience
+            orchestrator_read._id_tokens[executor_server.url] = ("local-token", time.time() + 3600)
+            yield {
+                "orchestrator": orchestrator_main,
+                "executor_server": executor_server,
+                "storage_client": storage_client,
+                "bigquery_client": bigquery_client,
+                "api_calls": api_calls,
+            }
+    finally:
+        executor_read.get_session().hooks["response"].remove(_count_call)
+        executor_clients.set_client_factory()
+        orchestrator_clients.set_client_factory()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def run_schedule(pipeline, scheduler_id):
+    """
+    Runs one orchestrator invocation of a schedule and waits for its executors to return.
+
+    Args:
+        pipeline (dict): The pipeline yielded by local_pipeline.
+        scheduler_id (str): The ID of the schedule, "2h", "7d" or "1m".
+
+    Returns:
+        dict: The wall time, API calls, objects written, rows loaded and peak RSS of the run.
+    """
+    storage_before = pipeline["storage_client"].counters.snapshot()
+    calls_before = pipeline["api_calls"]["count"]
+    rows_before = pipeline["bigquery_client"].loaded_rows()
+    errors_before = len(pipeline["executor_server"].errors)
+    with _PeakRss() as rss:
+        start = time.perf_counter()
+        pipeline["orchestrator"].handle_api_calls(_Request({"scheduler_id": scheduler_id}))
+        pipeline["executor_server"].wait_idle()
+        wall_seconds = time.perf_counter() - start
+    storage = pipeline["storage_client"].counters.snapshot()
+    return {
+        "wall_seconds": wall_seconds,
+        "api_calls": pipeline["api_calls"]["count"] - calls_before,
+        "objects_written": storage.get("objects_written", 0) - storage_before.get("objects_written", 0),
+        "rows_loaded": pipeline["bigquery_client"].loaded_rows() - rows_before,
+        "peak_rss_mb": rss.peak / 2**20,
+        "rss_growth_mb": (rss.peak - rss.baseline) / 2**20,
+        "errors": pipeline["executor_server"].errors[errors_before:],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--schedules", nargs="+", default=["2h", "7d", "1m"])
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--poll-seconds", type=float, default=0.2)
+    parser.add_argument("--verbose", action="store_true", help="Keep the logs of both functions")
+    opts = parser.parse_args()
+
+    with run_fake_api_process() as reporting_url, open(os.devnull, "w") as devnull:
+        with local_pipeline(reporting_url, opts.poll_seconds) as pipeline:
+            # a first run pays for the lazy imports of both functions, which would skew the first schedule
+            with contextlib.redirect_stdout(devnull):
+                run_schedule(pipeline, opts.schedules[0])
+            for scheduler_id in opts.schedules:
+                for _ in range(opts.repeat):
+                    with contextlib.redirect_stdout(sys.stdout if opts.verbose else devnull):
+                        result = run_schedule(pipeline, scheduler_id)
+                    print(
+                        f"{scheduler_id:>3}: wall {result['wall_seconds']:.2f}s, "
+                        f"{result['api_calls']} API calls, {result['objects_written']} objects written, "
+                        f"{result['rows_loaded']} rows loaded, peak RSS {result['peak_rss_mb']:.0f} MB "
+                        f"(+{result['rss_growth_mb']:.0f} MB)"
+                        + (f", executor errors: {result['errors']}" if result["errors"] else "")
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# Compare CSV and Parquet staging at 1m-schedule volume (30 days * 2 platforms partitions)
+#
+# Usage (from the repository root):
+#     python -m benchmarks.bench_staging_format --rows-per-partition 5000
+
+import argparse
+import datetime
+import os
+import tempfile
+import time
+from benchmarks.synthetic import make_rows
+from executor_func.utils.read import clean_raw_data
+from executor_func.utils.staging import get_staging_format
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--platforms", nargs="+", default=["ios", "android"])
+    parser.add_argument("--rows-per-partition", type=int, default=5000)
+    opts = parser.parse_args()
+
+    datetime_now = "2025-05-31 00:00:00"
+    first_day = datetime.date(2025, 5, 1)
+    partitions = []
+    for i in range(opts.days):
+        day = str(first_day + datetime.timedelta(days=i))
+        for platform in opts.platforms:
+            rows = make_rows(opts.rows_per_partition, day, platform, seed=i)
+            partitions.append((f"{day}_{platform}", clean_raw_data(rows, datetime_now)))
+    total_rows = opts.rows_per_partition * len(partitions)
+    print(f"{len(partitions)} partitions, {total_rows} rows")
+
+    for name in ["csv", "parquet"]:
+        staging_format = get_staging_format(name)
+        with tempfile.TemporaryDirectory() as root:
+            paths = []
+            start = time.perf_counter()
+            for key, df in partitions:
+                path = os.path.join(root, f"{key}.{staging_format.extension}")
+                staging_format.write(df, path)
+                paths.append(path)
+            write_seconds = time.perf_counter() - start
+            size = sum(os.path.getsize(path) for path in paths)
+            start = time.perf_counter()
+            for path in paths:
+                staging_format.read(path)
+            read_seconds = time.perf_counter() - start
+        print(
+            f"{name:>8}: write {write_seconds:.2f}s, read {read_seconds:.2f}s, "
+            f"{size / 1024 / 1024:.1f} MiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# Compare peak Python memory of buffered and streamed ingestion of a large fake FASS API response,
+# served from a separate process
+#
+# Usage (from the repository root):
+#     python -m benchmarks.bench_streaming_fetch --rows 200000
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from benchmarks.fake_api_server import run_fake_api_process
+from executor_func.utils.read import clean_raw_data, get_with_url, iter_record_batches
+from executor_func.utils.staging import get_staging_format
+
+DATETIME_NOW = "2025-05-31 00:00:00"
+
+
+def _buffered(url, path):
+    df = clean_raw_data(get_with_url(url), DATETIME_NOW)
+    get_staging_format().write(df, path)
+    return len(df)
+
+
+def _streamed(url, path, batch_rows):
+    batches = (clean_raw_data(batch, DATETIME_NOW) for batch in iter_record_batches(url, batch_rows))
+    return get_staging_format().write_batches(batches, path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--batch-rows", type=int, default=20_000)
+    opts = parser.parse_args()
+
+    # the API runs in its own process, so only the memory of the client is traced
+    with run_fake_api_process() as reporting_url, tempfile.TemporaryDirectory() as root:
+        url = f"{reporting_url}?start_date=2025-05-01&end_date=2025-05-01&platform=ios&rows={opts.rows}"
+        runs = [
+            ("buffered", lambda path: _buffered(url, path)),
+            ("streamed", lambda path: _streamed(url, path, opts.batch_rows)),
+        ]
+        for name, run in runs:
+            path = os.path.join(root, f"{name}.parquet")
+            tracemalloc.start()
+            start = time.perf_counter()
+            num_rows = run(path)
+            seconds = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{name:>8}: {num_rows} rows in {seconds:.1f}s, peak {peak / 1024 / 1024:.0f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# Run the fake FASS API in a background thread or in worker processes for local benchmarks
+
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uvicorn
+from fake_adjust_api.main import app
+
+
+def _free_port():
+    """
+    Finds a free TCP port on localhost.
+
+    Returns:
+        int: The port number.
+    """
+    with contextlib.closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def run_fake_api(port=None):
+    """
+    Starts the fake FASS API on localhost and yields its reporting URL.
+
+    Args:
+        port (int): The port to bind to. Defaults to a free port.
+
+    Yields:
+        str: The URL of the /reporting endpoint.
+    """
+    port = port or _free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    try:
+        yield f"http://127.0.0.1:{port}/reporting"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+@contextlib.contextmanager
+def run_fake_api_process(workers=1, port=None):
+    """
+    Starts the fake FASS API in uvicorn worker processes, so the server does not become the
+    bottleneck of multi-process benchmarks, and yields its reporting URL.
+
+    Args:
+        workers (int): The number of uvicorn worker processes.
+        port (int): The port to bind to. Defaults to a free port.
+
+    Yields:
+        str: The URL of the /reporting endpoint.
+    """
+    port = port or _free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "fake_adjust_api.main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning",
+        ],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    try:
+        while True:
+            with contextlib.closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as sock:
+                if sock.connect_ex(("127.0.0.1", port)) == 0:
+                    break
+            if process.poll() is not None:
+                raise RuntimeError("The fake FASS API exited before accepting connections")
+            time.sleep(0.1)
+        yield f"http://127.0.0.1:{port}/reporting"
+    finally:
+        process.terminate()
+        process.wait()
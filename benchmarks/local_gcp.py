@@ -0,0 +1,195 @@
+# Filesystem-backed GCS and recording BigQuery stand-ins, to run both Cloud Functions locally end to end
+
+import os
+import threading
+from fsspec.implementations.local import LocalFileSystem
+
+
+class _Counters:
+    """Thread-safe operation counters shared by the local GCP stand-ins."""
+
+    def __init__(self):
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, value=1):
+        with self.lock:
+            self.values[name] = self.values.get(name, 0) + value
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+
+class _LocalBlob:
+    def __init__(self, client, bucket, name):
+        self.client = client
+        self.bucket = bucket
+        self.name = name
+        self.path = client.local_path(bucket.name, name)
+
+    def upload_from_string(self, data, if_generation_match=None):
+        from google.api_core.exceptions import PreconditionFailed
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        try:
+            # if_generation_match=0 is a create-if-absent write, like on GCS
+            f = open(self.path, "xb" if if_generation_match == 0 else "wb")
+        except FileExistsError:
+            raise PreconditionFailed(f"gs://{self.bucket.name}/{self.name} already exists")
+        with f:
+            f.write(data.encode() if isinstance(data, str) else data)
+        self.client.counters.add("objects_written")
+
+    def download_as_bytes(self):
+        from google.api_core.exceptions import NotFound
+
+        self.client.counters.add("objects_read")
+        try:
+            with open(self.path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            raise NotFound(f"gs://{self.bucket.name}/{self.name}")
+
+    def exists(self):
+        self.client.counters.add("objects_read")
+        return os.path.isfile(self.path)
+
+    def delete(self):
+        from google.api_core.exceptions import NotFound
+
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            raise NotFound(f"gs://{self.bucket.name}/{self.name}")
+        self.client.counters.add("objects_deleted")
+
+
+class _LocalBucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def blob(self, name):
+        return _LocalBlob(self.client, self, name)
+
+
+class LocalStorageClient:
+    """
+    google.cloud.storage.Client stand-in keeping every bucket in a folder of a local directory.
+
+    Args:
+        root (str): The directory holding the buckets.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.counters = _Counters()
+
+    def local_path(self, bucket_name, name):
+        """Returns the local path of an object."""
+        return os.path.join(self.root, bucket_name, *name.split("/"))
+
+    def bucket(self, bucket_name):
+        return _LocalBucket(self, bucket_name)
+
+    def list_blobs(self, bucket_or_name, prefix=None):
+        self.counters.add("list_calls")
+        bucket = bucket_or_name if isinstance(bucket_or_name, _LocalBucket) else self.bucket(bucket_or_name)
+        bucket_root = os.path.join(self.root, bucket.name)
+        names = []
+        for dirpath, _, filenames in os.walk(bucket_root):
+            for filename in filenames:
+                name = os.path.relpath(os.path.join(dirpath, filename), bucket_root).replace(os.sep, "/")
+                if name.startswith(prefix or ""):
+                    names.append(name)
+        return [bucket.blob(name) for name in sorted(names)]
+
+
+class LocalGcsFileSystem(LocalFileSystem):
+    """
+    fsspec filesystem serving gs:// paths from the directory of a LocalStorageClient, so the staged
+    files written by pandas and pyarrow land next to the objects written through the client.
+    Installed with `install`.
+    """
+
+    storage_client = None
+
+    def __init__(self, *args, **kwargs):
+        kwargs["auto_mkdir"] = True
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def _strip_protocol(cls, path):
+        path = str(path)
+        if path.startswith("gs://"):
+            bucket_name, _, name = path[len("gs://"):].partition("/")
+            path = cls.storage_client.local_path(bucket_name, name)
+        return super()._strip_protocol(path)
+
+    def _open(self, path, mode="rb", **kwargs):
+        if "w" in mode or "a" in mode:
+            self.storage_client.counters.add("objects_written")
+        else:
+            self.storage_client.counters.add("objects_read")
+        return super()._open(path, mode=mode, **kwargs)
+
+    @classmethod
+    def install(cls, storage_client):
+        """Routes every gs:// path opened through fsspec to the directory of `storage_client`."""
+        import fsspec
+
+        cls.storage_client = storage_client
+        fsspec.register_implementation("gs", cls, clobber=True)
+        cls.clear_instance_cache()
+
+
+class _Job:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+
+    def result(self):
+        return self.rows
+
+
+class RecordingBigQueryClient:
+    """
+    google.cloud.bigquery.Client stand-in recording every query and load job. Queries return no
+    rows, as from empty tables. Load jobs count the rows of their staged files.
+
+    Args:
+        storage_client (LocalStorageClient): The client holding the staged files.
+    """
+
+    def __init__(self, storage_client):
+        self.storage_client = storage_client
+        self.queries = []
+        self.loads = []
+        self.lock = threading.Lock()
+
+    def _count_rows(self, uri):
+        bucket_name, _, name = uri[len("gs://"):].partition("/")
+        path = self.storage_client.local_path(bucket_name, name)
+        if path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+
+            return pq.ParquetFile(path).metadata.num_rows
+        with open(path, "rb") as f:
+            return max(sum(1 for _ in f) - 1, 0)
+
+    def query(self, query, job_config=None):
+        with self.lock:
+            self.queries.append(query)
+        return _Job()
+
+    def load_table_from_uri(self, source_uris, destination, job_config=None):
+        source_uris = [source_uris] if isinstance(source_uris, str) else list(source_uris)
+        rows = sum(self._count_rows(uri) for uri in source_uris)
+        with self.lock:
+            self.loads.append({"uris": source_uris, "table_id": destination, "rows": rows})
+        return _Job()
+
+    def loaded_rows(self):
+        """Returns the number of rows loaded so far."""
+        with self.lock:
+            return sum(load["rows"] for load in self.loads)
@@ -0,0 +1,95 @@
+# Run the executor fetch path and the orchestrator dispatcher against the fault profiles of the fake FASS API
+#
+# Usage (from the repository root):
+#     python -m benchmarks.run_fault_scenarios --profiles none flaky bursty throttled truncated --calls 40
+
+import argparse
+import datetime
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.fake_api_server import run_fake_api
+from executor_func.utils import retry as executor_retry
+from executor_func.utils.configs import config as executor_config
+from executor_func.utils.read import get_session, get_with_url
+from orchestrator_func.utils import read as orchestrator_read
+from orchestrator_func.utils.read import run_execution
+
+
+def _fetch_scenario(reporting_url, profile, calls, concurrency):
+    # every call asks for another day, so the fake API cache does not hide the faults
+    session = get_session()
+    first_day = datetime.date(2025, 1, 1)
+
+    def _call(i):
+        day = first_day + datetime.timedelta(days=i)
+        url = (
+            f"{reporting_url}?start_date={day}&end_date={day}&platform=ios&profile={profile}"
+        )
+        start = time.perf_counter()
+        rows = get_with_url(url, session)
+        return len(rows) > 0, time.perf_counter() - start
+
+    executor_retry._breakers.clear()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(_call, range(calls)))
+    wall_seconds = time.perf_counter() - start
+    latencies = sorted(seconds for _, seconds in outcomes)
+    return {
+        "ok": sum(ok for ok, _ in outcomes),
+        "calls": calls,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(0.95 * (len(latencies) - 1))],
+        "wall": wall_seconds,
+    }
+
+
+def _dispatch_scenario(reporting_url, profile, calls, rate_per_second):
+    executor_url = reporting_url.replace("/reporting", f"/dispatch?profile={profile}")
+    # a local token stands in for the Google-signed ID token of the executor audience
+    orchestrator_read._id_tokens[executor_url] = ("local-token", time.time() + 3600)
+    first_day = datetime.date(2025, 1, 1)
+    urls = [
+        f"{reporting_url}?start_date={first_day + datetime.timedelta(days=i)}"
+        f"&end_date={first_day + datetime.timedelta(days=i)}"
+        for i in range(calls)
+    ]
+    start = time.perf_counter()
+    dispatch = run_execution(
+        executor_url, urls, "2025-06-01 00:00:00", "backfill", rate_per_second=rate_per_second
+    )
+    return {
+        "accepted": len(dispatch["accepted"]),
+        "calls": calls,
+        "wall": time.perf_counter() - start,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--profiles", nargs="+", default=["none", "slow", "flaky", "bursty", "throttled", "truncated", "production"]
+    )
+    parser.add_argument("--calls", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--dispatch-rate", type=float, default=20.0)
+    parser.add_argument("--retry-base-seconds", type=float, default=0.1)
+    opts = parser.parse_args()
+
+    # shorter backoffs than production, so a scenario finishes in seconds
+    executor_config["retry_base_seconds"] = opts.retry_base_seconds
+    executor_config["retry_max_backoff_seconds"] = 2
+    with run_fake_api() as reporting_url:
+        for profile in opts.profiles:
+            fetch = _fetch_scenario(reporting_url, profile, opts.calls, opts.concurrency)
+            dispatch = _dispatch_scenario(reporting_url, profile, opts.calls, opts.dispatch_rate)
+            print(
+                f"{profile:>10}: fetch {fetch['ok']}/{fetch['calls']} ok, "
+                f"p50 {fetch['p50']:.2f}s, p95 {fetch['p95']:.2f}s, wall {fetch['wall']:.1f}s | "
+                f"dispatch {dispatch['accepted']}/{dispatch['calls']} accepted, wall {dispatch['wall']:.1f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
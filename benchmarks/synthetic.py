@@ -0,0 +1,47 @@
+# Synthetic FASS API payloads for benchmarks that do not need the HTTP server
+
+import random
+from fake_adjust_api.main import AD_NETWORKS
+
+
+def make_rows(num_rows, start_date="2025-05-01", platform="ios", seed=0):
+    """
+    Generates rows shaped like the /reporting response of the fake FASS API.
+
+    Args:
+        num_rows (int): The number of rows to generate.
+        start_date (str): The report day, in YYYY-MM-DD format.
+        platform (str): The platform of the rows.
+        seed (int): The random seed.
+
+    Returns:
+        list: A list of row dicts.
+    """
+    rng = random.Random(seed)
+    campaigns = [f"campaign {i}" for i in range(200)]
+    creatives = [f"creative {i}" for i in range(1000)]
+    rows = []
+    for _ in range(num_rows):
+        installs = rng.randint(1000, 10000)
+        clicks = rng.randint(100, 1000)
+        impressions = rng.randint(100, 1000)
+        rows.append(
+            {
+                "installs": installs,
+                "ad_spend": rng.uniform(0.01, 1000.00),
+                "clicks": clicks,
+                "impressions": impressions,
+                "click_convertion_rate": installs / clicks * 100,
+                "click_through_rate": clicks / impressions * 100,
+                "impressions_convertion_rate": installs / impressions * 100,
+                "limit_ad_tracking_installs": rng.randint(10, 100),
+                "uninstalls": rng.randint(1000, 10000),
+                "campaign_name": rng.choice(campaigns),
+                "creative_name": rng.choice(creatives),
+                "ad_network_name": rng.choice(AD_NETWORKS),
+                "start_date": start_date,
+                "end_date": start_date,
+                "platform": platform,
+            }
+        )
+    return rows
@@ -1,86 +1,231 @@
 import functions_framework
-from utils.write import (
-    write_log,
-    write_raw_to_bq,
-    update_day_table,
-)
+from utils.logger import logger
+from utils.write import update_day_table
+import contextlib
 import os
-import pandas as pd
+import requests
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.configs import config
 from utils.read import (
-    get_with_url,
+    fetch_platforms,
+    iter_record_batches,
     clean_raw_data,
     get_bq_dataset,
     get_bq_tables,
+    get_bq_fingerprint_table,
     get_temp_prefix,
+    get_report_days,
+    split_by_day,
     get_all_temp_files,
-    get_temp_df,
 )
+from utils.completion import CompletionTracker, GCSStore, get_run_prefix
+from utils.staging import get_staging_format
+from utils.load import get_raw_writer
+from utils.retry import CircuitOpenError
+from utils.fingerprint import FingerprintStore, compute_fingerprint
+from utils.tracing import log_run_summary, span, tracer
 
 GCS_BUCKET = os.environ.get("GCS_BUCKET", "GCS_BUCKET not set")
+# Marker staged in place of partitions whose data has not changed since the last load
+UNCHANGED = "UNCHANGED"
 
 
 # Register an HTTP function with the Functions Framework
 @functions_framework.http
 def call_api(request):
+    started_at = time.monotonic()
     args = request.get_json(silent=True)
-    print(write_log(f"Start function on {args['start_date']}", f"Args: {args}"))
-    if args:
-        function_name = os.environ.get("K_SERVICE", "")
-        dataset_name = get_bq_dataset(function_name)
-        table_raw_id, table_day_id = get_bq_tables(dataset_name)
-        for platform in ["ios", "android"]:
-            final_url = f"{args['url']}&platform={platform}"
-            print(
-                write_log(
-                    f"Fetching data for {platform} on {args['start_date']}",
-                    f"url: {final_url}",
+    logger.reset()
+    logger.info(
+        f"Start function on {args['start_date']}",
+        {
+            "scheduler_id": args.get("scheduler_id"),
+            "platforms": len(args.get("platforms", config["platforms"])),
+            "batch_load": args.get("batch_load"),
+        },
+    )
+    logger.debug("Request payload", args)
+    tracer.reset()
+    try:
+        with span("call_api"):
+            if args:
+                function_name = os.environ.get("K_SERVICE", "")
+                dataset_name = get_bq_dataset(function_name)
+                table_raw_id, table_day_id = get_bq_tables(dataset_name)
+                fingerprint_store = FingerprintStore(get_bq_fingerprint_table(dataset_name))
+                # staged files and markers are namespaced by run, so concurrent schedules never collide.
+                # Backfills pass their own prefix for each window
+                run_prefix = args.get("run_prefix") or get_run_prefix(args["scheduler_id"], args["datetime_now"])
+                tracker = CompletionTracker(GCSStore(GCS_BUCKET), f"{run_prefix}/_manifest")
+                try:
+                    _stage(args, run_prefix, tracker, fingerprint_store)
+                    if args["batch_load"]:
+                        if _batch_load(args, tracker, table_raw_id, table_day_id, fingerprint_store, started_at):
+                            tracker.mark_loaded()
+                finally:
+                    if args["batch_load"]:
+                        # release the orchestrator waiting to clean the staged data, even if
+                        # fetching or staging failed, instead of leaving it to its deadline
+                        tracker.mark_finished()
+            else:
+                logger.error("No args found", args)
+        log_run_summary()
+        logger.info(f"End function on {args['start_date']}")
+    finally:
+        # entries are buffered, so write them out before the instance is frozen
+        logger.flush()
+    return "Done"
+
+
+def _stage(args, run_prefix, tracker, fingerprint_store):
+    platforms = args.get("platforms", config["platforms"])
+    report_days = get_report_days(args["start_date"], args.get("end_date"))
+    logger.info(
+        f"Fetching data for {', '.join(platforms)} from {report_days[0]} to {report_days[-1]}",
+        {"url": args["url"]},
+    )
+    if args.get("stream", config["stream_responses"]):
+        with ThreadPoolExecutor(max_workers=config["fetch_max_workers"]) as pool:
+            list(
+                pool.map(
+                    lambda platform: _stage_stream(args, run_prefix, platform, report_days, tracker),
+                    platforms,
                 )
             )
-            results = get_with_url(final_url, args["adjust_api_key"])
-            if len(results) == 0:
-                print(
-                    write_log(
-                        "No data found",
-                        f"{args['start_date']} on {platform}",
-                        severity="WARNING",
-                    )
-                )
-                # If a data file is missing, place a dummy one in GCS as warning
-                df_empty = pd.DataFrame([{"id": "empty"}])
-                empty_prefix = f"gs://{GCS_BUCKET}/temp_data/{args['start_date']}/{platform}/NO_DATA.csv"
-                df_empty.to_csv(empty_prefix, index=False)
-                continue
-            df_raw = clean_raw_data(results, args["datetime_now"])
-            print(write_log("Retrieved and cleaned data", f"DF shape: {df_raw.shape}"))
-            print(write_log("Writing data to GCS"))
-            temp_prefix = get_temp_prefix(GCS_BUCKET, args["start_date"], platform)
-            print(write_log(f"Writing {temp_prefix}"))
-            df_raw.to_csv(f"gs://{temp_prefix}", index=False)
-        if args["batch_load"]:
-            print(write_log("Batch load GCS data to BigQuery"))
-            all_files = get_all_temp_files(GCS_BUCKET, args["scheduler_id"])
-            if len(all_files) == 0:
-                print(write_log("No data found in temp folder", "", severity="WARNING"))
-                raise Exception("No data found in temp folder")
-            # Sometimes Adjust fails and we get no data files. Stop processing if this happens
-            empty_files = [f for f in all_files if "NO_DATA" in f]
-            if len(empty_files) > 0:
-                print(
-                    write_log(
-                        "Missing file from Adjust. Clean temp data from GCS",
-                        "/n".join(empty_files),
-                        severity="WARNING",
-                    )
-                )
-                
-                print(write_log(f"End function on {args['start_date']}"))
-                return "Done"
-            temp_raw_df = get_temp_df(all_files)
-            write_raw_to_bq(temp_raw_df, table_raw_id)
-            print(write_log("Update day table on BigQuery"))
-            update_day_table(all_files, args["datetime_now"], table_day_id)
-            
     else:
-        print(write_log("No args found", f"Args: {args}", severity="ERROR"))
-    print(write_log(f"End function on {args['start_date']}"))
-    return "Done"
+        with span("fetch", platforms=len(platforms)) as trace:
+            results_by_platform = fetch_platforms(args["url"], platforms)
+            trace.set(rows=sum(len(results) for results in results_by_platform.values()))
+        rows_by_platform = {
+            platform: split_by_day(results, report_days)
+            for platform, results in results_by_platform.items()
+        }
+        stored_fingerprints = None
+        if args.get("incremental", config["incremental_fetch"]):
+            stored_fingerprints = fingerprint_store.get(report_days[0], report_days[-1])
+        for report_day in report_days:
+            _stage_day(
+                args,
+                run_prefix,
+                report_day,
+                {platform: rows_by_platform[platform][report_day] for platform in platforms},
+                None if stored_fingerprints is None else stored_fingerprints.get(report_day, {}),
+                tracker,
+            )
+
+
+def _stage_day(args, run_prefix, report_day, results_by_platform, stored_fingerprints, tracker):
+    fingerprints = {
+        platform: compute_fingerprint(results)
+        for platform, results in results_by_platform.items()
+        if len(results) > 0
+    }
+    unchanged = (
+        stored_fingerprints is not None
+        and len(fingerprints) == len(results_by_platform)
+        and stored_fingerprints == fingerprints
+    )
+    if unchanged:
+        # the day is only skipped when every platform is unchanged, to keep per-day reloads
+        logger.info(f"Data unchanged on {report_day}. Skipping staging")
+        for platform in results_by_platform:
+            tracker.mark_staged(f"{run_prefix}/{report_day}/{platform}/{UNCHANGED}")
+        return
+    for platform, results in results_by_platform.items():
+        if len(results) == 0:
+            _stage_no_data(run_prefix, report_day, platform, tracker)
+            continue
+        with span("clean_raw_data", rows=len(results)):
+            df_raw = clean_raw_data(results, args["datetime_now"], compact=args.get("compact_dtypes"))
+        logger.info("Retrieved and cleaned data", {"report_day": report_day, "shape": df_raw.shape})
+        temp_prefix = get_temp_prefix(GCS_BUCKET, report_day, platform, run_prefix=run_prefix)
+        logger.info(f"Writing {temp_prefix}", rate_key="Writing staged file")
+        with span("stage", rows=len(df_raw)):
+            get_staging_format().write(df_raw, f"gs://{temp_prefix}")
+        tracker.record_fingerprint(report_day, platform, fingerprints[platform])
+        tracker.mark_staged(temp_prefix.split("/", 1)[1])
+
+
+def _stage_no_data(run_prefix, report_day, platform, tracker):
+    logger.warning("No data found", f"{report_day} on {platform}")
+    import pandas as pd
+
+    # If a data file is missing, place a dummy one in GCS as warning
+    df_empty = pd.DataFrame([{"id": "empty"}])
+    empty_path = f"{run_prefix}/{report_day}/{platform}/NO_DATA.csv"
+    df_empty.to_csv(f"gs://{GCS_BUCKET}/{empty_path}", index=False)
+    tracker.mark_staged(empty_path)
+
+
+def _stage_stream(args, run_prefix, platform, report_days, tracker):
+    # parse, clean and stage the response batch by batch to keep memory bounded,
+    # appending every batch to the staged file of its report day
+    url = f"{args['url']}&platform={platform}"
+    staging_format = get_staging_format()
+    temp_prefixes = {
+        report_day: get_temp_prefix(GCS_BUCKET, report_day, platform, run_prefix=run_prefix)
+        for report_day in report_days
+    }
+    logger.info(f"Streaming {url} to {len(temp_prefixes)} staged files")
+    failed = False
+    with span("stream", platform=platform) as trace:
+        try:
+            with contextlib.ExitStack() as stack:
+                writers = {
+                    report_day: stack.enter_context(staging_format.open_writer(f"gs://{temp_prefix}"))
+                    for report_day, temp_prefix in temp_prefixes.items()
+                }
+                for batch in iter_record_batches(url):
+                    df_batch = clean_raw_data(batch, args["datetime_now"], compact=args.get("compact_dtypes"))
+                    for report_day, df_day in df_batch.groupby("startDate", sort=False, observed=True):
+                        if report_day in writers:
+                            writers[report_day].write(df_day)
+        except (requests.exceptions.RequestException, CircuitOpenError) as req_err:
+            logger.warning(f"Request exception occurred: {req_err}")
+            failed = True
+            trace.set(failed_calls=1)
+        trace.set(rows=sum(writer.num_rows for writer in writers.values()))
+    for report_day, temp_prefix in temp_prefixes.items():
+        if failed:
+            # drop what was written before the stream broke
+            writers[report_day].discard()
+        if failed or writers[report_day].num_rows == 0:
+            _stage_no_data(run_prefix, report_day, platform, tracker)
+            continue
+        logger.info("Retrieved and cleaned data", {"report_day": report_day, "rows": writers[report_day].num_rows})
+        tracker.mark_staged(temp_prefix.split("/", 1)[1])
+
+
+# Returns False if the run was not loaded because Adjust returned no data for some partitions
+def _batch_load(args, tracker, table_raw_id, table_day_id, fingerprint_store, started_at):
+    logger.info("Batch load GCS data to BigQuery")
+    with span("wait_staged") as trace:
+        all_files = get_all_temp_files(GCS_BUCKET, args["scheduler_id"], tracker, started_at)
+        trace.set(files=len(all_files))
+    if len(all_files) == 0:
+        logger.warning("No data found in temp folder")
+        raise Exception("No data found in temp folder")
+    # Sometimes Adjust fails and we get no data files. Stop processing if this happens
+    empty_files = [f for f in all_files if "NO_DATA" in f]
+    if len(empty_files) > 0:
+        logger.warning("Missing file from Adjust. Clean temp data from GCS", empty_files)
+        return False
+    unchanged_files = [f for f in all_files if f.endswith(f"/{UNCHANGED}")]
+    all_files = [f for f in all_files if not f.endswith(f"/{UNCHANGED}")]
+    logger.info(
+        f"Skipped {len(unchanged_files)} unchanged partitions",
+        {"skipped_partitions": len(unchanged_files), "loaded_partitions": len(all_files)},
+    )
+    if len(all_files) == 0:
+        return True
+    raw_writer = get_raw_writer(args.get("raw_writer"))
+    logger.info(f"Load staged data to {table_raw_id}", {"mode": raw_writer.mode})
+    with span("load_raw", files=len(all_files)):
+        raw_writer.write(all_files, table_raw_id)
+    logger.info("Update day table on BigQuery")
+    update_day_table(all_files, args["datetime_now"], table_day_id)
+    # commit fingerprints only once their partitions are loaded
+    with span("upsert_fingerprints"):
+        fingerprint_store.upsert(tracker.fingerprints(), args["datetime_now"])
+    return True
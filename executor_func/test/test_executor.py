@@ -1,21 +1,140 @@
 import unittest
 import datetime
+import http.server
+import importlib
+import io
+import json
+import os
+import pkgutil
+import re
+import requests
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 from unittest.mock import patch, Mock, MagicMock
 import pandas as pd
 from executor_func.utils.read import (
     get_with_url,
+    fetch_platforms,
+    iter_record_batches,
     clean_raw_data,
     get_bq_dataset,
     get_bq_tables,
+    get_bq_fingerprint_table,
     get_temp_prefix,
+    get_report_days,
+    split_by_day,
     get_all_temp_files,
+    get_completion_deadline_seconds,
+    get_temp_df,
+    iter_temp_df_chunks,
 )
+from executor_func.utils.completion import (
+    CompletionTracker,
+    LocalStore,
+    MemoryStore,
+    get_run_prefix,
+)
+from executor_func.utils.fingerprint import (
+    FingerprintStore,
+    compute_fingerprint,
+)
+from executor_func.utils.backfill import load_backfill, run_backfill
+from executor_func.utils.load import (
+    get_raw_schema,
+    get_raw_writer,
+)
+from executor_func.utils.clients import set_client_factory
+from executor_func.utils.configs import config
+from executor_func.utils.schema import RawSchema
+from executor_func.utils.retry import (
+    CircuitBreaker,
+    RetryPolicy,
+    get_circuit_breaker,
+    get_with_retries,
+)
+from executor_func.utils.staging import (
+    get_staging_format,
+    get_staging_format_for,
+)
+from executor_func.utils.logger import MAX_RATE_WINDOWS, Logger, logger
+from executor_func.utils.tracing import log_run_summary, span, tracer
 from executor_func.utils.write import (
     write_raw_to_bq,
     update_day_table,
 )
 
 
+FUNCTION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Cold-start budget of `import main`, overridable on slow machines
+IMPORT_TIME_BUDGET_SECONDS = float(os.environ.get("IMPORT_TIME_BUDGET_SECONDS", "1.0"))
+# Dependencies that must only load on the code path that needs them
+DEFERRED_MODULES = ["pandas", "pyarrow", "google.cloud.bigquery", "pandas_gbq", "gcsfs", "ijson"]
+
+
+def _load_main():
+    """Imports the executor main module, resolving its `utils` imports to executor_func.utils"""
+    package = importlib.import_module("executor_func.utils")
+    aliases = {"utils": package}
+    for module in pkgutil.iter_modules(package.__path__):
+        aliases[f"utils.{module.name}"] = importlib.import_module(f"executor_func.utils.{module.name}")
+    saved = {name: sys.modules.pop(name) for name in list(sys.modules) if name.split(".")[0] == "utils"}
+    sys.modules.update(aliases)
+    try:
+        spec = importlib.util.spec_from_file_location("executor_func.main", os.path.join(FUNCTION_DIR, "main.py"))
+        main = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(main)
+    finally:
+        for name in aliases:
+            sys.modules.pop(name, None)
+        sys.modules.update(saved)
+    return main
+
+
+def _local_gcs(root):
+    """Serves the gs:// paths opened through fsspec, pandas included, from a local directory"""
+    from fsspec.implementations.local import LocalFileSystem
+
+    class LocalGcsFileSystem(LocalFileSystem):
+        def __init__(self, *args, **kwargs):
+            kwargs["auto_mkdir"] = True
+            super().__init__(*args, **kwargs)
+
+        @classmethod
+        def _strip_protocol(cls, path):
+            path = str(path)
+            if path.startswith("gs://"):
+                path = os.path.join(root, path[len("gs://"):])
+            return super()._strip_protocol(path)
+
+    # fsspec exposes a read-only view of its registry as fsspec.registry
+    return patch.dict(importlib.import_module("fsspec.registry")._registry, {"gs": LocalGcsFileSystem})
+
+
+def _fass_row(report_day, platform="ios", installs=1):
+    """Returns a FASS API row of a day"""
+    return {
+        "installs": installs,
+        "limit_ad_tracking_installs": 1,
+        "clicks": 1,
+        "impressions": 1,
+        "ad_spend": 0.1,
+        "ad_network_name": "facebook",
+        "campaign_name": "campaign1",
+        "country_code": "it",
+        "platform": platform,
+        "creative_name": "creative1",
+        "uninstalls": 1,
+        "click_convertion_rate": 1.0,
+        "click_through_rate": 1.0,
+        "impressions_convertion_rate": 1.0,
+        "start_date": report_day,
+        "end_date": report_day,
+    }
+
+
 class ExecutorTestCase(unittest.TestCase):
     """Test suite for executor function"""
 
@@ -50,13 +169,34 @@ class ExecutorTestCase(unittest.TestCase):
             mock_resp.json = Mock(return_value=json_data)
         return mock_resp
 
-    @patch("requests.get")
+    def test_import_time_budget(self):
+        """Test importing main stays within budget and defers heavy dependencies"""
+        completed = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, time; start = time.perf_counter(); import main; "
+                "print(time.perf_counter() - start); print(' '.join(sys.modules))",
+            ],
+            cwd=FUNCTION_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        import_seconds, modules = completed.stdout.splitlines()[-2:]
+        self.assertLess(float(import_seconds), IMPORT_TIME_BUDGET_SECONDS)
+        self.assertEqual(
+            [module for module in DEFERRED_MODULES if module in modules.split()], []
+        )
+
+    @patch("requests.Session.get")
     def test_get_with_url(self, mock_get):
         """Test get_with_url function"""
         url = "https://example.com/api/data"
         mock_response = Mock()
         mock_response.status_code = 200
         mock_response.json.return_value = [{"key": "value"}]
+        mock_response.content = b'[{"key": "value"}]'
         mock_get.return_value = mock_response
 
         # Test the function
@@ -64,7 +204,180 @@ class ExecutorTestCase(unittest.TestCase):
 
         # Assert the result
         self.assertEqual(result, [{"key": "value"}])
-        mock_get.assert_called_once_with(url, timeout=900) 
+        mock_get.assert_called_once_with(url, timeout=(10, 120))
+
+    def test_fetch_platforms(self):
+        """Test fetch_platforms function"""
+        url = "https://example.com/api/data?start_date=2024-01-01&end_date=2024-01-01"
+        mock_session = Mock()
+
+        def _get(final_url, timeout):
+            response = Mock()
+            response.json.return_value = [{"platform": final_url.split("platform=")[1]}]
+            response.content = json.dumps(response.json.return_value).encode()
+            return response
+
+        mock_session.get.side_effect = _get
+        res = fetch_platforms(url, ["ios", "android", "windows"], session=mock_session)
+        self.assertEqual(
+            res,
+            {
+                "ios": [{"platform": "ios"}],
+                "android": [{"platform": "android"}],
+                "windows": [{"platform": "windows"}],
+            },
+        )
+        self.assertEqual(mock_session.get.call_count, 3)
+        self.assertEqual(fetch_platforms(url, [], session=mock_session), {})
+
+    @patch.dict("executor_func.utils.retry.config", {"retry_base_seconds": 0.01})
+    def test_get_with_url_retries(self):
+        """Test get_with_url retries 429/5xx from a faulty API and honors Retry-After"""
+        rows = [{"installs": 1}]
+        with _FaultyFassApi(
+            [(503, {"Retry-After": "0"}, "busy"), (429, {"Retry-After": "0"}, "slow down"), (200, {}, rows)]
+        ) as api:
+            self.assertEqual(get_with_url(api.url), rows)
+            self.assertEqual(api.requests, 3)
+        with _FaultyFassApi([(500, {}, "boom")] * 4 + [(200, {}, rows)]) as api:
+            self.assertEqual(get_with_url(api.url), [])
+            self.assertEqual(api.requests, 4)
+        with _FaultyFassApi([(404, {}, "not found"), (200, {}, rows)]) as api:
+            self.assertEqual(get_with_url(api.url), [])
+            self.assertEqual(api.requests, 1)
+
+    @patch.dict(
+        "executor_func.utils.retry.config",
+        {"retry_base_seconds": 0.01, "circuit_failure_threshold": 3, "circuit_reset_seconds": 60},
+    )
+    def test_get_with_url_circuit_breaker(self):
+        """Test get_with_url fails fast once the circuit of a degraded API is open"""
+        with _FaultyFassApi([(502, {}, "bad gateway")] * 10) as api:
+            self.assertEqual(get_with_url(api.url), [])
+            self.assertEqual(api.requests, 3)
+            self.assertEqual(get_circuit_breaker(api.url).state, "open")
+            self.assertEqual(get_with_url(api.url), [])
+            self.assertEqual(api.requests, 3)
+
+    def test_circuit_breaker_half_open(self):
+        """Test CircuitBreaker lets one trial call through after the reset time"""
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=2, reset_seconds=10, clock=lambda: now[0])
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        now[0] = 10.0
+        self.assertEqual(breaker.state, "half_open")
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        now[0] = 20.0
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+    def test_circuit_breaker_unexpected_error(self):
+        """Test an unexpected error of a half-open trial call reopens the circuit instead of wedging it"""
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10, clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 10.0
+        mock_session = Mock()
+        mock_session.get.side_effect = requests.exceptions.ChunkedEncodingError("cut off")
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            get_with_retries(mock_session, "https://example.com/api/data", breaker=breaker)
+        self.assertFalse(breaker.trial_running)
+        self.assertEqual(breaker.state, "open")
+        now[0] = 20.0
+        self.assertTrue(breaker.allow())
+
+    def test_get_with_retries_budget(self):
+        """Test get_with_retries starts no retry past the retry budget"""
+        now = [0.0]
+
+        def _get(url, **kwargs):
+            now[0] += 40
+            raise requests.exceptions.Timeout("read timed out")
+
+        mock_session = Mock()
+        mock_session.get.side_effect = _get
+        policy = RetryPolicy(
+            attempts=10, base_seconds=1, budget_seconds=100, sleep=lambda seconds: None, clock=lambda: now[0]
+        )
+        breaker = CircuitBreaker(failure_threshold=100, reset_seconds=10)
+        with self.assertRaises(requests.exceptions.Timeout):
+            get_with_retries(mock_session, "https://example.com/api/data", policy, breaker)
+        self.assertEqual(mock_session.get.call_count, 3)
+
+    def test_retry_policy_backoff(self):
+        """Test RetryPolicy backoff caps jitter and Retry-After"""
+        policy = RetryPolicy(attempts=3, base_seconds=1, max_backoff_seconds=5)
+        for attempt in range(6):
+            self.assertLessEqual(policy.backoff(attempt), min(5, 2 ** attempt))
+        response = Mock()
+        response.headers = {"Retry-After": "3"}
+        self.assertEqual(policy.backoff(0, response), 3)
+        response.headers = {"Retry-After": "120"}
+        self.assertEqual(policy.backoff(0, response), 5)
+        response.headers = {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}
+        self.assertEqual(policy.backoff(0, response), 0)
+
+    def test_iter_record_batches(self):
+        """Test iter_record_batches parses the response incrementally into fixed-size batches"""
+        rows = [{"installs": i, "ad_spend": i / 10, "platform": "ios"} for i in range(7)]
+        mock_response = MagicMock()
+        mock_response.raw = io.BytesIO(json.dumps(rows).encode())
+        mock_response.__enter__.return_value = mock_response
+        mock_session = Mock()
+        mock_session.get.return_value = mock_response
+
+        batches = list(iter_record_batches("https://example.com/api/data", 3, mock_session))
+        self.assertEqual([len(batch) for batch in batches], [3, 3, 1])
+        self.assertEqual([row for batch in batches for row in batch], rows)
+        self.assertIsInstance(batches[0][1]["ad_spend"], float)
+        mock_session.get.assert_called_once_with(
+            "https://example.com/api/data", timeout=(10, 120), stream=True
+        )
+
+    def test_iter_record_batches_truncated(self):
+        """Test iter_record_batches raises a RequestException for a body cut off mid-stream"""
+        body = json.dumps([_fass_row("2024-01-01", installs=i) for i in range(50)])
+        with _FaultyFassApi([(200, {"Content-Length": str(len(body))}, body[: len(body) // 2])]) as api:
+            with self.assertRaises(requests.exceptions.RequestException):
+                list(iter_record_batches(api.url, 10))
+        with _FaultyFassApi([(200, {}, body[: len(body) // 2])]) as api:
+            with self.assertRaises(requests.exceptions.RequestException):
+                list(iter_record_batches(api.url, 10))
+
+    def test_stage_stream_truncated(self):
+        """Test a response cut off mid-stream is staged as NO_DATA and its partial file discarded"""
+        main = _load_main()
+        tracker = CompletionTracker(MemoryStore(), "temp_data/2h/run/_manifest")
+        body = json.dumps([_fass_row("2024-01-01", installs=i) for i in range(5000)])
+        args = {"datetime_now": self.today_datetime, "stream": True}
+        with tempfile.TemporaryDirectory() as root, _local_gcs(root), patch.object(
+            main, "GCS_BUCKET", "test-bucket"
+        ), patch.object(logger, "stream", io.StringIO()), patch.dict(config, {"stream_batch_rows": 100}):
+            with _FaultyFassApi([(200, {"Content-Length": str(len(body))}, body[: len(body) // 2])]) as api:
+                main._stage_stream({**args, "url": api.url}, "temp_data/2h/run", "ios", ["2024-01-01"], tracker)
+            self.assertEqual(tracker.staged(), ["temp_data/2h/run/2024-01-01/ios/NO_DATA.csv"])
+            self.assertFalse(
+                os.path.exists(f"{root}/test-bucket/temp_data/2h/run/ios/fass_data_2024_01_01.parquet")
+            )
+            self.assertTrue(os.path.exists(f"{root}/test-bucket/temp_data/2h/run/2024-01-01/ios/NO_DATA.csv"))
+
+    def test_report_days(self):
+        "Test get_report_days and split_by_day functions"
+        self.assertEqual(get_report_days("2024-01-01"), ["2024-01-01"])
+        report_days = get_report_days("2024-02-28", "2024-03-01")
+        self.assertEqual(report_days, ["2024-02-28", "2024-02-29", "2024-03-01"])
+        rows = [{"start_date": "2024-03-01", "id": 1}, {"start_date": "2024-02-28", "id": 2}]
+        self.assertEqual(
+            split_by_day(rows, report_days),
+            {"2024-02-28": [rows[1]], "2024-02-29": [], "2024-03-01": [rows[0]]},
+        )
 
     def test_clean_raw_data(self):
         "Test clean_raw_data function"
@@ -154,6 +467,19 @@ class ExecutorTestCase(unittest.TestCase):
         pd.testing.assert_frame_equal(result, expected_result)
 
 
+    def test_raw_schema(self):
+        """Test the precompiled raw schema casts string metrics and drops unknown fields"""
+        schema = RawSchema(config)
+        self.assertEqual(schema.names[:3], ["adNetworkName", "campaignName", "creativeName"])
+        self.assertEqual(schema.names[-1], "createdAt")
+        row = {col: "1" for col in config["ordered_columns"]}
+        row["country_code"] = "it"
+        res = schema.build_frame([row], self.today_datetime)
+        self.assertEqual(list(res.columns), schema.names)
+        self.assertEqual(res["installs"].dtype, "int64")
+        self.assertEqual(res["adSpend"].dtype, "float64")
+        self.assertEqual(res["installs"].iloc[0], 1)
+
     def test_get_bq_dataset(self):
         """Test get_bq_dataset function"""
         function_name = "my-cloud-function-dev"
@@ -181,6 +507,10 @@ class ExecutorTestCase(unittest.TestCase):
         res_raw, res_day = get_bq_tables(dataset_name)
         self.assertEqual(res_raw, expected_raw_id)
         self.assertEqual(res_day, expected_day_id)
+        self.assertEqual(
+            get_bq_fingerprint_table(dataset_name),
+            f"{project_id}.{dataset_name}.fass_fingerprint",
+        )
 
     def test_get_temp_prefix(self):
         """Test get_temp_prefix function"""
@@ -188,89 +518,198 @@ class ExecutorTestCase(unittest.TestCase):
         start_date = "2024-01-01"
         platform = "android"
         expected = "eighth-duality-457819-r4/temp_data/android/fass_data_2024_01_01.csv"
+        res = get_temp_prefix(bucket_name, start_date, platform, "csv")
+        self.assertEqual(res, expected)
+        expected = "eighth-duality-457819-r4/temp_data/android/fass_data_2024_01_01.parquet"
         res = get_temp_prefix(bucket_name, start_date, platform)
         self.assertEqual(res, expected)
+        self.assertRaises(ValueError, get_temp_prefix, bucket_name, start_date, platform, "xml")
+        run_prefix = get_run_prefix("2h", "2024-01-02 10:00:00")
+        expected = "eighth-duality-457819-r4/temp_data/2h/20240102T100000/android/fass_data_2024_01_01.parquet"
+        res = get_temp_prefix(bucket_name, start_date, platform, run_prefix=run_prefix)
+        self.assertEqual(res, expected)
 
-    @patch("google.cloud.storage.Client")
-    def test_get_all_temp_files(self, mock_obj):
-        """Test get_all_temp_files function"""
+    def test_staging_write_batches(self):
+        """Test staging formats write several batches to a single file"""
+        dfs = [
+            pd.DataFrame({"installs": [i, i + 1], "createdAt": pd.to_datetime(self.today_datetime)})
+            for i in range(0, 6, 2)
+        ]
+        with tempfile.TemporaryDirectory() as root:
+            for name in ["csv", "parquet"]:
+                path = f"{root}/fass_data_2024_01_01.{name}"
+                staging_format = get_staging_format(name)
+                self.assertEqual(staging_format.write_batches(iter(dfs), path), 6)
+                res = staging_format.read(path)
+                self.assertEqual(list(res["installs"]), list(range(6)))
+                empty_path = f"{root}/fass_data_2024_01_02.{name}"
+                self.assertEqual(staging_format.write_batches(iter([]), empty_path), 0)
+                self.assertFalse(os.path.exists(empty_path))
 
-        def _create_mock_blob(prefix_name):
-            """Helper function to create a mock blob"""
-            mock_blob = Mock()
-            mock_blob.name = prefix_name
-            return mock_blob
+    def test_clean_raw_data_compact(self):
+        """Test compact frames hold the same data with categoricals and int32 counts, through staging"""
+        data = [
+            {
+                "installs": i,
+                "limit_ad_tracking_installs": 1,
+                "clicks": 2,
+                "impressions": 3,
+                "ad_spend": 0.5,
+                "ad_network_name": "facebook",
+                "campaign_name": f"campaign {i}",
+                "creative_name": "creative",
+                "platform": "ios",
+                "start_date": "2024-01-01",
+                "end_date": "2024-01-01",
+                "uninstalls": 0,
+                "click_convertion_rate": 0.1,
+                "click_through_rate": 0.2,
+                "impressions_convertion_rate": 0.3,
+            }
+            for i in range(300)
+        ]
+        df = clean_raw_data(data, self.today_datetime)
+        compact = clean_raw_data(data, self.today_datetime, compact=True)
+        self.assertEqual(compact["installs"].dtype, "int32")
+        self.assertEqual(compact["campaignName"].dtype, "category")
+        self.assertEqual(compact["adSpend"].dtype, "float64")
+        self.assertLess(compact.memory_usage(deep=True).sum(), df.memory_usage(deep=True).sum())
+        pd.testing.assert_frame_equal(compact.astype(df.dtypes.to_dict()), df)
+        # counts out of the int32 range keep int64
+        for installs in [2**40, 2**31, -(2**31) - 1]:
+            data[0]["installs"] = installs
+            res = clean_raw_data(data, self.today_datetime, compact=True)
+            self.assertEqual(res["installs"].dtype, "int64")
+            self.assertEqual(res["installs"].iloc[0], installs)
+        data[0]["installs"] = 0
+        # batches with 1 and 299 categories share one staged file
+        with tempfile.TemporaryDirectory() as root:
+            path = f"{root}/fass_data_2024_01_01.parquet"
+            staging_format = get_staging_format("parquet")
+            self.assertEqual(staging_format.write_batches([compact[:1], compact[1:]], path), 300)
+            res = staging_format.read(path)
+            self.assertEqual(list(res["campaignName"]), list(df["campaignName"]))
+            # counts are staged as int64, the type of the raw table
+            self.assertEqual(res["installs"].dtype, "int64")
+            # a later batch whose counts do not fit in int32 shares the file of int32 batches
+            data[299]["installs"] = 2**40
+            overflowing = clean_raw_data(data[150:], self.today_datetime, compact=True)
+            self.assertEqual(overflowing["installs"].dtype, "int64")
+            self.assertEqual(staging_format.write_batches([compact[:150], overflowing], path), 300)
+            res = staging_format.read(path)
+            self.assertEqual(list(res["installs"]), list(range(299)) + [2**40])
+            data[299]["installs"] = 299
+        with patch("pandas.read_parquet", side_effect=[compact[:150].copy(), compact[150:].copy()]):
+            res = get_temp_df(["bucket/a.parquet", "bucket/b.parquet"], max_workers=1)
+        self.assertEqual(res["campaignName"].dtype, "category")
+        self.assertEqual(list(res["campaignName"]), list(df["campaignName"]))
+
+    def test_staging_formats(self):
+        """Test staging formats round trip the cleaned data"""
+        df = pd.DataFrame(
+            [
+                {
+                    "startDate": "2024-01-01",
+                    "installs": 1,
+                    "adSpend": 0.1,
+                    "createdAt": pd.to_datetime(self.today_datetime),
+                }
+            ]
+        )
+        with tempfile.TemporaryDirectory() as root:
+            for name in ["csv", "parquet"]:
+                path = f"{root}/fass_data_2024_01_01.{name}"
+                get_staging_format(name).write(df, path)
+                res = get_staging_format_for(path).read(path)
+                self.assertEqual(res["installs"].dtype, "int64")
+                self.assertEqual(res["adSpend"].dtype, "float64")
+                self.assertEqual(res["createdAt"].iloc[0], df["createdAt"].iloc[0])
+            res = get_staging_format("parquet").read(f"{root}/fass_data_2024_01_01.parquet")
+            pd.testing.assert_frame_equal(res, df)
 
-        mock_gcs = mock_obj.return_value
+    def test_get_all_temp_files(self):
+        """Test get_all_temp_files function"""
         bucket_name = "eighth-duality-457819-r4"
         scheduler_id = "7d"
-        expected = [
-            "eighth-duality-457819-r4/temp_data/android/fass_data_2024_01_01.csv",
-            "eighth-duality-457819-r4/temp_data/android/fass_data_2024_01_02.csv",
-            "eighth-duality-457819-r4/temp_data/android/fass_data_2024_01_03.csv",
-            "eighth-duality-457819-r4/temp_data/android/fass_data_2024_01_04.csv",
-            "eighth-duality-457819-r4/temp_data/android/fass_data_2024_01_05.csv",
-            "eighth-duality-457819-r4/temp_data/android/fass_data_2024_01_06.csv",
-            "eighth-duality-457819-r4/temp_data/android/fass_data_2024_01_07.csv",
-            "eighth-duality-457819-r4/temp_data/android/fass_data_2024_01_08.csv",
-            "eighth-duality-457819-r4/temp_data/android/fass_data_2024_01_09.csv",
-            "eighth-duality-457819-r4/temp_data/android/fass_data_2024_01_10.csv",
-            "eighth-duality-457819-r4/temp_data/android/fass_data_2024_01_11.csv",
-            "eighth-duality-457819-r4/temp_data/android/fass_data_2024_01_12.csv",
-            "eighth-duality-457819-r4/temp_data/android/fass_data_2024_01_13.csv",
-            "eighth-duality-457819-r4/temp_data/android/fass_data_2024_01_14.csv",
-            "eighth-duality-457819-r4/temp_data/ios/fass_data_2024_01_01.csv",
-            "eighth-duality-457819-r4/temp_data/ios/fass_data_2024_01_02.csv",
-            "eighth-duality-457819-r4/temp_data/ios/fass_data_2024_01_03.csv",
-            "eighth-duality-457819-r4/temp_data/ios/fass_data_2024_01_04.csv",
-            "eighth-duality-457819-r4/temp_data/ios/fass_data_2024_01_05.csv",
-            "eighth-duality-457819-r4/temp_data/ios/fass_data_2024_01_06.csv",
-            "eighth-duality-457819-r4/temp_data/ios/fass_data_2024_01_07.csv",
-            "eighth-duality-457819-r4/temp_data/ios/fass_data_2024_01_08.csv",
-            "eighth-duality-457819-r4/temp_data/ios/fass_data_2024_01_09.csv",
-            "eighth-duality-457819-r4/temp_data/ios/fass_data_2024_01_10.csv",
-            "eighth-duality-457819-r4/temp_data/ios/fass_data_2024_01_11.csv",
-            "eighth-duality-457819-r4/temp_data/ios/fass_data_2024_01_12.csv",
-            "eighth-duality-457819-r4/temp_data/ios/fass_data_2024_01_13.csv",
-            "eighth-duality-457819-r4/temp_data/ios/fass_data_2024_01_14.csv",
+        tracker = CompletionTracker(MemoryStore())
+        staged = [
+            f"temp_data/{platform}/fass_data_2024_01_{day:02d}.csv"
+            for platform in ["android", "ios"]
+            for day in range(1, 15)
         ]
+        for path in staged:
+            tracker.mark_staged(path)
+        res = get_all_temp_files(bucket_name, scheduler_id, tracker)
+        self.assertEqual(res, [f"{bucket_name}/{path}" for path in staged])
 
-        mock_gcs.list_blobs.return_value = [
-            _create_mock_blob("temp_data/android/fass_data_2024_01_01.csv"),
-            _create_mock_blob("temp_data/android/fass_data_2024_01_02.csv"),
-            _create_mock_blob("temp_data/android/fass_data_2024_01_03.csv"),
-            _create_mock_blob("temp_data/android/fass_data_2024_01_04.csv"),
-            _create_mock_blob("temp_data/android/fass_data_2024_01_05.csv"),
-            _create_mock_blob("temp_data/android/fass_data_2024_01_06.csv"),
-            _create_mock_blob("temp_data/android/fass_data_2024_01_07.csv"),
-            _create_mock_blob("temp_data/android/fass_data_2024_01_08.csv"),
-            _create_mock_blob("temp_data/android/fass_data_2024_01_09.csv"),
-            _create_mock_blob("temp_data/android/fass_data_2024_01_10.csv"),
-            _create_mock_blob("temp_data/android/fass_data_2024_01_11.csv"),
-            _create_mock_blob("temp_data/android/fass_data_2024_01_12.csv"),
-            _create_mock_blob("temp_data/android/fass_data_2024_01_13.csv"),
-            _create_mock_blob("temp_data/android/fass_data_2024_01_14.csv"),
-            _create_mock_blob("temp_data/ios/fass_data_2024_01_01.csv"),
-            _create_mock_blob("temp_data/ios/fass_data_2024_01_02.csv"),
-            _create_mock_blob("temp_data/ios/fass_data_2024_01_03.csv"),
-            _create_mock_blob("temp_data/ios/fass_data_2024_01_04.csv"),
-            _create_mock_blob("temp_data/ios/fass_data_2024_01_05.csv"),
-            _create_mock_blob("temp_data/ios/fass_data_2024_01_06.csv"),
-            _create_mock_blob("temp_data/ios/fass_data_2024_01_07.csv"),
-            _create_mock_blob("temp_data/ios/fass_data_2024_01_08.csv"),
-            _create_mock_blob("temp_data/ios/fass_data_2024_01_09.csv"),
-            _create_mock_blob("temp_data/ios/fass_data_2024_01_10.csv"),
-            _create_mock_blob("temp_data/ios/fass_data_2024_01_11.csv"),
-            _create_mock_blob("temp_data/ios/fass_data_2024_01_12.csv"),
-            _create_mock_blob("temp_data/ios/fass_data_2024_01_13.csv"),
-            _create_mock_blob("temp_data/ios/fass_data_2024_01_14.csv"),
-        ]
-        res = get_all_temp_files(bucket_name, scheduler_id)
-        self.assertEqual(res, expected)
+    @patch.dict(
+        "executor_func.utils.read.config",
+        {"function_timeout_seconds": 0.3, "timeout_margin_seconds": 0.1, "completion_poll_seconds": 0.05},
+    )
+    def test_get_all_temp_files_deadline(self):
+        """Test get_all_temp_files gives up when a partition never arrives"""
+        tracker = CompletionTracker(MemoryStore())
+        tracker.start(2)
+        tracker.mark_staged("temp_data/ios/fass_data_2024_01_01.csv")
+        self.assertRaises(TimeoutError, get_all_temp_files, "bucket", "2h", tracker)
+        # the time spent fetching before the wait counts against the deadline
+        with patch("time.sleep") as mock_sleep:
+            self.assertRaises(TimeoutError, get_all_temp_files, "bucket", "2h", tracker, time.monotonic() - 0.2)
+        mock_sleep.assert_not_called()
+
+    def test_completion_deadline_fits_function_timeout(self):
+        """Test the loader stops waiting early enough to load before the executor times out"""
+        self.assertEqual(get_completion_deadline_seconds(100.0, clock=lambda: 100.0), 900)
+        self.assertEqual(get_completion_deadline_seconds(100.0, clock=lambda: 1000.0), 0)
+        self.assertLess(
+            config["retry_budget_seconds"] + config["read_timeout_seconds"], config["function_timeout_seconds"]
+        )
+        terraform_path = os.path.join(os.path.dirname(FUNCTION_DIR), "deploy", "main.tf")
+        if os.path.exists(terraform_path):
+            with open(terraform_path) as f:
+                timeouts = re.findall(r"timeout_seconds\s*=\s*(\d+)", f.read())
+            self.assertEqual(int(timeouts[-1]), config["function_timeout_seconds"])
 
-    @unittest.skip
-    def test_get_temp_df(self):
+    def test_completion_tracker(self):
+        """Test CompletionTracker against a local filesystem store"""
+        with tempfile.TemporaryDirectory() as root:
+            tracker = CompletionTracker(LocalStore(root))
+            self.assertIsNone(tracker.expected())
+            tracker.start(2)
+            self.assertEqual(tracker.expected(), 2)
+            tracker.mark_staged("temp_data/ios/fass_data_2024_01_01.csv")
+            tracker.mark_staged("temp_data/ios/fass_data_2024_01_01.csv")
+            tracker.mark_staged("temp_data/2024-01-01/android/NO_DATA.csv")
+            self.assertEqual(
+                tracker.wait_until_staged(2, deadline_seconds=1, poll_seconds=0.01),
+                [
+                    "temp_data/2024-01-01/android/NO_DATA.csv",
+                    "temp_data/ios/fass_data_2024_01_01.csv",
+                ],
+            )
+            self.assertFalse(tracker.wait_until_finished(deadline_seconds=0.05, poll_seconds=0.01))
+            tracker.mark_finished()
+            self.assertTrue(tracker.wait_until_finished(deadline_seconds=0))
+
+    @patch("pandas.read_parquet")
+    def test_get_temp_df(self, mock_read):
         """Test get_temp_df function"""
+        all_files = [f"bucket/temp_data/ios/fass_data_2024_01_{day:02d}.parquet" for day in range(1, 11)]
+        mock_read.side_effect = lambda path: pd.DataFrame({"path": [path, path]})
+        res = get_temp_df(all_files, max_workers=3)
+        self.assertEqual(len(res), 20)
+        self.assertEqual(list(res["path"].unique()), [f"gs://{f}" for f in all_files])
+
+    @patch("pandas.read_parquet")
+    def test_iter_temp_df_chunks(self, mock_read):
+        """Test iter_temp_df_chunks yields bounded chunks in file order"""
+        all_files = [f"bucket/temp_data/ios/fass_data_2024_01_{day:02d}.parquet" for day in range(1, 8)]
+        mock_read.side_effect = lambda path: pd.DataFrame({"path": [path, path]})
+        chunks = list(iter_temp_df_chunks(all_files, chunk_rows=5, max_workers=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [6, 6, 2])
+        self.assertEqual(
+            list(pd.concat(chunks)["path"].unique()), [f"gs://{f}" for f in all_files]
+        )
 
     @patch("pandas_gbq.to_gbq")
     def test_write_raw_to_bq(self, mock_to_gbq):
@@ -295,22 +734,445 @@ class ExecutorTestCase(unittest.TestCase):
             df, table_id, project_id="eighth-duality-457819-r4", if_exists="append"
         )
 
-    @patch("google.cloud.bigquery.Client")
-    def test_update_day_table(self, mock_obj):
+    def test_compute_fingerprint(self):
+        """Test compute_fingerprint ignores row order but not content"""
+        rows = [{"installs": 1, "platform": "ios"}, {"installs": 2, "platform": "ios"}]
+        fingerprint = compute_fingerprint(rows)
+        self.assertEqual(fingerprint, compute_fingerprint(list(reversed(rows))))
+        self.assertEqual(fingerprint, compute_fingerprint([{"platform": "ios", "installs": 1}, rows[1]]))
+        self.assertNotEqual(fingerprint, compute_fingerprint([rows[0], {"installs": 3, "platform": "ios"}]))
+        self.assertNotEqual(fingerprint, compute_fingerprint(rows + rows))
+
+    def test_tracing_summary(self):
+        """Test spans are aggregated per stage in the run summary, then reset"""
+        tracer.reset()
+        for rows in (10, 20):
+            with span("clean_raw_data", rows=rows):
+                pass
+        with self.assertRaises(ValueError):
+            with span("stage", rows=5, streamed=True) as trace:
+                trace.set(files=1)
+                raise ValueError("boom")
+        with patch.object(logger, "stream", io.StringIO()):
+            summary = log_run_summary()
+            logger.flush()
+        self.assertEqual(set(summary), {"clean_raw_data", "stage"})
+        self.assertEqual(summary["clean_raw_data"]["count"], 2)
+        self.assertEqual(summary["clean_raw_data"]["rows"], 30)
+        self.assertEqual(summary["stage"]["files"], 1)
+        # non-numeric attributes, like the error name, are only logged with the span
+        self.assertNotIn("streamed", summary["stage"])
+        self.assertNotIn("error", summary["stage"])
+        self.assertEqual(tracer.summary(), {})
+
+    def test_span_levels(self):
+        """Test slow and failed spans are logged at INFO level, the others only at DEBUG level"""
+        stream = io.StringIO()
+        logger.flush()
+        with patch.object(logger, "stream", stream), patch.dict(config, {"span_info_seconds": 0.05}):
+            logger.reset()
+            with span("fast_stage"):
+                pass
+            with span("slow_stage", rows=3):
+                threading.Event().wait(0.06)
+            with self.assertRaises(ValueError):
+                with span("failed_stage"):
+                    raise ValueError("boom")
+            logger.flush()
+        entries = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(
+            [(entry["severity"], entry["custom_property"]["span"]) for entry in entries],
+            [("INFO", "slow_stage"), ("INFO", "failed_stage")],
+        )
+        self.assertEqual(entries[0]["custom_property"]["rows"], 3)
+        self.assertEqual(entries[1]["custom_property"]["error"], "ValueError")
+        tracer.reset()
+
+    def test_logger(self):
+        """Test the logger filters levels, buffers entries and rate limits repeated messages"""
+        now = [0.0]
+        stream = io.StringIO()
+        log = Logger(
+            level="INFO", buffer_size=10, rate_limit_seconds=10, rate_limit_burst=2, stream=stream, clock=lambda: now[0]
+        )
+        expensive = Mock(return_value={"rows": 1})
+        log.debug("Skipped", expensive)
+        expensive.assert_not_called()
+        log.info("Polling", expensive)
+        expensive.assert_called_once()
+        self.assertEqual(stream.getvalue(), "")
+        for _ in range(5):
+            log.info("Polling")
+        now[0] = 10.0
+        log.info("Polling")
+        log.warning("Flushed at once", {"platform": "ios"})
+        entries = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([entry["message"] for entry in entries], ["Polling", "Polling", "Polling", "Flushed at once"])
+        self.assertEqual(entries[0]["custom_property"], {"rows": 1})
+        self.assertEqual(entries[2]["suppressed"], 4)
+        self.assertEqual(entries[3]["severity"], "WARNING")
+        # errors are never rate limited
+        for _ in range(3):
+            log.error("Failed")
+        self.assertEqual(stream.getvalue().count("Failed"), 3)
+
+    def test_logger_rate_windows_bounded(self):
+        """Test the rate limiting windows stay capped for distinct messages within one window, and expire after it"""
+        now = [0.0]
+        log = Logger(level="INFO", rate_limit_seconds=10, stream=io.StringIO(), clock=lambda: now[0])
+        for i in range(MAX_RATE_WINDOWS + 500):
+            log.info(f"Sending POST request {i}")
+        self.assertEqual(len(log.windows), MAX_RATE_WINDOWS)
+        self.assertEqual(next(iter(log.windows)), "Sending POST request 500")
+        now[0] = 10.0
+        log.info("Polling")
+        self.assertEqual(list(log.windows), ["Polling"])
+
+    def test_call_api_marks_finished_on_failure(self):
+        """Test a batch-loading executor failing to fetch its own URL still releases the orchestrator"""
+        main = _load_main()
+        store = MemoryStore()
+        request = Mock()
+        request.get_json.return_value = {
+            "url": "https://fass-api.example.com/reporting?start_date=2024-01-01&end_date=2024-01-01",
+            "datetime_now": "2024-01-02 00:00:00",
+            "start_date": "2024-01-01",
+            "end_date": "2024-01-01",
+            "batch_load": True,
+            "scheduler_id": "2h",
+            "stream": False,
+        }
+        stream = io.StringIO()
+        logger.flush()
+        with patch.dict(os.environ, {"K_SERVICE": "fass-executor-test"}), patch.object(
+            main, "GCSStore", return_value=store
+        ), patch.object(main, "fetch_platforms", side_effect=RuntimeError("fetch failed")), patch.object(
+            logger, "stream", stream
+        ):
+            with self.assertRaises(RuntimeError):
+                main.call_api(request)
+        # the payload is only logged at DEBUG level
+        start = json.loads(stream.getvalue().splitlines()[0])
+        self.assertEqual(start["message"], "Start function on 2024-01-01")
+        self.assertEqual(start["custom_property"], {"scheduler_id": "2h", "platforms": 2, "batch_load": True})
+        tracker = CompletionTracker(store, "temp_data/2h/20240102T000000/_manifest")
+        self.assertTrue(tracker.is_finished())
+        self.assertFalse(tracker.is_loaded())
+
+    def _call_api_incremental(self, fake_bq, store):
+        """Runs a batch-loading executor on 2024-01-01 and 2024-01-02, whose API rows never change"""
+        main = _load_main()
+        body = [_fass_row("2024-01-01"), _fass_row("2024-01-02")]
+        request = Mock()
+        request.get_json.return_value = {
+            "datetime_now": "2024-01-03 00:00:00",
+            "start_date": "2024-01-01",
+            "end_date": "2024-01-02",
+            "batch_load": True,
+            "scheduler_id": "7d",
+            "stream": False,
+            "incremental": True,
+        }
+        CompletionTracker(store, "temp_data/7d/20240103T000000/_manifest").start(4)
+        set_client_factory(lambda kind: fake_bq)
+        try:
+            with _FaultyFassApi([(200, {}, body)]) as api, tempfile.TemporaryDirectory() as root, _local_gcs(
+                root
+            ), patch.dict(os.environ, {"K_SERVICE": "fass-executor-test"}), patch.object(
+                main, "GCS_BUCKET", "test-bucket"
+            ), patch.object(main, "GCSStore", return_value=store), patch.object(logger, "stream", io.StringIO()):
+                request.get_json.return_value["url"] = api.url
+                main.call_api(request)
+        finally:
+            set_client_factory()
+
+    def test_call_api_incremental(self):
+        """Test call_api skips unchanged days, loads the others and commits their fingerprints after the load"""
+        unchanged = compute_fingerprint([_fass_row("2024-01-01")])
+        fake_bq = _FakeBigQueryClient(
+            rows=[
+                {"reportDay": datetime.date(2024, 1, 1), "platform": platform, "fingerprint": unchanged}
+                for platform in ["ios", "android"]
+            ]
+            + [{"reportDay": datetime.date(2024, 1, 2), "platform": "ios", "fingerprint": "1-stale"}]
+        )
+        store = MemoryStore()
+        self._call_api_incremental(fake_bq, store)
+
+        tracker = CompletionTracker(store, "temp_data/7d/20240103T000000/_manifest")
+        self.assertTrue(tracker.is_loaded())
+        self.assertEqual(
+            sorted(tracker.staged()),
+            [
+                "temp_data/7d/20240103T000000/2024-01-01/android/UNCHANGED",
+                "temp_data/7d/20240103T000000/2024-01-01/ios/UNCHANGED",
+                "temp_data/7d/20240103T000000/android/fass_data_2024_01_02.parquet",
+                "temp_data/7d/20240103T000000/ios/fass_data_2024_01_02.parquet",
+            ],
+        )
+        # the unchanged day is left out of the load job
+        self.assertEqual(len(fake_bq.loads), 1)
+        self.assertEqual(
+            sorted(fake_bq.loads[0][0]),
+            [
+                "gs://test-bucket/temp_data/7d/20240103T000000/android/fass_data_2024_01_02.parquet",
+                "gs://test-bucket/temp_data/7d/20240103T000000/ios/fass_data_2024_01_02.parquet",
+            ],
+        )
+        upserts = [job_config for query, job_config, job in fake_bq.jobs if "fass_fingerprint" in query and "MERGE" in query]
+        self.assertEqual(len(upserts), 1)
+        self.assertEqual(
+            sorted((e.struct_values["reportDay"], e.struct_values["platform"]) for e in upserts[0].query_parameters[0].values),
+            [(datetime.date(2024, 1, 2), "android"), (datetime.date(2024, 1, 2), "ios")],
+        )
+
+    def test_call_api_incremental_failed_load(self):
+        """Test call_api does not commit fingerprints when the load job fails"""
+        fake_bq = _FakeBigQueryClient()
+        load = fake_bq.load_table_from_uri
+
+        def _failing_load(*args, **kwargs):
+            job = load(*args, **kwargs)
+            job.result.side_effect = RuntimeError("load failed")
+            return job
+
+        fake_bq.load_table_from_uri = _failing_load
+        store = MemoryStore()
+        with self.assertRaises(RuntimeError):
+            self._call_api_incremental(fake_bq, store)
+        self.assertEqual(len(fake_bq.loads), 1)
+        self.assertEqual([query for query, _, _ in fake_bq.jobs if "fass_fingerprint" in query and "MERGE" in query], [])
+        tracker = CompletionTracker(store, "temp_data/7d/20240103T000000/_manifest")
+        self.assertTrue(tracker.is_finished())
+        self.assertFalse(tracker.is_loaded())
+
+    def test_run_backfill(self):
+        """Test run_backfill stages every (day, platform) partition from worker processes"""
+        row = {
+            "installs": 1,
+            "limit_ad_tracking_installs": 1,
+            "clicks": 1,
+            "impressions": 1,
+            "ad_spend": 0.1,
+            "ad_network_name": "facebook",
+            "campaign_name": "campaign1",
+            "country_code": "it",
+            "platform": "android",
+            "creative_name": "creative1",
+            "uninstalls": 1,
+            "click_convertion_rate": 1.0,
+            "click_through_rate": 1.0,
+            "impressions_convertion_rate": 1.0,
+            "start_date": "2024-01-01",
+            "end_date": "2024-01-01",
+        }
+        with _FaultyFassApi([(200, {}, [row, row])]) as api, tempfile.TemporaryDirectory() as root:
+            results = run_backfill(
+                api.url, "2024-01-01", "2024-01-02", self.today_datetime, root,
+                run_prefix="temp_data/backfill/test", max_workers=2,
+            )
+            self.assertEqual(
+                [(r["report_day"], r["platform"], r["rows"]) for r in results],
+                [
+                    ("2024-01-01", "ios", 2),
+                    ("2024-01-01", "android", 2),
+                    ("2024-01-02", "ios", 2),
+                    ("2024-01-02", "android", 2),
+                ],
+            )
+            self.assertEqual(
+                results[0]["path"],
+                f"{root}/temp_data/backfill/test/ios/fass_data_2024_01_01.parquet",
+            )
+            self.assertEqual(results[0]["fingerprint"], compute_fingerprint([row, row]))
+            self.assertEqual(len(pd.read_parquet(results[3]["path"])), 2)
+            self.assertEqual(api.requests, 4)
+
+    def test_run_backfill_failed_partition(self):
+        """Test a partition failing to be fetched is reported and blocks the load, which cleans up after itself"""
+        with _FaultyFassApi([(200, {}, [_fass_row("2024-01-01")]), (404, {}, "Not Found")]) as api, \
+                tempfile.TemporaryDirectory() as root:
+            results = run_backfill(
+                api.url, "2024-01-01", "2024-01-01", self.today_datetime, root,
+                run_prefix="temp_data/backfill/test", max_workers=1,
+            )
+            self.assertEqual(
+                [(r["platform"], r["status"], r["rows"]) for r in results],
+                [("ios", "staged", 1), ("android", "failed", 0)],
+            )
+            self.assertIn("404", results[1]["error"])
+            fake_bq = _FakeBigQueryClient()
+            set_client_factory(lambda kind: fake_bq)
+            try:
+                with self.assertRaisesRegex(RuntimeError, "2024-01-01/android"):
+                    load_backfill(results, "analytics_test", self.today_datetime)
+                self.assertEqual(fake_bq.loads, [])
+                self.assertTrue(os.path.exists(results[0]["path"]))
+
+                load_backfill(results[:1], "analytics_test", self.today_datetime)
+                self.assertEqual(len(fake_bq.loads), 1)
+                self.assertFalse(os.path.exists(results[0]["path"]))
+            finally:
+                set_client_factory()
+
+    def test_fingerprint_store(self):
+        """Test FingerprintStore reads a window and upserts in a single MERGE job"""
+        fake_bq = _FakeBigQueryClient(
+            rows=[
+                {"reportDay": datetime.date(2024, 1, 1), "platform": "ios", "fingerprint": "1-ab"},
+                {"reportDay": datetime.date(2024, 1, 2), "platform": "ios", "fingerprint": "3-ef"},
+            ]
+        )
+        store = FingerprintStore("analytics_test.fass_fingerprint", client=fake_bq)
+        self.assertEqual(
+            store.get("2024-01-01", "2024-01-02"),
+            {"2024-01-01": {"ios": "1-ab"}, "2024-01-02": {"ios": "3-ef"}},
+        )
+        tracker = CompletionTracker(MemoryStore())
+        tracker.record_fingerprint("2024-01-01", "ios", "1-ab")
+        tracker.record_fingerprint("2024-01-01", "android", "2-cd")
+        store.upsert(tracker.fingerprints(), self.today_datetime)
+        store.upsert([], self.today_datetime)
+        self.assertEqual(len(fake_bq.jobs), 2)
+        query, job_config, job = fake_bq.jobs[1]
+        self.assertTrue(query.startswith("MERGE `analytics_test.fass_fingerprint` T"))
+        job.result.assert_called_once_with()
+        entries = job_config.query_parameters[0].values
+        self.assertEqual(
+            [(e.struct_values["reportDay"], e.struct_values["platform"], e.struct_values["fingerprint"]) for e in entries],
+            [
+                (datetime.date(2024, 1, 1), "android", "2-cd"),
+                (datetime.date(2024, 1, 1), "ios", "1-ab"),
+            ],
+        )
+
+    def test_load_job_raw_writer(self):
+        """Test the load job writer loads staged files straight from GCS"""
+        fake_bq = _FakeBigQueryClient()
+        all_files = [
+            "bucket/temp_data/ios/fass_data_2024_01_01.parquet",
+            "bucket/temp_data/android/fass_data_2024_01_01.parquet",
+        ]
+        writer = get_raw_writer("load_job", client=fake_bq)
+        self.assertEqual(writer.mode, "load_job")
+        writer.write(all_files, "analytics_test.fass_raw")
+        self.assertEqual(len(fake_bq.loads), 1)
+        uris, table_id, job_config, job = fake_bq.loads[0]
+        self.assertEqual(uris, [f"gs://{f}" for f in all_files])
+        self.assertEqual(table_id, "analytics_test.fass_raw")
+        self.assertEqual(job_config.source_format, "PARQUET")
+        self.assertEqual(job_config.write_disposition, "WRITE_APPEND")
+        self.assertEqual(
+            [(field.name, field.field_type) for field in job_config.schema][:7],
+            [
+                ("adNetworkName", "STRING"),
+                ("campaignName", "STRING"),
+                ("creativeName", "STRING"),
+                ("startDate", "STRING"),
+                ("endDate", "STRING"),
+                ("platform", "STRING"),
+                ("installs", "INT64"),
+            ],
+        )
+        self.assertEqual(job_config.schema[-1].name, "createdAt")
+        self.assertEqual(len(job_config.schema), len(get_raw_schema()))
+        job.result.assert_called_once_with()
+
+    @patch("pandas_gbq.to_gbq")
+    @patch("pandas.read_parquet")
+    def test_pandas_raw_writer(self, mock_read, mock_to_gbq):
+        """Test the pandas fallback writer appends through pandas_gbq"""
+        mock_read.return_value = pd.DataFrame({"installs": [1, 2]})
+        writer = get_raw_writer("pandas")
+        self.assertEqual(writer.mode, "pandas")
+        writer.write(["bucket/temp_data/ios/fass_data_2024_01_01.parquet"], "analytics_test.fass_raw")
+        mock_to_gbq.assert_called_once()
+        self.assertRaises(ValueError, get_raw_writer, "streaming")
+
+    def test_update_day_table(self):
         """Test update_day_table function"""
-        mock_bq = mock_obj.return_value
+        fake_bq = _FakeBigQueryClient()
         all_files = [
             "eighth-duality-457819-r4/temp_data/android/fass_data_2024_01_01.csv",
-            "eighth-duality-457819-r4/temp_data/ios/fass_data_2024_01_01.csv",
+            "eighth-duality-457819-r4/temp_data/ios/fass_data_2024_01_01.parquet",
+            "eighth-duality-457819-r4/temp_data/ios/fass_data_2024_01_03.parquet",
+            "eighth-duality-457819-r4/temp_data/android/fass_data_2024_01_02.parquet",
         ]
         table_id = "analytics_test.fass_day"
-        update_day_table(all_files, self.today_datetime, table_id)
-        mock_bq.query.assert_called_with(
-            f"""INSERT INTO {table_id}
-                                (reportDay, updatedAt)  
-                                VALUES ('2024-01-01', '{self.today_datetime}')
-            """
+        update_day_table(all_files, self.today_datetime, table_id, client=fake_bq)
+        self.assertEqual(len(fake_bq.jobs), 1)
+        query, job_config, job = fake_bq.jobs[0]
+        self.assertTrue(query.startswith(f"MERGE `{table_id}` T"))
+        job.result.assert_called_once_with()
+        params = {param.name: param for param in job_config.query_parameters}
+        self.assertEqual(
+            params["report_days"].values,
+            [datetime.date(2024, 1, 1), datetime.date(2024, 1, 2), datetime.date(2024, 1, 3)],
         )
+        self.assertEqual(
+            params["updated_at"].value.replace(tzinfo=None),
+            datetime.datetime.strptime(self.today_datetime, "%Y-%m-%d %H:%M:%S"),
+        )
+
+        update_day_table([], self.today_datetime, table_id, client=fake_bq)
+        self.assertEqual(len(fake_bq.jobs), 1)
+
+
+class _FaultyFassApi:
+    """Local stand-in of the FASS API replaying scripted (status, headers, body) responses"""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.requests = 0
+        api = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, headers, body = api.script[min(api.requests, len(api.script) - 1)]
+                api.requests += 1
+                payload = (body if isinstance(body, str) else json.dumps(body)).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if "Content-Length" not in headers:
+                    # a larger scripted length stands in for a body cut off mid-stream
+                    self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/reporting?platform=ios"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _FakeBigQueryClient:
+    """BigQuery client stand-in that records every query and load job"""
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.jobs = []
+        self.loads = []
+
+    def query(self, query, job_config=None):
+        job = Mock()
+        job.result.return_value = self.rows
+        self.jobs.append((query, job_config, job))
+        return job
+
+    def load_table_from_uri(self, source_uris, destination, job_config=None):
+        job = Mock()
+        self.loads.append((source_uris, destination, job_config, job))
+        return job
 
 
 if __name__ == "__main__":
@@ -0,0 +1,238 @@
+# Backfill of historical days, fanning (day, platform) partitions out across worker processes
+#
+# Usage (from the executor_func folder):
+#     python -m utils.backfill --url https://.../reporting --from 2024-01-01 --to 2024-12-31 \
+#         --bucket my-bucket --workers 8 --dataset analytics_test
+
+from .configs import config
+from .completion import get_run_prefix
+from .fingerprint import FingerprintStore, compute_fingerprint
+from .load import get_raw_writer
+from .read import (
+    _request_timeout,
+    clean_raw_data,
+    get_bq_fingerprint_table,
+    get_bq_tables,
+    get_report_days,
+    get_session,
+    get_temp_prefix,
+)
+from .retry import CircuitOpenError, get_with_retries
+from .staging import get_staging_format
+from .logger import logger
+from .write import update_day_table
+import argparse
+import datetime
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import requests
+
+
+def _stage_partition(task):
+    """
+    Fetches, cleans and stages one (day, platform) partition. Runs in a worker process, which
+    shares nothing with the others and returns only small metadata to the parent.
+
+    Args:
+        task (dict): The partition to stage, with url, report_day, platform, datetime_now,
+            staging_root and run_prefix.
+
+    Returns:
+        dict: The report_day, platform, status ("staged", "no_data" or "failed"), error of a failed
+            fetch, number of rows, staged path (None unless staged), fingerprint and seconds spent.
+    """
+    start = time.perf_counter()
+    metadata = {
+        "report_day": task["report_day"],
+        "platform": task["platform"],
+        "status": "no_data",
+        "error": None,
+        "rows": 0,
+        "path": None,
+        "fingerprint": None,
+    }
+    try:
+        # unlike get_with_url, keep failed fetches apart from days without data
+        response = get_with_retries(
+            get_session(), f"{task['url']}&platform={task['platform']}", timeout=_request_timeout()
+        )
+        response.raise_for_status()
+        rows = response.json()
+    except (requests.exceptions.RequestException, CircuitOpenError) as err:
+        logger.warning(f"Failed to fetch {task['report_day']} on {task['platform']}: {err}")
+        metadata.update(status="failed", error=str(err))
+        rows = []
+    metadata["rows"] = len(rows)
+    if rows:
+        df_raw = clean_raw_data(rows, task["datetime_now"])
+        path = get_temp_prefix(
+            task["staging_root"], task["report_day"], task["platform"], run_prefix=task["run_prefix"]
+        )
+        if "://" not in path:
+            # local staging roots, used for local runs and benchmarks
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        get_staging_format().write(df_raw, path)
+        metadata.update(status="staged", path=path, fingerprint=compute_fingerprint(rows))
+    metadata["seconds"] = round(time.perf_counter() - start, 3)
+    return metadata
+
+
+def run_backfill(
+    url,
+    start_date,
+    end_date,
+    datetime_now,
+    staging_root,
+    run_prefix=None,
+    platforms=None,
+    max_workers=None,
+):
+    """
+    Stages every (day, platform) partition of a date range through a pool of worker processes.
+
+    Args:
+        url (str): The URL of the FASS /reporting endpoint, optionally with extra query parameters.
+        start_date (str): The first day, in YYYY-MM-DD format.
+        end_date (str): The last day, in YYYY-MM-DD format.
+        datetime_now (str): The current datetime.
+        staging_root (str): Where to stage the files, e.g. "gs://my-bucket" or a local folder.
+        run_prefix (str): The staging prefix of the run. Defaults to one for the "backfill" schedule.
+        platforms (list): The platforms to fetch. Defaults to config["platforms"].
+        max_workers (int): The number of worker processes. Defaults to config["backfill_max_workers"].
+
+    Returns:
+        list: The metadata of every partition, in (day, platform) order.
+    """
+    run_prefix = run_prefix or get_run_prefix("backfill", datetime_now)
+    platforms = platforms or config["platforms"]
+    max_workers = max_workers or config["backfill_max_workers"]
+    separator = "&" if "?" in url else "?"
+    tasks = [
+        {
+            "url": f"{url}{separator}start_date={report_day}&end_date={report_day}",
+            "report_day": report_day,
+            "platform": platform,
+            "datetime_now": datetime_now,
+            "staging_root": staging_root,
+            "run_prefix": run_prefix,
+        }
+        for report_day in get_report_days(start_date, end_date)
+        for platform in platforms
+    ]
+    logger.info(f"Backfilling {len(tasks)} partitions with {max_workers} processes", {"run": run_prefix})
+    start = time.perf_counter()
+    # spawn, so workers do not inherit the threads and sockets of the parent
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        results = list(pool.map(_stage_partition, tasks))
+    summary = {
+        "partitions": len(results),
+        "staged": sum(1 for result in results if result["path"]),
+        "failed": _failed_partitions(results),
+        "rows": sum(result["rows"] for result in results),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    logger.log("Backfill staged", summary, severity="WARNING" if summary["failed"] else "INFO")
+    return results
+
+
+def _failed_partitions(results):
+    """Returns the "day/platform" names of the partitions that failed to be fetched."""
+    return [f"{result['report_day']}/{result['platform']}" for result in results if result["status"] == "failed"]
+
+
+def clean_backfill(results):
+    """
+    Deletes the files staged by run_backfill.
+
+    Args:
+        results (list): The partition metadata returned by run_backfill.
+
+    Returns:
+        int: The number of deleted files.
+    """
+    import fsspec
+
+    paths = [result["path"] for result in results if result["path"]]
+    if not paths:
+        return 0
+    fs, _ = fsspec.core.url_to_fs(paths[0])
+    fs.rm([fsspec.core.url_to_fs(path)[1] for path in paths])
+    return len(paths)
+
+
+def load_backfill(results, dataset_name, datetime_now):
+    """
+    Loads the partitions staged in GCS by run_backfill, records their fingerprints and deletes
+    the staged files.
+
+    Args:
+        results (list): The partition metadata returned by run_backfill.
+        dataset_name (str): The BigQuery dataset to load into.
+        datetime_now (str): The current datetime.
+
+    Returns:
+        None
+
+    Raises:
+        RuntimeError: If some partitions failed to be fetched, as loading the others would leave
+            holes in the tables that look like days without data.
+    """
+    failed = _failed_partitions(results)
+    if failed:
+        raise RuntimeError(f"Not loading the backfill, {len(failed)} partitions failed: {', '.join(failed)}")
+    all_files = [result["path"].split("://", 1)[-1] for result in results if result["path"]]
+    if not all_files:
+        logger.warning("No partition to load")
+        return
+    table_raw_id, table_day_id = get_bq_tables(dataset_name)
+    get_raw_writer().write(all_files, table_raw_id)
+    update_day_table(all_files, datetime_now, table_day_id)
+    FingerprintStore(get_bq_fingerprint_table(dataset_name)).upsert(
+        [
+            (result["report_day"], result["platform"], result["fingerprint"])
+            for result in results
+            if result["path"]
+        ],
+        datetime_now,
+    )
+    logger.info(f"Deleted {clean_backfill(results)} staged files")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", required=True)
+    parser.add_argument("--from", dest="start_date", required=True)
+    parser.add_argument("--to", dest="end_date", required=True)
+    parser.add_argument("--bucket", required=True)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--dataset", help="Load the staged partitions into this dataset")
+    opts = parser.parse_args()
+
+    datetime_now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    results = run_backfill(
+        opts.url,
+        opts.start_date,
+        opts.end_date,
+        datetime_now,
+        f"gs://{opts.bucket}",
+        max_workers=opts.workers,
+    )
+    failed = _failed_partitions(results)
+    if failed:
+        logger.error(f"{len(failed)} partitions failed, run the backfill again", failed)
+        if opts.dataset:
+            # the next run fetches every partition again, so nothing staged is worth keeping
+            clean_backfill(results)
+        logger.flush()
+        sys.exit(1)
+    if opts.dataset:
+        load_backfill(results, opts.dataset, datetime_now)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# Process-wide registry of the GCS and BigQuery clients. Keep in sync with orchestrator_func/utils/clients.py
+
+import threading
+
+
+def _default_client_factory(kind):
+    """
+    Builds a new client with the default credentials of the environment.
+
+    Args:
+        kind (str): The kind of client, "storage" or "bigquery".
+
+    Returns:
+        The new client.
+
+    Raises:
+        ValueError: If the kind of client is not supported.
+    """
+    if kind == "storage":
+        from google.cloud import storage
+
+        return storage.Client()
+    if kind == "bigquery":
+        from google.cloud import bigquery
+
+        return bigquery.Client()
+    raise ValueError(f"Client not supported: {kind}")
+
+
+class ClientRegistry:
+    """
+    Lazily builds one client per kind and reuses it for the life of the process, so warm
+    invocations and poll iterations do not resolve credentials and open connection pools again.
+
+    Args:
+        factory (callable): Builds a client from its kind. Defaults to the google-cloud clients.
+    """
+
+    def __init__(self, factory=_default_client_factory):
+        self.factory = factory
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def get(self, kind):
+        """Returns the client of the given kind, building it on first use."""
+        with self.lock:
+            if kind not in self.clients:
+                self.clients[kind] = self.factory(kind)
+            return self.clients[kind]
+
+    def set_factory(self, factory=None):
+        """Replaces the client factory and drops the clients built so far."""
+        with self.lock:
+            self.factory = factory or _default_client_factory
+            self.clients = {}
+
+
+_registry = ClientRegistry()
+
+
+def get_storage_client():
+    """
+    Returns the process-wide GCS client.
+
+    Returns:
+        google.cloud.storage.Client: The shared client.
+    """
+    return _registry.get("storage")
+
+
+def get_bigquery_client():
+    """
+    Returns the process-wide BigQuery client.
+
+    Returns:
+        google.cloud.bigquery.Client: The shared client.
+    """
+    return _registry.get("bigquery")
+
+
+def set_client_factory(factory=None):
+    """
+    Swaps the factory building the shared clients, e.g. to inject fakes in tests.
+
+    Args:
+        factory (callable): Builds a client from its kind ("storage" or "bigquery").
+            Defaults to the google-cloud clients.
+
+    Returns:
+        None
+    """
+    _registry.set_factory(factory)
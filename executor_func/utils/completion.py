@@ -0,0 +1,277 @@
+# Completion tracking for staged partitions. Keep in sync with orchestrator_func/utils/completion.py
+
+import datetime
+import json
+import os
+import threading
+import time
+from .clients import get_storage_client
+
+MANIFEST_PREFIX = "temp_data/_manifest"
+
+
+def get_run_prefix(scheduler_id, datetime_now):
+    """
+    Returns the staging prefix of a run, so concurrent runs never share staged files or markers.
+
+    Args:
+        scheduler_id (str): The ID of the schedule, e.g. "2h".
+        datetime_now (str): The datetime the run was started at.
+
+    Returns:
+        str: The prefix, e.g. "temp_data/2h/20250501T120000".
+    """
+    started_at = datetime.datetime.fromisoformat(datetime_now).strftime("%Y%m%dT%H%M%S")
+    return f"temp_data/{scheduler_id}/{started_at}"
+
+
+class GCSStore:
+    """
+    Object store backed by a GCS bucket.
+
+    Args:
+        bucket_name (str): The name of the GCS bucket.
+        client (google.cloud.storage.Client): The client to use. Defaults to the shared client.
+    """
+
+    def __init__(self, bucket_name, client=None):
+        client = client or get_storage_client()
+        self.client = client
+        self.bucket = client.bucket(bucket_name)
+
+    def create(self, name, data=b""):
+        """Creates an object only if it does not exist yet. Returns False if it already exists."""
+        from google.api_core.exceptions import PreconditionFailed
+
+        try:
+            self.bucket.blob(name).upload_from_string(data, if_generation_match=0)
+        except PreconditionFailed:
+            return False
+        return True
+
+    def read(self, name):
+        """Returns the content of an object, or None if it does not exist."""
+        from google.api_core.exceptions import NotFound
+
+        try:
+            return self.bucket.blob(name).download_as_bytes()
+        except NotFound:
+            return None
+
+    def exists(self, name):
+        """Returns True if the object exists."""
+        return self.bucket.blob(name).exists()
+
+    def delete(self, name):
+        """Deletes an object if it exists."""
+        from google.api_core.exceptions import NotFound
+
+        try:
+            self.bucket.blob(name).delete()
+        except NotFound:
+            pass
+
+    def list(self, prefix):
+        """Returns the names of all objects under the prefix."""
+        return [blob.name for blob in self.client.list_blobs(self.bucket, prefix=prefix)]
+
+
+class LocalStore:
+    """
+    Object store backed by a local directory, used for tests and local runs.
+
+    Args:
+        root (str): The directory standing in for the bucket.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, name):
+        return os.path.join(self.root, *name.split("/"))
+
+    def create(self, name, data=b""):
+        """Creates an object only if it does not exist yet. Returns False if it already exists."""
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "wb") as f:
+            f.write(data.encode() if isinstance(data, str) else data)
+        return True
+
+    def read(self, name):
+        """Returns the content of an object, or None if it does not exist."""
+        try:
+            with open(self._path(name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, name):
+        """Returns True if the object exists."""
+        return os.path.isfile(self._path(name))
+
+    def delete(self, name):
+        """Deletes an object if it exists."""
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix):
+        """Returns the names of all objects under the prefix."""
+        names = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                rel = os.path.relpath(os.path.join(dirpath, filename), self.root)
+                name = rel.replace(os.sep, "/")
+                if name.startswith(prefix):
+                    names.append(name)
+        return sorted(names)
+
+
+class MemoryStore:
+    """In-memory object store, used for tests."""
+
+    def __init__(self):
+        self.objects = {}
+        self.lock = threading.Lock()
+
+    def create(self, name, data=b""):
+        """Creates an object only if it does not exist yet. Returns False if it already exists."""
+        with self.lock:
+            if name in self.objects:
+                return False
+            self.objects[name] = data.encode() if isinstance(data, str) else data
+            return True
+
+    def read(self, name):
+        """Returns the content of an object, or None if it does not exist."""
+        with self.lock:
+            return self.objects.get(name)
+
+    def exists(self, name):
+        """Returns True if the object exists."""
+        with self.lock:
+            return name in self.objects
+
+    def delete(self, name):
+        """Deletes an object if it exists."""
+        with self.lock:
+            self.objects.pop(name, None)
+
+    def list(self, prefix):
+        """Returns the names of all objects under the prefix."""
+        with self.lock:
+            return sorted(name for name in self.objects if name.startswith(prefix))
+
+
+class CompletionTracker:
+    """
+    Tracks which partitions of a run have been staged and whether the batch load has finished.
+
+    Every executor creates one marker object per staged partition instead of updating a
+    shared counter, so markers never contend with each other (GCS allows roughly one
+    write per second to the same object). Waiting lists only the small marker prefix.
+
+    Args:
+        store: The object store holding the manifest (GCSStore, LocalStore or MemoryStore).
+        prefix (str): The prefix under which the manifest objects are kept.
+    """
+
+    def __init__(self, store, prefix=MANIFEST_PREFIX):
+        self.store = store
+        self.prefix = prefix
+
+    def start(self, expected):
+        """Records the number of partitions the run is expected to stage."""
+        self.store.create(f"{self.prefix}/expected.json", json.dumps({"expected": expected}))
+
+    def expected(self):
+        """Returns the number of expected partitions, or None if the run did not record it."""
+        data = self.store.read(f"{self.prefix}/expected.json")
+        return json.loads(data)["expected"] if data else None
+
+    def mark_staged(self, path):
+        """Records that the object at `path` (relative to the bucket) has been staged."""
+        self.store.create(f"{self.prefix}/staged/{path}")
+
+    def staged(self):
+        """Returns the paths of all staged objects, relative to the bucket."""
+        marker_prefix = f"{self.prefix}/staged/"
+        return [name[len(marker_prefix):] for name in self.store.list(marker_prefix)]
+
+    def record_fingerprint(self, report_day, platform, fingerprint):
+        """Records the fingerprint of a staged partition, to be committed once the batch is loaded."""
+        self.store.create(f"{self.prefix}/fingerprints/{report_day}/{platform}/{fingerprint}")
+
+    def fingerprints(self):
+        """Returns the recorded fingerprints as a list of (report_day, platform, fingerprint) tuples."""
+        marker_prefix = f"{self.prefix}/fingerprints/"
+        return [
+            tuple(name[len(marker_prefix):].split("/"))
+            for name in self.store.list(marker_prefix)
+        ]
+
+    def mark_finished(self):
+        """Records that the batch load has finished, successfully or not, so staged data can be cleaned."""
+        self.store.create(f"{self.prefix}/finished")
+
+    def is_finished(self):
+        """Returns True if the batch load has finished."""
+        return self.store.exists(f"{self.prefix}/finished")
+
+    def mark_loaded(self):
+        """Records that the batch load succeeded, as opposed to finishing without loading."""
+        self.store.create(f"{self.prefix}/loaded")
+
+    def is_loaded(self):
+        """Returns True if the batch load succeeded."""
+        return self.store.exists(f"{self.prefix}/loaded")
+
+    def wait_until_staged(self, expected, deadline_seconds, poll_seconds=2):
+        """
+        Waits until `expected` partitions have been staged.
+
+        Args:
+            expected (int): The number of partitions to wait for.
+            deadline_seconds (float): The maximum time to wait.
+            poll_seconds (float): The time between checks.
+
+        Returns:
+            list: The staged paths, relative to the bucket.
+
+        Raises:
+            TimeoutError: If the partitions are not all staged before the deadline.
+        """
+        deadline = time.monotonic() + deadline_seconds
+        while True:
+            staged = self.staged()
+            if len(staged) >= expected:
+                return staged
+            if time.monotonic() + poll_seconds > deadline:
+                raise TimeoutError(
+                    f"Expected {expected} staged partitions, found {len(staged)} before the deadline"
+                )
+            time.sleep(poll_seconds)
+
+    def wait_until_finished(self, deadline_seconds, poll_seconds=2):
+        """
+        Waits until the batch load has finished.
+
+        Args:
+            deadline_seconds (float): The maximum time to wait.
+            poll_seconds (float): The time between checks.
+
+        Returns:
+            bool: True if the batch load finished before the deadline, False otherwise.
+        """
+        deadline = time.monotonic() + deadline_seconds
+        while not self.is_finished():
+            if time.monotonic() + poll_seconds > deadline:
+                return False
+            time.sleep(poll_seconds)
+        return True
@@ -1,9 +1,13 @@
 # Main configuration for the Python script and Adjust Report API interaction
 
+# The timeout_seconds of the executor function in deploy/main.tf
+FUNCTION_TIMEOUT_SECONDS = 1200
+
 config = {
     "project_id": "eighth-duality-457819-r4",
     "table_raw_name": "fass_raw",
     "table_day_name": "fass_day",
+    "table_fingerprint_name": "fass_fingerprint",
     "integer_cols": ["installs", "limit_ad_tracking_installs", "clicks", "impressions", "uninstalls"],
     "ordered_columns": [
         "ad_network_name",
@@ -23,5 +27,34 @@ config = {
         "uninstalls",
     ],
     "float_cols": ["ad_spend", "click_convertion_rate","click_through_rate","impressions_convertion_rate"],
-    "timeout_limit_seconds": 900,
+    "category_cols": ["ad_network_name", "campaign_name", "creative_name", "start_date", "end_date", "platform"],
+    "connect_timeout_seconds": 10,
+    "read_timeout_seconds": 120,
+    "platforms": ["ios", "android"],
+    "fetch_max_workers": 4,
+    "http_pool_maxsize": 10,
+    "function_timeout_seconds": FUNCTION_TIMEOUT_SECONDS,
+    # left to load the staged data and mark the run finished once the wait is over
+    "timeout_margin_seconds": 300,
+    "completion_poll_seconds": 2,
+    "staging_format": "parquet",
+    "load_max_workers": 8,
+    "load_chunk_rows": 500000,
+    "raw_writer": "load_job",
+    "stream_responses": False,
+    "stream_batch_rows": 50000,
+    "retry_attempts": 4,
+    "retry_base_seconds": 1.0,
+    "retry_max_backoff_seconds": 30,
+    "retry_budget_seconds": 300,
+    "circuit_failure_threshold": 5,
+    "circuit_reset_seconds": 60,
+    "incremental_fetch": True,
+    "backfill_max_workers": 4,
+    "compact_dtypes": False,
+    "log_level": "INFO",
+    "log_buffer_size": 50,
+    "log_rate_limit_seconds": 10,
+    "log_rate_limit_burst": 5,
+    "span_info_seconds": 1.0,
 }
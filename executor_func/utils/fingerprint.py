@@ -0,0 +1,131 @@
+# Content fingerprints of the fetched partitions, used to skip days whose data has not changed
+
+from .clients import get_bigquery_client
+from .logger import logger
+import datetime
+import hashlib
+import json
+
+
+def compute_fingerprint(rows):
+    """
+    Computes a fingerprint of a FASS API payload that does not depend on the order of its rows.
+
+    Every row is serialized with sorted keys and hashed, and the row hashes are summed, so the
+    same rows returned in a different order give the same fingerprint.
+
+    Args:
+        rows (list): The rows returned by the FASS API.
+
+    Returns:
+        str: The hexadecimal fingerprint.
+    """
+    total = 0
+    for row in rows:
+        digest = hashlib.sha256(json.dumps(row, sort_keys=True, default=str).encode()).digest()
+        total = (total + int.from_bytes(digest, "big")) % 2**256
+    return f"{len(rows)}-{total:064x}"
+
+
+class FingerprintStore:
+    """
+    Fingerprints of the loaded (day, platform) partitions, kept in a BigQuery table next to fass_day.
+
+    Args:
+        table_id (str): The ID of the fingerprint table (reportDay DATE, platform STRING,
+            fingerprint STRING, updatedAt TIMESTAMP).
+        client (google.cloud.bigquery.Client): The client to use. Defaults to the shared client.
+    """
+
+    def __init__(self, table_id, client=None):
+        self.table_id = table_id
+        self.client = client
+
+    def _client(self):
+        if self.client is None:
+            self.client = get_bigquery_client()
+        return self.client
+
+    def get(self, start_date, end_date=None):
+        """
+        Returns the fingerprints of the last loaded partitions of a reporting window.
+
+        Args:
+            start_date (str): The first day, in YYYY-MM-DD format.
+            end_date (str): The last day, in YYYY-MM-DD format. Defaults to start_date.
+
+        Returns:
+            dict: A mapping of report day to a mapping of platform to fingerprint.
+                Empty if the table does not exist yet.
+        """
+        from google.api_core.exceptions import NotFound
+        from google.cloud import bigquery
+
+        query = f"""SELECT reportDay, platform, fingerprint
+                    FROM `{self.table_id}`
+                    WHERE reportDay BETWEEN @start_date AND @end_date
+        """
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ScalarQueryParameter(
+                    "start_date", "DATE", datetime.date.fromisoformat(start_date)
+                ),
+                bigquery.ScalarQueryParameter(
+                    "end_date", "DATE", datetime.date.fromisoformat(end_date or start_date)
+                ),
+            ]
+        )
+        try:
+            rows = self._client().query(query, job_config=job_config).result()
+        except NotFound:
+            logger.warning(f"Fingerprint table {self.table_id} not found")
+            return {}
+        fingerprints = {}
+        for row in rows:
+            fingerprints.setdefault(str(row["reportDay"]), {})[row["platform"]] = row["fingerprint"]
+        return fingerprints
+
+    def upsert(self, entries, datetime_now):
+        """
+        Records the fingerprints of loaded partitions in a single MERGE job.
+
+        Args:
+            entries (list): A list of (report_day, platform, fingerprint) tuples.
+            datetime_now (str): The current datetime.
+
+        Returns:
+            None
+        """
+        if not entries:
+            return
+        from google.cloud import bigquery
+
+        query = f"""MERGE `{self.table_id}` T
+                    USING UNNEST(@entries) S
+                    ON T.reportDay = S.reportDay AND T.platform = S.platform
+                    WHEN MATCHED THEN
+                        UPDATE SET fingerprint = S.fingerprint, updatedAt = @updated_at
+                    WHEN NOT MATCHED THEN
+                        INSERT (reportDay, platform, fingerprint, updatedAt)
+                        VALUES (S.reportDay, S.platform, S.fingerprint, @updated_at)
+        """
+        structs = [
+            bigquery.StructQueryParameter(
+                None,
+                bigquery.ScalarQueryParameter(
+                    "reportDay", "DATE", datetime.date.fromisoformat(report_day)
+                ),
+                bigquery.ScalarQueryParameter("platform", "STRING", platform),
+                bigquery.ScalarQueryParameter("fingerprint", "STRING", fingerprint),
+            )
+            for report_day, platform, fingerprint in entries
+        ]
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ArrayQueryParameter("entries", "STRUCT", structs),
+                bigquery.ScalarQueryParameter(
+                    "updated_at", "TIMESTAMP", datetime.datetime.fromisoformat(datetime_now)
+                ),
+            ]
+        )
+        self._client().query(query, job_config=job_config).result()
@@ -0,0 +1,97 @@
+# Writers loading the staged raw data from GCS to the BigQuery raw table
+
+from .clients import get_bigquery_client
+from .configs import config
+from .read import iter_temp_df_chunks
+from .schema import RAW_SCHEMA
+from .staging import get_staging_format_for
+from .logger import logger
+from .write import write_raw_to_bq
+
+
+def get_raw_schema():
+    """
+    Builds the BigQuery schema of the raw table from the precompiled raw schema.
+
+    Returns:
+        list: A list of bigquery.SchemaField, in table column order.
+    """
+    from google.cloud import bigquery
+
+    return [bigquery.SchemaField(name, bq_type) for name, bq_type in RAW_SCHEMA.bq_fields()]
+
+
+class PandasRawWriter:
+    """Reads the staged files into pandas and appends them through pandas_gbq, chunk by chunk."""
+
+    mode = "pandas"
+
+    def write(self, all_files, table_id):
+        for df in iter_temp_df_chunks(all_files):
+            write_raw_to_bq(df, table_id)
+
+
+class LoadJobRawWriter:
+    """
+    Appends the staged files with BigQuery load jobs reading straight from their GCS URIs.
+
+    The data never goes through the executor memory. One load job is issued per staging format.
+
+    Args:
+        client (google.cloud.bigquery.Client): The client to use. Defaults to the shared client.
+    """
+
+    mode = "load_job"
+
+    def __init__(self, client=None):
+        self.client = client
+
+    def write(self, all_files, table_id):
+        from google.cloud import bigquery
+
+        client = self.client or get_bigquery_client()
+        uris_by_extension = {}
+        for temp_file in all_files:
+            extension = get_staging_format_for(temp_file).extension
+            uris_by_extension.setdefault(extension, []).append(f"gs://{temp_file}")
+        for extension, uris in uris_by_extension.items():
+            job_config = bigquery.LoadJobConfig(
+                schema=get_raw_schema(),
+                write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+            )
+            if extension == "csv":
+                job_config.source_format = bigquery.SourceFormat.CSV
+                job_config.skip_leading_rows = 1
+            else:
+                job_config.source_format = bigquery.SourceFormat.PARQUET
+            logger.info(f"Loading {len(uris)} {extension} files to {table_id}")
+            try:
+                client.load_table_from_uri(uris, table_id, job_config=job_config).result()
+            except Exception as e:
+                raise RuntimeError(f"Failed data writing: {e}")
+
+
+RAW_WRITERS = {
+    PandasRawWriter.mode: PandasRawWriter,
+    LoadJobRawWriter.mode: LoadJobRawWriter,
+}
+
+
+def get_raw_writer(mode=None, **kwargs):
+    """
+    Returns the writer loading staged files to the raw table.
+
+    Args:
+        mode (str): "load_job" or "pandas". Defaults to config["raw_writer"].
+        **kwargs: Arguments passed to the writer, e.g. `client` for "load_job".
+
+    Returns:
+        The raw writer.
+
+    Raises:
+        ValueError: If the mode is not supported.
+    """
+    mode = mode or config["raw_writer"]
+    if mode not in RAW_WRITERS:
+        raise ValueError(f"Raw writer not supported: {mode}")
+    return RAW_WRITERS[mode](**kwargs)
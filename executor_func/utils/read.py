@@ -1,9 +1,21 @@
 from .configs import config
-from .write import write_log
+from .logger import logger
+from .completion import CompletionTracker, GCSStore
+from .staging import get_staging_format, get_staging_format_for
+from .schema import COMPACT_RAW_SCHEMA, RAW_SCHEMA
+from .retry import CircuitOpenError, get_with_retries
+from .tracing import span
+import datetime
+import itertools
 import requests
-import pandas as pd
 import time
-from google.cloud import storage
+from requests.adapters import HTTPAdapter
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+_session = None
+_session_lock = threading.Lock()
 
 
 def get_bq_dataset(function_name):
@@ -27,76 +39,191 @@ def get_bq_dataset(function_name):
         raise ValueError("Unable to infer DEV or PROD from function name")
 
 
-def get_with_url(url):
+def get_session():
+    """
+    Returns the process-wide HTTP session used to call the FASS API.
+
+    The session is created on first use and kept alive across warm invocations,
+    so consecutive requests to the same host reuse pooled keep-alive connections.
+
+    Returns:
+        requests.Session: The shared HTTP session.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=config["http_pool_maxsize"],
+                    pool_maxsize=config["http_pool_maxsize"],
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def _request_timeout():
+    """Returns the (connect, read) timeout of a call to the FASS API. The read timeout bounds the
+    wait for each chunk of the body, not the whole download."""
+    return (config["connect_timeout_seconds"], config["read_timeout_seconds"])
+
+
+def get_with_url(url, session=None):
     """
     Fetches data from a specified URL using an FASS API key and returns the data as a list of rows.
 
     Args:
         url (str): The URL to fetch data from.
+        session (requests.Session): The HTTP session to use. Defaults to the shared session.
 
     Returns:
-        list: A list of rows containing the fetched data.
+        list: A list of rows containing the fetched data, or an empty list if the request failed.
+
+    Notes:
+        - Timeouts, connection errors, 429 and 5xx responses are retried with exponential backoff
+          and jitter, honoring Retry-After (see utils.retry).
+        - Calls to a host whose circuit is open fail fast without reaching the network.
+    """
+    session = session or get_session()
+    with span("get_with_url", rows=0, bytes=0) as trace:
+        try:
+            response = get_with_retries(session, url, timeout=_request_timeout())
+            response.raise_for_status()
+            rows = response.json()
+            trace.set(rows=len(rows), bytes=len(response.content))
+            return rows
+        except requests.exceptions.HTTPError as http_err:
+            logger.warning(f"HTTP error occurred: {http_err}", response.text, rate_key="HTTP error occurred")
+        except requests.exceptions.Timeout:
+            logger.warning("Executor timeout")
+        except requests.exceptions.RequestException as req_err:
+            logger.warning(f"Request exception occurred: {req_err}", rate_key="Request exception occurred")
+        except CircuitOpenError as circuit_err:
+            logger.warning(f"{circuit_err}. Skipping request", rate_key="Circuit open")
+        trace.set(failed_calls=1)
+        return []
+
+
+def iter_record_batches(url, batch_rows=None, session=None):
+    """
+    Streams the rows returned by a URL in fixed-size batches.
+
+    The response body is parsed incrementally, so only one batch of rows is held in
+    memory at a time, whatever the size of the response.
+
+    Args:
+        url (str): The URL to fetch data from.
+        batch_rows (int): The number of rows per batch. Defaults to config["stream_batch_rows"].
+        session (requests.Session): The HTTP session to use. Defaults to the shared session.
+
+    Yields:
+        list: A batch of at most `batch_rows` rows.
 
     Raises:
-        RuntimeError: If the request returns a status code other than 200 or if an exception occurs during the request.
+        requests.exceptions.RequestException: If the request fails, returns an error status, or
+            its body is cut off or malformed while it is streamed.
+        CircuitOpenError: If the circuit of the host is open.
     """
-    try:
-        response = requests.get(
-            url, timeout=config["timeout_limit_seconds"]
-        )
+    import ijson
+    import urllib3
+
+    batch_rows = batch_rows or config["stream_batch_rows"]
+    session = session or get_session()
+    response = get_with_retries(session, url, timeout=_request_timeout(), stream=True)
+    with response:
         response.raise_for_status()
-        return response.json()
-    except requests.exceptions.HTTPError as http_err:
-        print(
-            write_log(
-                f"HTTP error occurred: {http_err}",
-                details=response.text,
-                severity="WARNING",
-            )
-        )
-    except requests.exceptions.Timeout:
-        print(write_log("Executor timeout", severity="WARNING"))
-    except requests.exceptions.RequestException as req_err:
-        print(write_log(f"Request exception occurred: {req_err}", severity="WARNING"))
-    return []
+        response.raw.decode_content = True
+        rows = ijson.items(response.raw, "item", use_float=True)
+        while True:
+            try:
+                batch = list(itertools.islice(rows, batch_rows))
+            except (ijson.JSONError, urllib3.exceptions.HTTPError) as err:
+                # errors of the body surface from the parser, past the checks of requests
+                raise requests.exceptions.RequestException(f"Failed to stream {url}: {err!r}") from err
+            if not batch:
+                return
+            yield batch
+
+
+def fetch_platforms(url, platforms, max_workers=None, session=None):
+    """
+    Fetches data for several platforms at once over a shared HTTP session.
 
+    Args:
+        url (str): The base report URL, without the platform parameter.
+        platforms (list): The platforms to fetch (e.g. ["ios", "android"]).
+        max_workers (int): The maximum number of concurrent requests. Defaults to config["fetch_max_workers"].
+        session (requests.Session): The HTTP session to use. Defaults to the shared session.
 
-def _to_camel_case(snake_str):
+    Returns:
+        dict: A mapping of platform to the list of rows returned for it.
+    """
+    if not platforms:
+        return {}
+    session = session or get_session()
+    max_workers = min(len(platforms), max_workers or config["fetch_max_workers"])
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            platform: pool.submit(get_with_url, f"{url}&platform={platform}", session)
+            for platform in platforms
+        }
+        return {platform: future.result() for platform, future in futures.items()}
+
+
+def clean_raw_data(data, datetime_now, schema=None, compact=None):
     """
-    Converts a snake_case string to camelCase.
+    Cleans and processes raw data from the input source.
 
     Args:
-        snake_str (str): The snake_case string to convert.
+        data: The raw data to be cleaned and processed.
+        datetime_now (str): The current datetime.
+        schema (RawSchema): The precompiled raw table schema. Defaults to the one built from config.
+        compact (bool): Whether to build a compact frame with categoricals and int32 counts, when
+            no schema is given. Defaults to config["compact_dtypes"].
 
     Returns:
-        str: The converted camelCase string.
+        pandas DataFrame: The cleaned and processed raw data with added reportDay and createdAt columns.
+    """
+    if schema is None:
+        if compact is None:
+            compact = config["compact_dtypes"]
+        schema = COMPACT_RAW_SCHEMA if compact else RAW_SCHEMA
+    return schema.build_frame(data, datetime_now)
+
+
+def get_report_days(start_date, end_date=None):
+    """
+    Lists the days of a reporting window.
+
+    Args:
+        start_date (str): The first day, in YYYY-MM-DD format.
+        end_date (str): The last day, in YYYY-MM-DD format. Defaults to start_date.
 
-    Example:
-        >>> _to_camel_case("snake_case_string")
-        'snakeCaseString'
+    Returns:
+        list: The days of the window, in YYYY-MM-DD format.
     """
-    camel_string = "".join(x.capitalize() for x in snake_str.lower().split("_"))
-    return snake_str[0].lower() + camel_string[1:]
+    first_day = datetime.date.fromisoformat(start_date)
+    last_day = datetime.date.fromisoformat(end_date or start_date)
+    return [str(first_day + datetime.timedelta(days=i)) for i in range((last_day - first_day).days + 1)]
 
 
-def clean_raw_data(data, datetime_now):
+def split_by_day(rows, report_days):
     """
-    Cleans and processes raw data from the input source.
+    Splits the rows of a ranged FASS API response into per-day partitions.
 
     Args:
-        data: The raw data to be cleaned and processed.
-        datetime_now (str): The current datetime.
+        rows (list): The rows returned by the FASS API, each with a start_date.
+        report_days (list): The days of the reporting window, in YYYY-MM-DD format.
 
     Returns:
-        pandas DataFrame: The cleaned and processed raw data with added reportDay and createdAt columns.
+        dict: A mapping of every report day to its rows, empty for days without data.
     """
-    df_raw = pd.DataFrame(data)
-    df_raw = df_raw.astype({col: "int64" for col in config["integer_cols"]})
-    df_raw = df_raw.astype({col: "float64" for col in config["float_cols"]})
-    df_raw = df_raw[config["ordered_columns"]]
-    df_raw.columns = [_to_camel_case(col) for col in df_raw.columns]
-    df_raw["createdAt"] = pd.to_datetime(datetime_now)
-    return df_raw
+    rows_by_day = {report_day: [] for report_day in report_days}
+    for row in rows:
+        rows_by_day.setdefault(row["start_date"], []).append(row)
+    return rows_by_day
 
 
 def get_bq_tables(dataset_name):
@@ -115,7 +242,20 @@ def get_bq_tables(dataset_name):
     return (table_raw_id, table_day_id)
 
 
-def get_temp_prefix(bucket_name, start_date, platform):
+def get_bq_fingerprint_table(dataset_name):
+    """
+    Gets the ID of the table holding the fingerprints of the loaded partitions.
+
+    Args:
+        dataset_name (str): The name of the dataset.
+
+    Returns:
+        str: The ID of the fingerprint table.
+    """
+    return f"{config['project_id']}.{dataset_name}.{config['table_fingerprint_name']}"
+
+
+def get_temp_prefix(bucket_name, start_date, platform, staging_format=None, run_prefix="temp_data"):
     """
     Generate a GCS file name for temporary storage of raw data.
 
@@ -123,63 +263,159 @@ def get_temp_prefix(bucket_name, start_date, platform):
         bucket_name (str): The name of the GCS bucket to store the file in.
         start_date (str): The date of the data being stored, in YYYY-MM-DD format.
         platform (str): The platform of the data (ios or android).
+        staging_format (str): The staging file format. Defaults to config["staging_format"].
+        run_prefix (str): The staging prefix of the run. Defaults to "temp_data".
 
     Returns:
         str: The GCS file name.
     """
-    return f'{bucket_name}/temp_data/{platform}/fass_data_{start_date.replace("-","_")}.csv'
+    extension = get_staging_format(staging_format).extension
+    return f'{bucket_name}/{run_prefix}/{platform}/fass_data_{start_date.replace("-","_")}.{extension}'
+
+
+def get_completion_deadline_seconds(started_at, clock=time.monotonic):
+    """
+    Returns the time left to wait for the staged partitions, so the executor still loads them and
+    marks the run finished before its function times out.
 
+    Args:
+        started_at (float): The clock time at which the invocation started.
+        clock (callable): The monotonic clock to use.
 
-def get_all_temp_files(bucket_name, scheduler_id):
+    Returns:
+        float: The number of seconds left, zero if none.
     """
-    Retrieve all temporary files from GCS, waiting until all files are present.
+    deadline = started_at + config["function_timeout_seconds"] - config["timeout_margin_seconds"]
+    return max(0.0, deadline - clock())
+
+
+def get_all_temp_files(bucket_name, scheduler_id, tracker=None, started_at=None):
+    """
+    Retrieve all temporary files from GCS, waiting until all partitions are staged.
 
     Args:
         bucket_name (str): The name of the GCS bucket to retrieve files from.
-        scheduler_id (str): The ID of the scheduler that generated the files ("7d" or "1m").
+        scheduler_id (str): The ID of the scheduler that generated the files ("2h", "7d" or "1m").
+        tracker (CompletionTracker): The completion tracker of the run. Defaults to one on the GCS bucket.
+        started_at (float): The time.monotonic() at which the invocation started. Defaults to now.
 
     Returns:
         list: A list of all temporary file names.
+
+    Raises:
+        TimeoutError: If not all partitions are staged within get_completion_deadline_seconds().
+    """
+    tracker = tracker or CompletionTracker(GCSStore(bucket_name))
+    expected_num_files = tracker.expected()
+    if expected_num_files is None:
+        # each Scheduler generates one file per (day, platform)
+        if scheduler_id == "2h":
+            # the 2h Scheduler covers 5 days
+            days = 5
+        if scheduler_id == "7d":
+            # the 7d Scheduler covers 14 days
+            days = 14
+        if scheduler_id == "1m":
+            # the 1m Scheduler covers 30 days
+            days = 30
+        expected_num_files = days * len(config["platforms"])
+    logger.info(f"Waiting for {expected_num_files} files in GCS bucket")
+    staged = tracker.wait_until_staged(
+        expected_num_files,
+        get_completion_deadline_seconds(time.monotonic() if started_at is None else started_at),
+        config["completion_poll_seconds"],
+    )
+    logger.info(f"Found {len(staged)} staged files in GCS bucket")
+    return [f"{bucket_name}/{path}" for path in staged]
+
+
+def _read_temp_file(temp_file):
+    return get_staging_format_for(temp_file).read(f"gs://{temp_file}")
+
+
+def _iter_temp_files(all_files, max_workers=None):
     """
-    client = storage.Client()
-    if scheduler_id == "2h":
-        # the 2h Scheduler should generate 5 (days) * 2 (platforms) files
-        expected_num_files = 10
-    if scheduler_id == "7d":
-        # the 7d Scheduler should generate 14 (days) * 2 (platforms) files
-        expected_num_files = 28
-    if scheduler_id == "1m":
-        # the 1m Scheduler should generate 30 (days) * 2 (platforms) files
-        expected_num_files = 60
-    while True:
-        all_files = [
-            f"{bucket_name}/{blob.name}"
-            for blob in client.list_blobs(bucket_name, prefix="temp_data")
-        ]
-        print(
-            write_log(
-                f"Expected {expected_num_files} files, found {len(all_files)} files in GCS bucket"
-            )
+    Reads temporary files from GCS concurrently and yields them as DataFrames, in order.
+
+    At most `max_workers` files are read ahead of the consumer, so memory stays bounded
+    by the window of in-flight files rather than by the whole list.
+
+    Args:
+        all_files (list): A list of the names of the temporary files to read.
+        max_workers (int): The number of concurrent reads. Defaults to config["load_max_workers"].
+
+    Yields:
+        pandas DataFrame: The content of each temporary file.
+    """
+    max_workers = max_workers or config["load_max_workers"]
+    files = iter(all_files)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = deque(
+            pool.submit(_read_temp_file, temp_file)
+            for temp_file in itertools.islice(files, max_workers)
         )
-        if len(all_files) == expected_num_files:
-            break
-        time.sleep(30)
-    return all_files
+        while pending:
+            df = pending.popleft().result()
+            next_file = next(files, None)
+            if next_file is not None:
+                pending.append(pool.submit(_read_temp_file, next_file))
+            yield df
+
+
+def _concat_frames(dfs, **kwargs):
+    """
+    Concatenates DataFrames, keeping categorical columns categorical. Compact staged files each
+    have their own categories, which pd.concat alone would turn back into object columns.
+    """
+    import pandas as pd
+    from pandas.api.types import union_categoricals
 
+    for name, dtype in dfs[0].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype) and len(dfs) > 1:
+            categories = union_categoricals([df[name] for df in dfs]).categories
+            for df in dfs:
+                df[name] = df[name].cat.set_categories(categories)
+    return pd.concat(dfs, **kwargs)
 
-def get_temp_df(all_files):
+
+def iter_temp_df_chunks(all_files, chunk_rows=None, max_workers=None):
+    """
+    Reads all temporary files stored in GCS and yields them in chunks of bounded size.
+
+    Args:
+        all_files (list): A list of the names of all files in the GCS bucket with the prefix "temp_data".
+        chunk_rows (int): The number of rows after which a chunk is yielded. Defaults to config["load_chunk_rows"].
+        max_workers (int): The number of concurrent reads. Defaults to config["load_max_workers"].
+
+    Yields:
+        pandas DataFrame: The concatenated content of a group of temporary files.
+    """
+    chunk_rows = chunk_rows or config["load_chunk_rows"]
+    dfs = []
+    num_rows = 0
+    for df in _iter_temp_files(all_files, max_workers):
+        dfs.append(df)
+        num_rows += len(df)
+        if num_rows >= chunk_rows:
+            yield _concat_frames(dfs, ignore_index=True)
+            dfs = []
+            num_rows = 0
+    if dfs:
+        yield _concat_frames(dfs, ignore_index=True)
+
+
+def get_temp_df(all_files, max_workers=None):
     """
     Reads all temporary files stored in GCS and concatenates them into a single DataFrame.
 
     Args:
         all_files (list): A list of the names of all files in the GCS bucket with the prefix "temp_data".
+        max_workers (int): The number of concurrent reads. Defaults to config["load_max_workers"].
 
     Returns:
         pandas DataFrame: The concatenated DataFrame containing all data from the temporary files.
     """
-    dfs = []
-    for temp_file in all_files:
-        dfs.append(pd.read_csv(f"gs://{temp_file}"))
-    df_raw = pd.concat(dfs)
-    df_raw["createdAt"] = pd.to_datetime(df_raw["createdAt"])
-    return df_raw
+    with span("get_temp_df", files=len(all_files)) as trace:
+        df = _concat_frames(list(_iter_temp_files(all_files, max_workers)))
+        trace.set(rows=len(df))
+    return df
@@ -0,0 +1,230 @@
+# Retries with backoff and per-host circuit breaking for calls to the FASS API
+
+from .configs import config
+from .logger import logger
+import email.utils
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a call is refused because the circuit of its host is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a host after consecutive failures, then lets a single trial call through
+    once `reset_seconds` have passed.
+
+    Args:
+        failure_threshold (int): The consecutive failures that open the circuit.
+        reset_seconds (float): The time the circuit stays open before a trial call.
+        clock (callable): The monotonic clock to use.
+    """
+
+    def __init__(self, failure_threshold, reset_seconds, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        """The circuit state: "closed", "open" or "half_open"."""
+        with self.lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """Returns True if a call may go through."""
+        with self.lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        """Closes the circuit."""
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        """Counts a failure, opening the circuit at the threshold or after a failed trial call."""
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self.trial_running = False
+
+
+def get_circuit_breaker(url):
+    """
+    Returns the process-wide circuit breaker of the host of a URL.
+
+    Args:
+        url (str): The URL being called.
+
+    Returns:
+        CircuitBreaker: The circuit breaker of the host.
+    """
+    host = urlsplit(url).netloc
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(
+                config["circuit_failure_threshold"], config["circuit_reset_seconds"]
+            )
+        return _breakers[host]
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter, honoring Retry-After when the server sends it.
+
+    Args:
+        attempts (int): The maximum number of attempts, the first one included.
+        base_seconds (float): The backoff of the first retry, before jitter.
+        max_backoff_seconds (float): The cap on any single wait, Retry-After included.
+        budget_seconds (float): The time after which no retry starts, so a call fails well
+            before the function timeout. Defaults to config["retry_budget_seconds"].
+        sleep (callable): The function used to wait.
+        rng (random.Random): The random generator used for jitter.
+        clock (callable): The monotonic clock the budget is measured with.
+    """
+
+    def __init__(
+        self,
+        attempts=None,
+        base_seconds=None,
+        max_backoff_seconds=None,
+        budget_seconds=None,
+        sleep=time.sleep,
+        rng=random,
+        clock=time.monotonic,
+    ):
+        self.attempts = attempts or config["retry_attempts"]
+        self.base_seconds = config["retry_base_seconds"] if base_seconds is None else base_seconds
+        self.max_backoff_seconds = max_backoff_seconds or config["retry_max_backoff_seconds"]
+        self.budget_seconds = budget_seconds or config["retry_budget_seconds"]
+        self.sleep = sleep
+        self.rng = rng
+        self.clock = clock
+
+    def backoff(self, attempt, response=None):
+        """
+        Returns the time to wait after a failed attempt.
+
+        Args:
+            attempt (int): The index of the failed attempt, starting at 0.
+            response (requests.Response): The response of the failed attempt, if any.
+
+        Returns:
+            float: The number of seconds to wait.
+        """
+        retry_after = _retry_after_seconds(response) if response is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff_seconds)
+        return self.rng.uniform(0, min(self.max_backoff_seconds, self.base_seconds * 2 ** attempt))
+
+
+def _retry_after_seconds(response):
+    """
+    Parses the Retry-After header of a response, given either in seconds or as an HTTP date.
+
+    Args:
+        response (requests.Response): The response to read the header from.
+
+    Returns:
+        float: The number of seconds to wait, or None if the header is missing or invalid.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def get_with_retries(session, url, policy=None, breaker=None, **kwargs):
+    """
+    Sends a GET request, retrying timeouts, connection errors, 429 and 5xx responses.
+
+    Args:
+        session (requests.Session): The HTTP session to use.
+        url (str): The URL to fetch.
+        policy (RetryPolicy): The retry policy. Defaults to one built from config.
+        breaker (CircuitBreaker): The circuit breaker. Defaults to the one of the URL host.
+        **kwargs: Arguments passed to `session.get`.
+
+    Returns:
+        requests.Response: The first non-retryable response, or the last response once the attempts
+            or the retry budget run out.
+
+    Raises:
+        CircuitOpenError: If the circuit of the host is open.
+        requests.exceptions.RequestException: If the last attempt failed without a response.
+    """
+    policy = policy or RetryPolicy()
+    breaker = breaker or get_circuit_breaker(url)
+    deadline = policy.clock() + policy.budget_seconds
+    for attempt in range(policy.attempts):
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {urlsplit(url).netloc}")
+        response = None
+        try:
+            response = session.get(url, **kwargs)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as err:
+            breaker.record_failure()
+            error = err
+            reason = str(err)
+        except BaseException:
+            # any other error fails the call too, and ends a half-open trial call that would
+            # otherwise keep the circuit refusing calls for the rest of the process
+            breaker.record_failure()
+            raise
+        else:
+            if response.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            reason = f"HTTP {response.status_code}"
+        wait_seconds = policy.backoff(attempt, response)
+        if attempt == policy.attempts - 1 or policy.clock() + wait_seconds > deadline:
+            # out of attempts or of time, so report the last failure
+            if response is None:
+                raise error
+            return response
+        if response is not None:
+            response.close()
+        logger.warning(
+            f"Retrying in {wait_seconds:.1f}s after attempt {attempt + 1}: {reason}",
+            rate_key="Retrying request",
+        )
+        policy.sleep(wait_seconds)
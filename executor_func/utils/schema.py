@@ -0,0 +1,131 @@
+# Precompiled schema of the raw FASS data, built once from the configuration
+
+from .configs import config
+from .logger import logger
+from operator import itemgetter
+
+
+def _to_camel_case(snake_str):
+    """
+    Converts a snake_case string to camelCase.
+
+    Args:
+        snake_str (str): The snake_case string to convert.
+
+    Returns:
+        str: The converted camelCase string.
+
+    Example:
+        >>> _to_camel_case("snake_case_string")
+        'snakeCaseString'
+    """
+    camel_string = "".join(x.capitalize() for x in snake_str.lower().split("_"))
+    return snake_str[0].lower() + camel_string[1:]
+
+
+class RawColumn:
+    """
+    A column of the raw table.
+
+    Args:
+        source (str): The snake_case field name in the FASS API payload.
+        dtype (str): The pandas dtype of the column, "category" for dictionary-encoded strings,
+            or None to keep the values as they come.
+        bq_type (str): The BigQuery type of the column.
+    """
+
+    def __init__(self, source, dtype, bq_type):
+        self.source = source
+        self.name = _to_camel_case(source)
+        self.dtype = dtype
+        self.bq_type = bq_type
+        self.getter = itemgetter(source)
+
+    def build_array(self, data):
+        """Builds the Arrow array of the column from the FASS API payload."""
+        import numpy as np
+        import pyarrow as pa
+
+        if self.dtype is None:
+            return pa.array(list(map(self.getter, data)), type=pa.string())
+        if self.dtype == "category":
+            return pa.array(list(map(self.getter, data)), type=pa.string()).dictionary_encode()
+        dtype = np.dtype(self.dtype)
+        if dtype.kind != "i":
+            return pa.array(np.fromiter(map(self.getter, data), dtype=dtype, count=len(data)))
+        # check the range before downcasting, as numpy 1.x silently wraps out-of-range integers
+        values = np.fromiter(map(self.getter, data), dtype="int64", count=len(data))
+        info = np.iinfo(dtype)
+        if len(values) and (values.min() < info.min or values.max() > info.max):
+            # a compact int32 column with values out of range keeps the default int64
+            logger.warning(f"{self.name} does not fit in {self.dtype}, using int64", rate_key="Compact dtype overflow")
+            return pa.array(values)
+        return pa.array(values.astype(dtype))
+
+
+class RawSchema:
+    """
+    The camelCase names, dtypes and order of the raw table columns.
+
+    The compact variant builds frames taking a fraction of the memory: the strings of
+    config["category_cols"] become categoricals and the counts int32, which covers any
+    realistic count. The BigQuery types are the same, as a load job widens Parquet INT32 to
+    INT64 and reads dictionary-encoded strings as STRING.
+
+    Args:
+        config (dict): The configuration holding "ordered_columns", "integer_cols", "float_cols"
+            and "category_cols".
+        compact (bool): Whether to build compact frames.
+    """
+
+    def __init__(self, config, compact=False):
+        self.compact = compact
+        self.columns = []
+        for col in config["ordered_columns"]:
+            if col in config["integer_cols"]:
+                self.columns.append(RawColumn(col, "int32" if compact else "int64", "INT64"))
+            elif col in config["float_cols"]:
+                self.columns.append(RawColumn(col, "float64", "FLOAT64"))
+            elif compact and col in config["category_cols"]:
+                self.columns.append(RawColumn(col, "category", "STRING"))
+            else:
+                self.columns.append(RawColumn(col, None, "STRING"))
+
+    @property
+    def names(self):
+        """The column names of the raw table, createdAt included."""
+        return [column.name for column in self.columns] + ["createdAt"]
+
+    def bq_fields(self):
+        """
+        Returns the BigQuery name and type of every column of the raw table.
+
+        Returns:
+            list: A list of (name, type) tuples, in table column order.
+        """
+        return [(column.name, column.bq_type) for column in self.columns] + [
+            ("createdAt", "TIMESTAMP")
+        ]
+
+    def build_frame(self, data, datetime_now):
+        """
+        Builds the cleaned DataFrame from the FASS API payload in a single column-oriented pass.
+
+        Args:
+            data (list): The rows returned by the FASS API.
+            datetime_now (str): The current datetime.
+
+        Returns:
+            pandas DataFrame: The cleaned data with camelCase columns, typed values and a createdAt column.
+        """
+        import pandas as pd
+        import pyarrow as pa
+
+        arrays = [column.build_array(data) for column in self.columns]
+        df_raw = pa.Table.from_arrays(arrays, names=self.names[:-1]).to_pandas()
+        df_raw["createdAt"] = pd.to_datetime(datetime_now)
+        return df_raw
+
+
+RAW_SCHEMA = RawSchema(config)
+COMPACT_RAW_SCHEMA = RawSchema(config, compact=True)
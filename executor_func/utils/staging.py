@@ -0,0 +1,188 @@
+# File formats used to stage raw data in GCS between the executors and the batch load
+
+from .configs import config
+import contextlib
+
+
+class _BatchWriter:
+    """
+    Appends DataFrames to a single staged file, opened on the first write.
+
+    Args:
+        path (str): The path of the staged file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.num_rows = 0
+        self.stack = contextlib.ExitStack()
+        self.opened = False
+
+    def write(self, df):
+        if not self.opened:
+            self._open()
+            self.opened = True
+        self._write(df)
+        self.num_rows += len(df)
+
+    def close(self):
+        self.stack.close()
+
+    def discard(self):
+        """Closes the writer and deletes the file written so far, e.g. after a failed stream."""
+        self.close()
+        if self.opened:
+            import fsspec
+
+            fs, path = fsspec.core.url_to_fs(self.path)
+            fs.rm(path)
+            self.opened = False
+        self.num_rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _CsvBatchWriter(_BatchWriter):
+    def _open(self):
+        import fsspec
+
+        self.f = self.stack.enter_context(fsspec.open(self.path, "w"))
+
+    def _write(self, df):
+        df.to_csv(self.f, header=self.num_rows == 0, index=False)
+
+
+def _to_arrow(df):
+    """
+    Converts a DataFrame to an Arrow table whose schema does not depend on the batch, so every
+    batch of a file shares the schema of the first one: categorical codes are as narrow as the
+    categories of the batch allow, so their indices are widened to int32, and compact int32
+    counts are widened to int64, the type of the raw table, as a later batch may not fit in int32.
+    """
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    def _file_type(field_type):
+        if pa.types.is_dictionary(field_type):
+            return pa.dictionary(pa.int32(), field_type.value_type)
+        if pa.types.is_int32(field_type):
+            return pa.int64()
+        return field_type
+
+    schema = pa.schema(
+        [field.with_type(_file_type(field.type)) for field in table.schema],
+        metadata=table.schema.metadata,
+    )
+    if schema.equals(table.schema):
+        return table
+    return table.cast(schema)
+
+
+class _ParquetBatchWriter(_BatchWriter):
+    def _open(self):
+        import fsspec
+
+        self.f = self.stack.enter_context(fsspec.open(self.path, "wb"))
+        self.writer = None
+
+    def _write(self, df):
+        import pyarrow.parquet as pq
+
+        table = _to_arrow(df)
+        if self.writer is None:
+            self.writer = self.stack.enter_context(pq.ParquetWriter(self.f, table.schema))
+        self.writer.write_table(table)
+
+
+class _StagingFormat:
+    def open_writer(self, path):
+        """Returns a writer appending DataFrames to a single file, opened on the first write."""
+        return self.batch_writer(path)
+
+    def write_batches(self, dfs, path):
+        """Writes DataFrames one after the other to a single file, opened on the first one. Returns the number of rows."""
+        with self.open_writer(path) as writer:
+            for df in dfs:
+                writer.write(df)
+        return writer.num_rows
+
+
+class CsvFormat(_StagingFormat):
+    """Stages data as CSV. Types are lost on write, so createdAt is parsed again on read."""
+
+    extension = "csv"
+    batch_writer = _CsvBatchWriter
+
+    def write(self, df, path):
+        df.to_csv(path, index=False)
+
+    def read(self, path):
+        import pandas as pd
+
+        df = pd.read_csv(path)
+        df["createdAt"] = pd.to_datetime(df["createdAt"])
+        return df
+
+
+class ParquetFormat(_StagingFormat):
+    """Stages data as Parquet, keeping the int64/float64/timestamp types set in clean_raw_data."""
+
+    extension = "parquet"
+    batch_writer = _ParquetBatchWriter
+
+    def write(self, df, path):
+        import fsspec
+        import pyarrow.parquet as pq
+
+        # opened through fsspec like the batch writers, as pandas would otherwise hand gs:// paths
+        # to the native GCS filesystem of pyarrow, which resolves credentials on its own
+        with fsspec.open(path, "wb") as f:
+            pq.write_table(_to_arrow(df), f)
+
+    def read(self, path):
+        import pandas as pd
+
+        return pd.read_parquet(path)
+
+
+STAGING_FORMATS = {
+    CsvFormat.extension: CsvFormat(),
+    ParquetFormat.extension: ParquetFormat(),
+}
+
+
+def get_staging_format(name=None):
+    """
+    Returns the staging format with the given name.
+
+    Args:
+        name (str): The name of the format ("csv" or "parquet"). Defaults to config["staging_format"].
+
+    Returns:
+        The staging format.
+
+    Raises:
+        ValueError: If the format is not supported.
+    """
+    name = name or config["staging_format"]
+    if name not in STAGING_FORMATS:
+        raise ValueError(f"Staging format not supported: {name}")
+    return STAGING_FORMATS[name]
+
+
+def get_staging_format_for(path):
+    """
+    Returns the staging format of a staged file, based on its extension.
+
+    Args:
+        path (str): The path of the staged file.
+
+    Returns:
+        The staging format.
+    """
+    return get_staging_format(path.rsplit(".", 1)[-1])
@@ -1,88 +1,85 @@
 from .configs import config
-import json
-from google.cloud import bigquery
-from google.cloud import storage
-import pandas_gbq
+from .clients import get_bigquery_client
+from .tracing import span
+import datetime
 
 
-def write_log(main_msg, details=None, severity="INFO"):
+def write_raw_to_bq(df, table_id):
     """
-    Writes a log message with the given main message, details, and severity level.
+    Writes a pandas DataFrame to a BigQuery table.
 
     Args:
-        main_msg (str): The main message of the log.
-        details (str): Additional details to include in the log.
-        severity (str): The severity level of the log. Must be one of the following: 'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'.
-
-    Returns:
-        str: A JSON string representing the log message.
+        df (pandas.DataFrame): The DataFrame to be written to BigQuery.
+        table_id (str): The ID of the BigQuery table to write to.
 
+    Raises:
+        RuntimeError: If an error occurs while writing to BigQuery.
     """
-    return json.dumps(
-        dict(
-            severity=severity,
-            message=main_msg,
-            custom_property=details,
-        )
-    )
+    import pandas_gbq
 
+    with span("write_raw_to_bq", rows=len(df)):
+        try:
+            pandas_gbq.to_gbq(
+                df, table_id, project_id=config["project_id"], if_exists="append"
+            )
+        except Exception as e:
+            raise RuntimeError(f"Failed data writing: {e}")
 
-def write_raw_to_bq(df, table_id):
+
+def _get_report_days(all_files):
     """
-    Writes a pandas DataFrame to a BigQuery table.
+    Extracts the sorted, distinct report days from the names of the staged files.
 
     Args:
-        df (pandas.DataFrame): The DataFrame to be written to BigQuery.
-        table_id (str): The ID of the BigQuery table to write to.
+        all_files (list): A list of file names in the GCS temp_data directory.
 
-    Raises:
-        RuntimeError: If an error occurs while writing to BigQuery.
+    Returns:
+        list: The report days as datetime.date objects.
     """
-    try:
-        pandas_gbq.to_gbq(
-            df, table_id, project_id=config["project_id"], if_exists="append"
-        )
-    except Exception as e:
-        raise RuntimeError(f"Failed data writing: {e}")
+    report_days = set()
+    for file_name in all_files:
+        start_date = file_name.split("fass_data_")[1].split(".")[0].replace("_", "-")
+        report_days.add(datetime.date.fromisoformat(start_date))
+    return sorted(report_days)
 
 
-def update_day_table(all_files, datetime_now, table_id):
+def update_day_table(all_files, datetime_now, table_id, client=None):
     """
-    Updates the updatedAt field in the fass_day table in BigQuery with the current datetime.
+    Upserts the updatedAt field in the fass_day table in BigQuery with the current datetime.
+
+    All report days are merged in a single parameterized MERGE job, whose completion is awaited.
 
     Args:
         all_files (list): A list of file names in the GCS temp_data directory.
         datetime_now (str): The current datetime.
         table_id (str): The ID of the table to update.
+        client (google.cloud.bigquery.Client): The client to use. Defaults to the shared client.
 
     Returns:
         None
     """
-    client = bigquery.Client()
-    start_dates = []
-    for file_name in all_files:
-        start_date = (
-            file_name.split("fass_data_")[1]
-            .replace(".csv", "")
-            .replace("_", "-")
-        )
-        start_dates.append(f"{start_date}")
-    start_dates = sorted(list(set(start_dates)))
-    for start_date in start_dates:
-        check_query = f"""SELECT reportDay, updatedAt 
-                        FROM {table_id} 
-                        WHERE reportDay = '{start_date}'
-            """
-        rows = client.query(check_query).result()
-        if len(list(rows)) == 0:
-            query = f"""INSERT INTO {table_id}
-                                (reportDay, updatedAt)  
-                                VALUES ('{start_date}', '{datetime_now}')
-            """
-        else:
-            query = f"""UPDATE {table_id}
-                                SET updatedAt = '{datetime_now}'
-                                WHERE reportDay = '{start_date}'
-            """
-        job = client.query(query)
+    report_days = _get_report_days(all_files)
+    if not report_days:
+        return
+    from google.cloud import bigquery
+
+    client = client or get_bigquery_client()
+    query = f"""MERGE `{table_id}` T
+                USING (SELECT reportDay FROM UNNEST(@report_days) AS reportDay) S
+                ON T.reportDay = S.reportDay
+                WHEN MATCHED THEN
+                    UPDATE SET updatedAt = @updated_at
+                WHEN NOT MATCHED THEN
+                    INSERT (reportDay, updatedAt) VALUES (S.reportDay, @updated_at)
+    """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ArrayQueryParameter("report_days", "DATE", report_days),
+            bigquery.ScalarQueryParameter(
+                "updated_at", "TIMESTAMP", datetime.datetime.fromisoformat(datetime_now)
+            ),
+        ]
+    )
+    with span("update_day_table", days=len(report_days)):
+        client.query(query, job_config=job_config).result()
     return
@@ -1,9 +1,23 @@
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 import uvicorn
+import asyncio
+import datetime
+import functools
+import hashlib
+import itertools
+import json
+import math
+import os
 import random
+import threading
+import time
 import faker
+import numpy as np
+import orjson
 
 app = FastAPI()
 fake = faker.Faker()
@@ -29,6 +43,47 @@ AD_NETWORKS = [
     "Smaato",
     "AdYouLike"
 ]
+# Names sampled by the fast mode, generated once so rows never go through faker
+NAME_POOL_SIZE = 1000
+_pool_faker = faker.Faker()
+_pool_faker.seed_instance(0)
+CAMPAIGN_NAMES = np.array([_pool_faker.bs() for _ in range(NAME_POOL_SIZE)], dtype=object)
+CREATIVE_NAMES = np.array([_pool_faker.catch_phrase() for _ in range(NAME_POOL_SIZE)], dtype=object)
+AD_NETWORK_NAMES = np.array(AD_NETWORKS, dtype=object)
+FAST_CHUNK_ROWS = 100_000
+# Responses up to this many rows are rendered once and kept in an LRU cache
+RESPONSE_CACHE_SIZE = 32
+CACHE_MAX_ROWS = 10_000
+# Fault injection profiles, picked with the `profile` query parameter or the FAKE_API_PROFILE env variable.
+#   latency: a distribution of the added delay, in seconds (fixed, uniform, lognormal or exponential)
+#   error_rate / error_statuses: the share of requests failing with a random 5xx status
+#   burst_every / burst_length / burst_status: `burst_length` failing requests every `burst_every` requests
+#   rate_limit_per_second / rate_limit_burst: a token bucket per client, answering 429 when empty
+#   truncate_rate: the share of 200 responses whose body is cut in half
+FAULT_PROFILES = {
+    "none": {},
+    "slow": {"latency": {"distribution": "lognormal", "median": 0.5, "sigma": 0.75}},
+    "flaky": {
+        "latency": {"distribution": "uniform", "low": 0.0, "high": 0.3},
+        "error_rate": 0.2,
+        "error_statuses": [500, 502, 503, 504],
+    },
+    "bursty": {"burst_every": 20, "burst_length": 5, "burst_status": 503},
+    "throttled": {"rate_limit_per_second": 2.0, "rate_limit_burst": 4},
+    "truncated": {"truncate_rate": 0.3},
+    "production": {
+        "latency": {"distribution": "exponential", "mean": 0.2},
+        "error_rate": 0.05,
+        "error_statuses": [500, 503],
+        "rate_limit_per_second": 10.0,
+        "rate_limit_burst": 20,
+        "truncate_rate": 0.02,
+    },
+}
+_fault_rng = random.Random(os.environ.get("FAKE_API_FAULT_SEED"))
+_fault_lock = threading.Lock()
+_request_counters = {}
+_client_buckets = {}
 
 
 class ReportingResponse(BaseModel):
@@ -48,47 +103,281 @@ class ReportingResponse(BaseModel):
     end_date: str
     platform: str
 
+def _fake_row(start_date, end_date, platform, rng=random, fake=fake):
+    # Generate fake data based on the query parameters
+    installs = rng.randint(1000, 10000)
+    clicks = rng.randint(100, 1000)
+    impressions = rng.randint(100, 1000)
+    return dict(
+        installs=installs,
+        ad_spend=rng.uniform(0.01, 1000.00),
+        clicks=clicks,
+        impressions=impressions,
+        click_convertion_rate=(installs / clicks) * 100 if clicks > 0 else 0,
+        click_through_rate=(clicks / impressions) * 100 if impressions > 0 else 0,
+        impressions_convertion_rate=(installs / impressions) * 100 if impressions > 0 else 0,
+        limit_ad_tracking_installs=rng.randint(10, 100),
+        uninstalls=rng.randint(1000, 10000),
+        campaign_name=fake.bs(),
+        creative_name=fake.catch_phrase(),
+        ad_network_name=rng.choice(AD_NETWORKS),
+        start_date=start_date,
+        end_date=end_date,
+        platform=platform,
+    )
+
+
+def _day_seed(day, platform, seed=None):
+    # Every day is seeded on its own, so a day gets the same rows whatever window it is requested in
+    key = f"{day}|{platform}|{'' if seed is None else seed}"
+    return int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], "big")
+
+
+def _rows_per_day(rows, days):
+    # Spread the rows over the days, the first days getting one more when they do not divide evenly
+    per_day, extra = divmod(rows, len(days))
+    return [(day, per_day + (i < extra)) for i, day in enumerate(days)]
+
+
+def _drift_rows(records, drift, seed, offset=0):
+    # Restate the metrics of a fixed fraction of rows, always the same ones for the same day,
+    # and a superset of them for a larger drift
+    if not drift:
+        return records
+    rng = random.Random(f"{seed}-drift-{offset}")
+    order = list(range(len(records)))
+    rng.shuffle(order)
+    for i in order[: round(len(records) * drift)]:
+        row = records[i]
+        row["installs"] = rng.randint(1000, 10000)
+        row["ad_spend"] = rng.uniform(0.01, 1000.00)
+        row["click_convertion_rate"] = row["installs"] / row["clicks"] * 100
+        row["impressions_convertion_rate"] = row["installs"] / row["impressions"] * 100
+    return records
+
+
+def _report_days(start_date, end_date):
+    # Reports are broken down by day, like the Adjust "day" dimension
+    try:
+        first_day = datetime.date.fromisoformat(start_date)
+        last_day = datetime.date.fromisoformat(end_date)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Dates must be in YYYY-MM-DD format")
+    if last_day < first_day:
+        raise HTTPException(status_code=422, detail="end_date is before start_date")
+    return [str(first_day + datetime.timedelta(days=i)) for i in range((last_day - first_day).days + 1)]
+
+
+def _stream_rows(rows, days, platform, seed, drift=0.0, chunk_rows=1000):
+    # Serialize the JSON array chunk by chunk, so large responses never sit in memory.
+    # One faker instance per response, as faker is not safe to reseed across concurrent requests
+    fake = faker.Faker()
+    yield "["
+    separator = ""
+    for day, day_rows in _rows_per_day(rows, days):
+        day_seed = _day_seed(day, platform, seed)
+        rng = random.Random(day_seed)
+        fake.seed_instance(day_seed)
+        for offset in range(0, day_rows, chunk_rows):
+            chunk = [_fake_row(day, day, platform, rng, fake) for _ in range(min(chunk_rows, day_rows - offset))]
+            chunk = [json.dumps(row) for row in _drift_rows(chunk, drift, day_seed, offset)]
+            yield separator + ",".join(chunk)
+            separator = ","
+    yield "]"
+
+
+def _fast_columns(num_rows, day, platform, rng):
+    # Sample every column of a day at once with NumPy
+    installs = rng.integers(1000, 10001, num_rows)
+    clicks = rng.integers(100, 1001, num_rows)
+    impressions = rng.integers(100, 1001, num_rows)
+    day_names = np.full(num_rows, day, dtype=object)
+    return {
+        "installs": installs,
+        "ad_spend": rng.uniform(0.01, 1000.00, num_rows),
+        "clicks": clicks,
+        "impressions": impressions,
+        "click_convertion_rate": installs / clicks * 100,
+        "click_through_rate": clicks / impressions * 100,
+        "impressions_convertion_rate": installs / impressions * 100,
+        "limit_ad_tracking_installs": rng.integers(10, 101, num_rows),
+        "uninstalls": rng.integers(1000, 10001, num_rows),
+        "campaign_name": CAMPAIGN_NAMES[rng.integers(0, len(CAMPAIGN_NAMES), num_rows)],
+        "creative_name": CREATIVE_NAMES[rng.integers(0, len(CREATIVE_NAMES), num_rows)],
+        "ad_network_name": AD_NETWORK_NAMES[rng.integers(0, len(AD_NETWORK_NAMES), num_rows)],
+        "start_date": day_names,
+        "end_date": day_names,
+        "platform": np.full(num_rows, platform, dtype=object),
+    }
+
+
+def _fast_rows_json(rows, days, platform, seed, drift=0.0, chunk_rows=FAST_CHUNK_ROWS):
+    # Serialize the JSON array with orjson chunk by chunk, skipping per-row model validation
+    yield b"["
+    separator = b""
+    for day, day_rows in _rows_per_day(rows, days):
+        day_seed = _day_seed(day, platform, seed)
+        rng = np.random.default_rng(day_seed)
+        for offset in range(0, day_rows, chunk_rows):
+            columns = _fast_columns(min(chunk_rows, day_rows - offset), day, platform, rng)
+            names = list(columns)
+            records = [dict(zip(names, values)) for values in zip(*(column.tolist() for column in columns.values()))]
+            yield separator + orjson.dumps(_drift_rows(records, drift, day_seed, offset))[1:-1]
+            separator = b","
+    yield b"]"
+
+
+def _faker_rows(days, platform, seed, drift=0.0):
+    fake = faker.Faker()
+    data = []
+    for day in days:
+        day_seed = _day_seed(day, platform, seed)
+        rng = random.Random(day_seed)
+        fake.seed_instance(day_seed)
+        day_rows = [_fake_row(day, day, platform, rng, fake) for _ in range(rng.randint(1, 10))]
+        data.extend(_drift_rows(day_rows, drift, day_seed))
+    return [ReportingResponse(**row).model_dump() for row in data]
+
+
+def _etag(*query):
+    return '"' + hashlib.sha256(repr(query).encode()).hexdigest()[:32] + '"'
+
+
+def _matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
+
+def _iter_body(mode, rows, days, platform, seed, drift):
+    if mode == "fast":
+        return _fast_rows_json(rows or len(days) * 10, days, platform, seed, drift)
+    return (chunk.encode() for chunk in _stream_rows(rows, days, platform, seed, drift))
+
+
+def _sample_latency(latency):
+    distribution = latency["distribution"]
+    with _fault_lock:
+        if distribution == "fixed":
+            seconds = latency["seconds"]
+        elif distribution == "uniform":
+            seconds = _fault_rng.uniform(latency["low"], latency["high"])
+        elif distribution == "lognormal":
+            seconds = _fault_rng.lognormvariate(math.log(latency["median"]), latency["sigma"])
+        elif distribution == "exponential":
+            seconds = _fault_rng.expovariate(1 / latency["mean"])
+        else:
+            raise ValueError(f"Latency distribution not supported: {distribution}")
+    return min(seconds, 60.0)
+
+
+def _take_token(profile_name, client_id, rate_per_second, burst):
+    # Token bucket per (profile, client). Returns 0 if the request may go through,
+    # or the seconds until the next token otherwise
+    now = time.monotonic()
+    with _fault_lock:
+        tokens, updated_at = _client_buckets.get((profile_name, client_id), (burst, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate_per_second)
+        if tokens >= 1:
+            _client_buckets[(profile_name, client_id)] = (tokens - 1, now)
+            return 0.0
+        _client_buckets[(profile_name, client_id)] = (tokens, now)
+        return (1 - tokens) / rate_per_second
+
+
+async def _truncate(body_iterator, keep_bytes):
+    # Stream the first `keep_bytes` of the body, then stop as if the vendor dropped the connection
+    sent = 0
+    async for chunk in body_iterator:
+        if sent + len(chunk) >= keep_bytes:
+            yield chunk[: keep_bytes - sent]
+            return
+        sent += len(chunk)
+        yield chunk
+
+
+@app.middleware("http")
+async def inject_faults(request: Request, call_next):
+    profile_name = request.query_params.get("profile") or os.environ.get("FAKE_API_PROFILE", "none")
+    if profile_name not in FAULT_PROFILES:
+        return Response(f"Unknown fault profile: {profile_name}", status_code=422)
+    profile = FAULT_PROFILES[profile_name]
+    if "rate_limit_per_second" in profile:
+        client_id = request.headers.get("x-client-id") or (request.client.host if request.client else "")
+        wait_seconds = _take_token(
+            profile_name, client_id, profile["rate_limit_per_second"], profile["rate_limit_burst"]
+        )
+        if wait_seconds:
+            return Response(status_code=429, headers={"Retry-After": str(math.ceil(wait_seconds))})
+    if "latency" in profile:
+        await asyncio.sleep(_sample_latency(profile["latency"]))
+    with _fault_lock:
+        request_index = next(_request_counters.setdefault(profile_name, itertools.count()))
+        failing = _fault_rng.random() < profile.get("error_rate", 0.0)
+        status = _fault_rng.choice(profile.get("error_statuses", [500]))
+        truncating = _fault_rng.random() < profile.get("truncate_rate", 0.0)
+    if "burst_every" in profile and request_index % profile["burst_every"] < profile["burst_length"]:
+        return Response(status_code=profile.get("burst_status", 503))
+    if failing:
+        return Response(status_code=status)
+    response = await call_next(request)
+    if truncating and response.status_code == 200:
+        length = int(response.headers.get("content-length", 0))
+        headers = {name: value for name, value in response.headers.items() if name != "content-length"}
+        return StreamingResponse(
+            _truncate(response.body_iterator, length // 2 if length else 1024),
+            status_code=200,
+            headers=headers,
+        )
+    return response
+
+
+@app.post("/dispatch")
+async def dispatch(request: Request):
+    # Stand-in of the executor, to load-test the orchestrator dispatcher with the same fault profiles
+    await request.body()
+    return {"status": "accepted"}
+
+
+@functools.lru_cache(maxsize=RESPONSE_CACHE_SIZE)
+def _render_body(mode, rows, start_date, end_date, platform, seed, drift):
+    # Bodies of small responses are rendered once per query and served from memory afterwards
+    days = _report_days(start_date, end_date)
+    if mode == "faker" and not rows:
+        return orjson.dumps(_faker_rows(days, platform, seed, drift))
+    return b"".join(_iter_body(mode, rows, days, platform, seed, drift))
+
+
 @app.get("/reporting", response_model=List[ReportingResponse])
-def get_reporting(
-    start_date: str = Query(..., example="2025-05-01"),
-    end_date: str = Query(..., example="2025-05-01"),
-    platform: str = Query(..., example="ios", regex="^(ios|android)$")
+async def get_reporting(
+    start_date: str = Query(..., examples=["2025-05-01"]),
+    end_date: str = Query(..., examples=["2025-05-01"]),
+    platform: str = Query(..., examples=["ios"], pattern="^(ios|android)$"),
+    delay_seconds: float = Query(0.0, ge=0.0, le=60.0, description="Simulated vendor latency"),
+    rows: Optional[int] = Query(None, ge=1, le=20_000_000, description="Stream a large response with this many rows"),
+    mode: str = Query("faker", pattern="^(faker|fast)$", description="Row generator: faker, or fast for vectorized NumPy sampling"),
+    seed: Optional[int] = Query(None, description="Extra seed, to get another deterministic data set for the same dates"),
+    drift: float = Query(0.0, ge=0.0, le=1.0, description="Fraction of rows whose metrics are restated"),
+    if_none_match: Optional[str] = Header(None),
 ):
-    data = []
-    for _ in range(random.randint(1, 10)):
-    # Generate fake data based on the query parameters
-        installs = random.randint(1000, 10000)
-        ad_spend = random.uniform(0.01, 1000.00)
-        clicks = random.randint(100, 1000)
-        impressions = random.randint(100, 1000)
-        limit_ad_tracking_installs = random.randint(10, 100)
-        uninstalls = random.randint(1000, 10000)
-        campaign_name = fake.bs()
-        creative_name = fake.catch_phrase()
-        ad_network_name = random.choice(AD_NETWORKS)
-        start_date = start_date
-        end_date = end_date
-
-        data.append(
-            ReportingResponse(
-                installs=installs,
-                ad_spend=ad_spend,
-                clicks=clicks,
-                impressions=impressions,
-                click_convertion_rate=(installs / clicks) * 100 if clicks > 0 else 0,
-                click_through_rate=(clicks / impressions) * 100 if impressions > 0 else 0,
-                impressions_convertion_rate=(installs / impressions) * 100 if impressions > 0 else 0,
-                limit_ad_tracking_installs=limit_ad_tracking_installs,
-                uninstalls=uninstalls,
-                campaign_name=campaign_name,
-                creative_name=creative_name,
-                ad_network_name=ad_network_name,
-                start_date=start_date,
-                end_date=end_date,
-                platform=platform
-            )
+    days = _report_days(start_date, end_date)
+    if delay_seconds:
+        await asyncio.sleep(delay_seconds)
+    etag = _etag(mode, rows, start_date, end_date, platform, seed, drift)
+    if _matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    if not rows or rows <= CACHE_MAX_ROWS:
+        body = await run_in_threadpool(
+            _render_body, mode, rows, start_date, end_date, platform, seed, drift
         )
-    return data
+        return Response(body, media_type="application/json", headers={"ETag": etag})
+    # sync generators are iterated in the thread pool, keeping the event loop free
+    return StreamingResponse(
+        _iter_body(mode, rows, days, platform, seed, drift),
+        media_type="application/json",
+        headers={"ETag": etag},
+    )
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,47 @@
+import unittest
+import orjson
+from fake_adjust_api.main import _iter_body, _render_body
+
+
+def _rows_by_day(body):
+    rows_by_day = {}
+    for row in orjson.loads(body):
+        rows_by_day.setdefault(row["start_date"], []).append(row)
+    return rows_by_day
+
+
+class FakeApiTestCase(unittest.TestCase):
+    """Test suite for the fake Adjust API"""
+
+    maxDiff = None
+
+    def test_overlapping_windows(self):
+        """Test a day gets the same rows whatever window it is requested in"""
+        for mode in ["faker", "fast"]:
+            week = _rows_by_day(_render_body(mode, None, "2024-01-01", "2024-01-07", "ios", None, 0.1))
+            shifted = _rows_by_day(_render_body(mode, None, "2024-01-02", "2024-01-08", "ios", None, 0.1))
+            single = _rows_by_day(_render_body(mode, None, "2024-01-03", "2024-01-03", "ios", None, 0.1))
+            self.assertEqual(len(week), 7)
+            for day in ["2024-01-02", "2024-01-05", "2024-01-07"]:
+                self.assertEqual(week[day], shifted[day])
+            self.assertEqual(week["2024-01-03"], single["2024-01-03"])
+            other_seed = _rows_by_day(_render_body(mode, None, "2024-01-03", "2024-01-03", "ios", 1, 0.1))
+            self.assertNotEqual(other_seed["2024-01-03"], single["2024-01-03"])
+            android = _rows_by_day(_render_body(mode, None, "2024-01-03", "2024-01-03", "android", None, 0.1))
+            self.assertNotEqual(
+                [row["installs"] for row in android["2024-01-03"]],
+                [row["installs"] for row in single["2024-01-03"]],
+            )
+
+    def test_overlapping_streams(self):
+        """Test streamed responses keep the rows of a day for the same number of rows per day"""
+        for mode in ["faker", "fast"]:
+            two_days = _rows_by_day(b"".join(_iter_body(mode, 6, ["2024-01-01", "2024-01-02"], "ios", 7, 0.5)))
+            one_day = _rows_by_day(b"".join(_iter_body(mode, 3, ["2024-01-02"], "ios", 7, 0.5)))
+            self.assertEqual(len(two_days["2024-01-01"]), 3)
+            self.assertEqual(two_days["2024-01-02"], one_day["2024-01-02"])
+
+
+if __name__ == "__main__":
+    runner = unittest.TextTestRunner(verbosity=3)
+    unittest.main(testRunner=runner)
@@ -1,20 +1,20 @@
 import functions_framework
-from utils.write import write_log
-from utils.read import build_urls, run_execution,check_running_routines
+from utils.logger import logger
+from utils.read import build_urls, count_days, run_execution
 import os
 import datetime
-import time
 
-from utils.read import (
-    check_files_count
-)
+from utils.configs import config
+from utils.backfill import run_backfill
+from utils.completion import CompletionTracker, GCSStore, get_run_prefix
+from utils.lease import RunLease
+from utils.tracing import log_run_summary, span, tracer
 from utils.write import (
     clean_all_temp_files
 )
 
 
 EXECUTOR_URL = os.environ.get("EXECUTOR_URL", "EXECUTOR_URL not set")
-DATETIME_NOW = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 GCS_BUCKET = os.environ.get("GCS_BUCKET", "GCS_BUCKET not set")
 
 
@@ -22,39 +22,75 @@ GCS_BUCKET = os.environ.get("GCS_BUCKET", "GCS_BUCKET not set")
 @functions_framework.http
 def handle_api_calls(request):
     args = request.get_json(silent=True)
-    print(write_log("Start function", f"Args: {args}"))
-    
-    if check_running_routines(GCS_BUCKET, "temp_data"):
-        print(write_log("Currently lock is acquired by another job. Skipping current execution"))
-        print(write_log("End function"))
-        return "Done"
-
+    logger.reset()
+    logger.info("Start function", args)
 
     if args:
-        print(write_log(f'Build urls for schedule {args["scheduler_id"]}'))
-        urls = build_urls(args["scheduler_id"])
-        print(write_log("Generated urls", f"Urls: {urls}"))
-        run_execution(EXECUTOR_URL, urls, DATETIME_NOW, args["scheduler_id"])
-        
-        count = 0
-        cleaned = False
-
-        while count < 60:
-            
-            if check_files_count(GCS_BUCKET, args["scheduler_id"]):
-                time.sleep(120)
-                clean_all_temp_files(GCS_BUCKET)
-                print(write_log("Clean temp data from GCS"))
-                cleaned = True
-                break
-            
-            time.sleep(30)
-            count += 1
-
-        if not cleaned:
-            clean_all_temp_files(GCS_BUCKET)
-            print(write_log("Clean temp data from GCS"))
+        datetime_now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        run_prefix = get_run_prefix(args["scheduler_id"], datetime_now)
+        store = GCSStore(GCS_BUCKET)
+        lease = RunLease(store, args["scheduler_id"])
+        if not lease.acquire(run_prefix):
+            logger.info(f'Schedule {args["scheduler_id"]} is leased by {lease.holder()}. Skipping current execution')
+            logger.info("End function")
+            logger.flush()
+            return "Done"
+        tracer.reset()
+        try:
+            with span("handle_api_calls", scheduler_id=args["scheduler_id"]):
+                if args["scheduler_id"] == "backfill":
+                    _run_backfill(args["from"], args["to"], datetime_now, run_prefix, store)
+                else:
+                    _run_schedule(args["scheduler_id"], datetime_now, run_prefix, store)
+        finally:
+            lease.release()
+            log_run_summary()
+            # entries are buffered, so write them out before the instance is frozen
+            logger.flush()
     else:
-        print(write_log("No args found", f"Args: {args}", severity="ERROR"))
-    print(write_log("End function"))
+        logger.error("No args found", args)
+    logger.info("End function")
+    logger.flush()
     return "Done"
+
+
+def _run_schedule(scheduler_id, datetime_now, run_prefix, store):
+    logger.info(f"Build urls for schedule {scheduler_id}", {"run": run_prefix})
+    urls = build_urls(scheduler_id)
+    logger.info(f"Generated {len(urls)} urls")
+    logger.debug("Generated urls", urls)
+    tracker = CompletionTracker(store, f"{run_prefix}/_manifest")
+    tracker.start(count_days(urls) * len(config["platforms"]))
+    with span("dispatch", calls=len(urls)) as trace:
+        dispatch = run_execution(EXECUTOR_URL, urls, datetime_now, scheduler_id)
+        trace.set(accepted=len(dispatch["accepted"]), failed=len(dispatch["failed"]))
+    logger.log(
+        f'Dispatched {len(dispatch["accepted"])} of {len(urls)} executor calls',
+        dispatch,
+        severity="WARNING" if dispatch["failed"] else "INFO",
+    )
+
+    batch_load_date = urls[-1].split("start_date=")[1].split("&")[0]
+    if batch_load_date in dispatch["failed"]:
+        # nobody is going to load the staged data, so do not wait for it
+        logger.warning("Batch load executor was not dispatched")
+    else:
+        with span("wait_completion"):
+            finished = tracker.wait_until_finished(
+                config["completion_deadline_seconds"], config["completion_poll_seconds"]
+            )
+        if not finished:
+            logger.warning("Batch load did not finish before the deadline")
+    with span("cleanup") as trace:
+        trace.set(deleted=clean_all_temp_files(GCS_BUCKET, prefix=run_prefix)["deleted"])
+
+
+def _run_backfill(start_date, end_date, datetime_now, run_prefix, store):
+    with span("backfill", start_date=start_date, end_date=end_date) as trace:
+        results = run_backfill(EXECUTOR_URL, start_date, end_date, datetime_now, store, run_prefix, GCS_BUCKET)
+        trace.set(**{key: len(value) if isinstance(value, list) else value for key, value in results.items()})
+    logger.log(
+        f'Backfilled {len(results["loaded"])} windows from {start_date} to {end_date}',
+        results,
+        severity="WARNING" if results["failed"] or results["pending"] else "INFO",
+    )
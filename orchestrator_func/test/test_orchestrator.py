@@ -1,13 +1,40 @@
 import unittest
+from orchestrator_func.utils import read as orchestrator_read
 from orchestrator_func.utils.read import (
+    build_range_urls,
     build_urls,
+    count_days,
     run_execution,
-    check_running_routines
+)
+from orchestrator_func.utils.write import clean_all_temp_files
+from orchestrator_func.utils.backfill import (
+    AdaptiveConcurrency,
+    get_dispatch_deadline_seconds,
+    run_backfill,
+)
+from orchestrator_func.utils.configs import config
+from orchestrator_func.utils.completion import CompletionTracker, MemoryStore, get_run_prefix
+from orchestrator_func.utils.lease import RunLease
+from orchestrator_func.utils.clients import (
+    ClientRegistry,
+    get_storage_client,
+    set_client_factory,
 )
 import datetime
+import json
+import os
+import re
+import requests
+import subprocess
+import sys
 from unittest.mock import patch,MagicMock
 
 
+FUNCTION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Cold-start budget of `import main`, overridable on slow machines
+IMPORT_TIME_BUDGET_SECONDS = float(os.environ.get("IMPORT_TIME_BUDGET_SECONDS", "1.0"))
+
+
 class OrcheatratorTestCase(unittest.TestCase):
     """Test suite for orchestrator function"""
 
@@ -18,7 +45,8 @@ class OrcheatratorTestCase(unittest.TestCase):
         self.today_datetime = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     def tearDown(self):
-        pass
+        orchestrator_read._id_tokens.clear()
+        set_client_factory()
 
     def test_build_urls(self):
         """Test build_urls function"""
@@ -26,7 +54,7 @@ class OrcheatratorTestCase(unittest.TestCase):
         first_start_date = (
             datetime.datetime.now() - datetime.timedelta(days=4)
         ).strftime("%Y-%m-%d")
-        res = build_urls(scheduler_id)
+        res = build_urls(scheduler_id, window_days=1)
         self.assertTrue(len(res) == 5)
         self.assertEqual(
             res[-1],
@@ -36,66 +64,279 @@ class OrcheatratorTestCase(unittest.TestCase):
         first_start_date = (
             datetime.datetime.now() - datetime.timedelta(days=13)
         ).strftime("%Y-%m-%d")
-        res = build_urls(scheduler_id)
+        res = build_urls(scheduler_id, window_days=1)
         self.assertTrue(len(res) == 14)
         scheduler_id = "1m"
-        res = build_urls(scheduler_id)
+        res = build_urls(scheduler_id, window_days=1)
         self.assertTrue(len(res) == 30)
 
+    def test_build_urls_windows(self):
+        """Test build_urls groups days into ranged requests"""
+        res = build_urls("2h")
+        self.assertEqual(len(res), 1)
+        first_start_date = (
+            datetime.datetime.now() - datetime.timedelta(days=4)
+        ).strftime("%Y-%m-%d")
+        self.assertEqual(
+            res[0],
+            f"https://fass-api-874544665874.us-central1.run.app/reporting?start_date={first_start_date}&end_date={self.today_date}",
+        )
+        for scheduler_id, num_urls, num_days in [("2h", 1, 5), ("7d", 2, 14), ("1m", 5, 30)]:
+            res = build_urls(scheduler_id)
+            self.assertEqual(len(res), num_urls)
+            self.assertEqual(count_days(res), num_days)
+            self.assertEqual(count_days(build_urls(scheduler_id, window_days=4)), num_days)
+        last_start_date, last_end_date = [
+            (datetime.datetime.now() - datetime.timedelta(days=days)).strftime("%Y-%m-%d")
+            for days in [29, 28]
+        ]
+        self.assertTrue(res[-1].endswith(f"start_date={last_start_date}&end_date={last_end_date}"))
+
+    def test_build_range_urls(self):
+        """Test build_range_urls covers an arbitrary date range in windows, oldest first"""
+        res = build_range_urls("2024-01-01", "2024-01-16")
+        self.assertEqual(len(res), 3)
+        self.assertEqual(count_days(res), 16)
+        self.assertTrue(res[0].endswith("start_date=2024-01-01&end_date=2024-01-07"))
+        self.assertTrue(res[-1].endswith("start_date=2024-01-15&end_date=2024-01-16"))
+        self.assertEqual(len(build_range_urls("2024-01-01", "2024-01-01")), 1)
+        with self.assertRaises(ValueError):
+            build_range_urls("2024-01-16", "2024-01-01")
+
+    def test_adaptive_concurrency(self):
+        """Test AdaptiveConcurrency raises the limit on fast windows and halves it on slow or failed ones"""
+        concurrency = AdaptiveConcurrency(initial=2, maximum=4, latency_target_seconds=10)
+        self.assertEqual([concurrency.record(1, False) for _ in range(3)], [3, 4, 4])
+        self.assertEqual(concurrency.record(11, False), 2)
+        self.assertEqual(concurrency.record(1, True), 1)
+        self.assertEqual(concurrency.record(1, True), 1)
+
+    def test_backfill_fits_function_timeout(self):
+        """Test a backfill waits for its last window and releases its lease before the orchestrator times out"""
+        deadline_seconds = get_dispatch_deadline_seconds()
+        self.assertGreater(deadline_seconds, 0)
+        self.assertLess(
+            deadline_seconds + config["backfill_window_deadline_seconds"], config["function_timeout_seconds"]
+        )
+        self.assertEqual(config["lease_ttl_seconds"], config["function_timeout_seconds"])
+        terraform_path = os.path.join(os.path.dirname(FUNCTION_DIR), "deploy", "main.tf")
+        if os.path.exists(terraform_path):
+            with open(terraform_path) as f:
+                timeouts = re.findall(r"timeout_seconds\s*=\s*(\d+)", f.read())
+            self.assertEqual(
+                [int(timeout) for timeout in timeouts],
+                [config["function_timeout_seconds"], config["backfill_window_deadline_seconds"]],
+            )
+
+    @patch("orchestrator_func.utils.backfill.clean_all_temp_files")
+    def test_run_backfill(self, mock_clean):
+        """Test run_backfill loads every window once, retries failed ones and resumes from the checkpoint"""
+        store = MemoryStore()
+        now = [0.0]
+        payloads = []
+        failing = {"2024-01-08"}
+
+        def dispatch(data):
+            # the executor finishes its window within the poll, loading it unless it is failing
+            payloads.append(data)
+            tracker = CompletionTracker(store, f'{data["run_prefix"]}/_manifest')
+            if data["start_date"] not in failing:
+                tracker.mark_loaded()
+            tracker.mark_finished()
+            return True
+
+        def sleep(seconds):
+            now[0] += seconds
+
+        def backfill(run_prefix, **kwargs):
+            return run_backfill(
+                "executor_url", "2024-01-01", "2024-01-31", self.today_datetime, store, run_prefix,
+                "test-bucket", dispatch=dispatch, poll_seconds=1, clock=lambda: now[0], sleep=sleep, **kwargs,
+            )
+
+        concurrency = AdaptiveConcurrency(initial=1, maximum=3, latency_target_seconds=10)
+        res = backfill("temp_data/backfill/1", concurrency=concurrency)
+        self.assertEqual(len(res["loaded"]), 4)
+        self.assertEqual(res["failed"], ["2024-01-08_2024-01-14"])
+        self.assertEqual((res["pending"], res["skipped"]), ([], 0))
+        self.assertEqual(payloads[0]["run_prefix"], "temp_data/backfill/1/2024-01-01_2024-01-07")
+        self.assertTrue(all(p["batch_load"] and p["scheduler_id"] == "backfill" for p in payloads))
+        self.assertEqual(mock_clean.call_count, 5)
+        mock_clean.assert_any_call("test-bucket", prefix="temp_data/backfill/1/2024-01-29_2024-01-31")
+
+        # a new request only runs the failed window
+        failing.clear()
+        payloads.clear()
+        res = backfill("temp_data/backfill/2")
+        self.assertEqual((res["loaded"], res["skipped"]), (["2024-01-08_2024-01-14"], 4))
+        self.assertEqual(len(payloads), 1)
+
+    @patch("orchestrator_func.utils.backfill.clean_all_temp_files")
+    def test_run_backfill_deadline(self, mock_clean):
+        """Test run_backfill stops dispatching at the deadline and leaves the rest pending"""
+        store = MemoryStore()
+        now = [0.0]
+
+        def dispatch(data):
+            tracker = CompletionTracker(store, f'{data["run_prefix"]}/_manifest')
+            tracker.mark_loaded()
+            tracker.mark_finished()
+            return True
+
+        def sleep(seconds):
+            now[0] += seconds
+
+        res = run_backfill(
+            "executor_url", "2024-01-01", "2024-01-31", self.today_datetime, store, "temp_data/backfill/1",
+            "test-bucket", dispatch=dispatch, concurrency=AdaptiveConcurrency(initial=1, maximum=1),
+            poll_seconds=1, deadline_seconds=2, clock=lambda: now[0], sleep=sleep,
+        )
+        self.assertEqual(res["loaded"], ["2024-01-01_2024-01-07", "2024-01-08_2024-01-14"])
+        self.assertEqual(res["pending"], ["2024-01-15_2024-01-21", "2024-01-22_2024-01-28", "2024-01-29_2024-01-31"])
 
+    @patch("requests.Session.post")
     @patch("google.auth.transport.requests.Request")
     @patch("google.oauth2.id_token.fetch_id_token")
-    def test_run_execution(self, mock_req, mock_fit):
+    def test_run_execution(self, mock_req, mock_fit, mock_post):
         executor_url = "https://example-project.cloudfunctions.net/my-function"
         token = "my_awesome_token"
         mock_fit.return_value = token
         urls = [f"my/first/awesome/url&start_date={self.today_date}&end_date={self.today_date}"]
         scheduler_id = "2h"
-        run_execution(executor_url, urls, self.today_datetime, scheduler_id)
+        res = run_execution(executor_url, urls, self.today_datetime, scheduler_id)
         mock_req.assert_called_once_with(
             token,
             executor_url,
         )
-    
-    @patch("orchestrator_func.utils.read.storage.Client")
-    def test_check_running_routines_files_present(self, mock_storage_client):
-        """Test check_running_routines when files are present"""
-        mock_bucket = MagicMock()
-        mock_blob1 = MagicMock()
-        mock_blob2 = MagicMock()
-
-        mock_blob1.name = "temp_data/adjust_android_file1.csv"
-        mock_blob2.name = "temp_data/adjust_ios_file1.csv"
-
-        mock_bucket.list_blobs.return_value = [mock_blob1, mock_blob2]
-        mock_storage_client.return_value.get_bucket.return_value = mock_bucket
-
-        result = check_running_routines("test-bucket", "temp_data/")
-        self.assertTrue(result)
-
-    @patch("orchestrator_func.utils.read.storage.Client")
-    def test_check_running_routines_no_files(self, mock_storage_client):
-        """Test check_running_routines when no files are present"""
-        mock_bucket = MagicMock()
-        mock_bucket.list_blobs.return_value = []  
-        mock_storage_client.return_value.get_bucket.return_value = mock_bucket
-
-        result = check_running_routines("test-bucket", "temp_data/")
-        self.assertFalse(result)
-
-    @patch("orchestrator_func.utils.read.storage.Client")
-    def test_check_running_routines_only_folder_present(self, mock_storage_client):
-        """Test check_running_routines when only the folder exists"""
-        mock_bucket = MagicMock()
-        mock_blob = MagicMock()
-
-        mock_blob.name = "temp_data/"  
-        mock_bucket.list_blobs.return_value = [mock_blob]
-        mock_storage_client.return_value.get_bucket.return_value = mock_bucket
-
-        result = check_running_routines("test-bucket", "temp_data/")
-        self.assertFalse(result)
+        self.assertEqual(res, {"accepted": [self.today_date], "failed": []})
+        payload = json.loads(mock_post.call_args.kwargs["data"])
+        self.assertEqual(payload["scheduler_id"], "2h")
+        self.assertEqual(payload["platforms"], ["ios", "android"])
+
+    @patch("requests.Session.post")
+    @patch("google.auth.transport.requests.Request")
+    @patch("google.oauth2.id_token.fetch_id_token")
+    def test_run_execution_tracks_dispatches(self, mock_req, mock_fit, mock_post):
+        """Test run_execution reuses the ID token and tracks accepted and failed POSTs"""
+        executor_url = "https://example-project.cloudfunctions.net/my-function"
+        mock_req.return_value = "my_awesome_token"
+        urls = build_urls("2h", window_days=1)
+        start_dates = [url.split("start_date=")[1].split("&")[0] for url in urls]
+
+        def _post(url, data, headers, timeout):
+            if start_dates[1] in data:
+                raise requests.exceptions.ConnectionError("boom")
+            if start_dates[2] in data:
+                raise requests.exceptions.ReadTimeout("still running")
+            return MagicMock()
+
+        mock_post.side_effect = _post
+        res = run_execution(
+            executor_url, urls, self.today_datetime, "2h", max_workers=3, rate_per_second=0
+        )
+        mock_req.assert_called_once()
+        self.assertEqual(mock_post.call_count, 5)
+        self.assertEqual(res["failed"], [start_dates[1]])
+        self.assertEqual(
+            res["accepted"], [d for d in start_dates if d != start_dates[1]]
+        )
+        batch_loads = [
+            '"batch_load": true' in call.kwargs["data"] for call in mock_post.call_args_list
+        ]
+        self.assertEqual(sum(batch_loads), 1)
+
+    @patch("requests.Session.post")
+    @patch("google.auth.transport.requests.Request")
+    @patch("google.oauth2.id_token.fetch_id_token")
+    def test_run_execution_token_failure(self, mock_req, mock_fit, mock_post):
+        """Test a failed ID token fetch marks the dispatches failed instead of aborting the run"""
+        import google.auth.exceptions
+
+        mock_req.side_effect = google.auth.exceptions.TransportError("metadata server unavailable")
+        urls = build_urls("2h", window_days=1)
+        res = run_execution(
+            "https://example-project.cloudfunctions.net/my-function",
+            urls,
+            self.today_datetime,
+            "2h",
+            max_workers=3,
+            rate_per_second=0,
+        )
+        mock_post.assert_not_called()
+        self.assertEqual(res["accepted"], [])
+        self.assertEqual(len(res["failed"]), len(urls))
+
+    def test_import_time_budget(self):
+        """Test importing main stays within budget and defers google.auth"""
+        completed = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, time; start = time.perf_counter(); import main; "
+                "print(time.perf_counter() - start); print(' '.join(sys.modules))",
+            ],
+            cwd=FUNCTION_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        import_seconds, modules = completed.stdout.splitlines()[-2:]
+        self.assertLess(float(import_seconds), IMPORT_TIME_BUDGET_SECONDS)
+        self.assertNotIn("google.oauth2.id_token", modules.split())
+
+    def test_client_registry(self):
+        """Test the client registry builds each client once and swaps factories"""
+        factory = MagicMock(side_effect=lambda kind: MagicMock(kind=kind))
+        registry = ClientRegistry(factory)
+        self.assertIs(registry.get("storage"), registry.get("storage"))
+        self.assertEqual(registry.get("bigquery").kind, "bigquery")
+        self.assertEqual(factory.call_count, 2)
+        fake_client = MagicMock()
+        set_client_factory(lambda kind: fake_client)
+        self.assertIs(get_storage_client(), fake_client)
+
+    def test_run_lease(self):
+        """Test RunLease lets one run per schedule through until it is released or expires"""
+        now = [1000.0]
+        store = MemoryStore()
+        lease = RunLease(store, "2h", ttl_seconds=60, clock=lambda: now[0])
+        self.assertTrue(lease.acquire("temp_data/2h/20250501T120000"))
+        other = RunLease(store, "2h", ttl_seconds=60, clock=lambda: now[0])
+        self.assertFalse(other.acquire("temp_data/2h/20250501T140000"))
+        self.assertEqual(other.holder(), "temp_data/2h/20250501T120000")
+        # other schedules are not blocked
+        self.assertTrue(RunLease(store, "7d", ttl_seconds=60, clock=lambda: now[0]).acquire("run"))
+        lease.release()
+        lease.release()
+        self.assertIsNone(other.holder())
+        self.assertTrue(other.acquire("temp_data/2h/20250501T140000"))
+        # a crashed run leaves its lease behind until the TTL passes
+        now[0] += 61
+        self.assertTrue(lease.acquire("temp_data/2h/20250501T160000"))
+        self.assertEqual(store.list("_leases/2h/"), ["_leases/2h/0000000002"])
+
+    def test_get_run_prefix(self):
+        """Test get_run_prefix namespaces staging by schedule and start time"""
+        self.assertEqual(
+            get_run_prefix("2h", "2025-05-01 12:00:00"), "temp_data/2h/20250501T120000"
+        )
+
+    def test_clean_all_temp_files(self):
+        """Test clean_all_temp_files deletes a scoped prefix concurrently and reports the count"""
+        from google.api_core.exceptions import NotFound
+
+        blobs = [MagicMock() for _ in range(5)]
+        blobs[0].delete.side_effect = NotFound("already deleted")
+        mock_storage_client = MagicMock()
+        mock_storage_client.list_blobs.return_value = iter(blobs)
+        set_client_factory(lambda kind: mock_storage_client)
 
+        summary = clean_all_temp_files("test-bucket", prefix="temp_data/run", max_workers=2)
+        mock_storage_client.list_blobs.assert_called_once_with("test-bucket", prefix="temp_data/run")
+        for blob in blobs:
+            blob.delete.assert_called_once_with()
+        self.assertEqual(summary["deleted"], 4)
+        self.assertGreaterEqual(summary["seconds"], 0)
 
 
 if __name__ == "__main__":
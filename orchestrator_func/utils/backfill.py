@@ -0,0 +1,207 @@
+# Backfill of an arbitrary date range, one executor per window, with adaptive concurrency and checkpoints
+
+from .completion import CompletionTracker
+from .configs import config
+from .logger import logger
+from .read import _post_with_url, build_range_urls, count_days
+from .write import clean_all_temp_files
+from collections import deque
+import time
+import requests
+
+BACKFILL_PREFIX = "_backfills"
+
+
+def _window(url):
+    """Returns the ID of the window of a FASS API URL, e.g. "2024-01-01_2024-01-07"."""
+    start_date = url.split("start_date=")[1].split("&")[0]
+    end_date = url.split("end_date=")[1].split("&")[0]
+    return f"{start_date}_{end_date}"
+
+
+def get_dispatch_deadline_seconds():
+    """
+    Returns the time after which a backfill stops dispatching windows, so the last window can
+    still be waited for, checkpointed and cleaned before the orchestrator times out.
+
+    Returns:
+        float: The number of seconds since the start of the backfill.
+    """
+    return (
+        config["function_timeout_seconds"]
+        - config["timeout_margin_seconds"]
+        - config["backfill_window_deadline_seconds"]
+    )
+
+
+class AdaptiveConcurrency:
+    """
+    Additive-increase, multiplicative-decrease limit on the number of windows in flight.
+
+    A window loaded within the latency target raises the limit by one, up to the maximum. A window
+    that failed, or took longer than the target, halves it, down to one. The backfill speeds up
+    while the FASS API keeps up, and backs off as soon as it slows down or returns errors.
+
+    Args:
+        initial (int): The starting limit. Defaults to config["backfill_initial_concurrency"].
+        maximum (int): The highest limit. Defaults to config["backfill_max_concurrency"].
+        latency_target_seconds (float): The time from dispatch to load of a window above which
+            the limit is lowered. Defaults to config["backfill_latency_target_seconds"].
+    """
+
+    def __init__(self, initial=None, maximum=None, latency_target_seconds=None):
+        self.maximum = maximum or config["backfill_max_concurrency"]
+        self.limit = min(initial or config["backfill_initial_concurrency"], self.maximum)
+        self.latency_target_seconds = latency_target_seconds or config["backfill_latency_target_seconds"]
+
+    def record(self, seconds, failed):
+        """
+        Adapts the limit to the outcome of a window.
+
+        Args:
+            seconds (float): The time from dispatch to the end of the window.
+            failed (bool): Whether the window failed to load.
+
+        Returns:
+            int: The new limit.
+        """
+        if failed or seconds > self.latency_target_seconds:
+            self.limit = max(1, self.limit // 2)
+        else:
+            self.limit = min(self.maximum, self.limit + 1)
+        return self.limit
+
+
+class BackfillCheckpoint:
+    """
+    The windows of a backfill already loaded, kept as one marker object per window, so a backfill
+    interrupted by the function timeout or a crash resumes where it stopped when requested again.
+
+    Args:
+        store: The object store holding the checkpoint (GCSStore, LocalStore or MemoryStore).
+        start_date (str): The first day of the backfill, in YYYY-MM-DD format.
+        end_date (str): The last day of the backfill, in YYYY-MM-DD format.
+    """
+
+    def __init__(self, store, start_date, end_date):
+        self.store = store
+        self.prefix = f"{BACKFILL_PREFIX}/{start_date}_{end_date}/done"
+
+    def done(self):
+        """Returns the IDs of the windows already loaded."""
+        return {name.rsplit("/", 1)[1] for name in self.store.list(f"{self.prefix}/")}
+
+    def mark_done(self, window):
+        """Records that a window has been loaded."""
+        self.store.create(f"{self.prefix}/{window}")
+
+
+def run_backfill(
+    executor_url,
+    start_date,
+    end_date,
+    datetime_now,
+    store,
+    run_prefix,
+    bucket_name,
+    dispatch=None,
+    concurrency=None,
+    poll_seconds=None,
+    deadline_seconds=None,
+    clock=time.monotonic,
+    sleep=time.sleep,
+):
+    """
+    Fetches and loads a date range window by window, skipping the windows already loaded.
+
+    Every window is dispatched to its own executor with its own staging prefix and batch load.
+    New windows are dispatched while fewer than the adaptive limit are in flight and the deadline
+    has not passed. Windows that fail are left out of the checkpoint, for the next request to retry.
+
+    Args:
+        executor_url (str): The URL of the Executor Cloud Function.
+        start_date (str): The first day, in YYYY-MM-DD format.
+        end_date (str): The last day, in YYYY-MM-DD format.
+        datetime_now (str): The current datetime.
+        store: The object store holding the manifests and the checkpoint.
+        run_prefix (str): The staging prefix of the backfill run.
+        bucket_name (str): The GCS bucket to clean the staged windows from.
+        dispatch (callable): Sends a payload to the executor and returns True if it was accepted.
+            Defaults to an authenticated POST to executor_url.
+        concurrency (AdaptiveConcurrency): The limit on windows in flight.
+        poll_seconds (float): The time between checks. Defaults to config["completion_poll_seconds"].
+        deadline_seconds (float): The time after which no window is dispatched any more.
+            Defaults to get_dispatch_deadline_seconds().
+        clock (callable): The monotonic clock to use.
+        sleep (callable): The function waiting between checks.
+
+    Returns:
+        dict: The windows "loaded", "failed" and still "pending" in this run, and the number
+            "skipped" as loaded by previous runs.
+    """
+    checkpoint = BackfillCheckpoint(store, start_date, end_date)
+    done = checkpoint.done()
+    urls = build_range_urls(start_date, end_date)
+    pending = deque(url for url in urls if _window(url) not in done)
+    concurrency = concurrency or AdaptiveConcurrency()
+    poll_seconds = poll_seconds or config["completion_poll_seconds"]
+    deadline = clock() + (deadline_seconds or get_dispatch_deadline_seconds())
+    results = {"loaded": [], "failed": [], "pending": [], "skipped": len(urls) - len(pending)}
+    in_flight = {}
+    logger.info(
+        f"Backfilling {len(pending)} of {len(urls)} windows from {start_date} to {end_date}",
+        {"run": run_prefix, "skipped": results["skipped"]},
+    )
+
+    def _finish(window, window_prefix, seconds, loaded):
+        limit = concurrency.record(seconds, failed=not loaded)
+        if loaded:
+            checkpoint.mark_done(window)
+        results["loaded" if loaded else "failed"].append(window)
+        clean_all_temp_files(bucket_name, prefix=window_prefix)
+        logger.log(
+            f"Window {window} {'loaded' if loaded else 'failed'} in {seconds:.0f}s",
+            {"concurrency": limit},
+            severity="INFO" if loaded else "WARNING",
+            rate_key="Backfill window",
+        )
+
+    with requests.Session() as session:
+        dispatch = dispatch or (lambda data: _post_with_url(executor_url, data, session))
+        while pending or in_flight:
+            while pending and len(in_flight) < concurrency.limit and clock() < deadline:
+                url = pending.popleft()
+                window = _window(url)
+                window_prefix = f"{run_prefix}/{window}"
+                tracker = CompletionTracker(store, f"{window_prefix}/_manifest")
+                tracker.start(count_days([url]) * len(config["platforms"]))
+                data = {
+                    "url": url,
+                    "datetime_now": datetime_now,
+                    "start_date": window.split("_")[0],
+                    "end_date": window.split("_")[1],
+                    "batch_load": True,
+                    "scheduler_id": "backfill",
+                    "platforms": config["platforms"],
+                    "run_prefix": window_prefix,
+                }
+                if dispatch(data):
+                    in_flight[window] = (tracker, window_prefix, clock())
+                else:
+                    _finish(window, window_prefix, 0.0, loaded=False)
+            if not in_flight:
+                # past the deadline, the pending windows are left to the next request
+                break
+            sleep(poll_seconds)
+            for window, (tracker, window_prefix, dispatched_at) in list(in_flight.items()):
+                seconds = clock() - dispatched_at
+                if tracker.is_finished():
+                    loaded = tracker.is_loaded()
+                elif seconds > config["backfill_window_deadline_seconds"]:
+                    loaded = False
+                else:
+                    continue
+                del in_flight[window]
+                _finish(window, window_prefix, seconds, loaded)
+    results["pending"] = [_window(url) for url in pending]
+    return results
@@ -1,6 +1,34 @@
 # Main configuration for the Python script and FASS API interaction
 
+# The timeout_seconds of the orchestrator and executor functions in deploy/main.tf
+FUNCTION_TIMEOUT_SECONDS = 1920
+EXECUTOR_TIMEOUT_SECONDS = 1200
+
 config = {
     "base_url": "https://fass-api-874544665874.us-central1.run.app/reporting",
     "project_id": "eighth-duality-457819-r4",
+    "dispatch_max_workers": 8,
+    "dispatch_rate_per_second": 2.0,
+    "dispatch_timeout_seconds": 5,
+    "id_token_default_ttl_seconds": 3000,
+    "id_token_refresh_margin_seconds": 60,
+    "platforms": ["ios", "android"],
+    "completion_deadline_seconds": 1800,
+    "completion_poll_seconds": 2,
+    "request_window_days": 7,
+    "cleanup_max_workers": 8,
+    "function_timeout_seconds": FUNCTION_TIMEOUT_SECONDS,
+    "timeout_margin_seconds": 60,
+    # a run never outlives its function, so its lease may expire with it
+    "lease_ttl_seconds": FUNCTION_TIMEOUT_SECONDS,
+    "backfill_initial_concurrency": 2,
+    "backfill_max_concurrency": 8,
+    "backfill_latency_target_seconds": 300,
+    # an executor is killed at its own timeout, so a window is not waited for any longer
+    "backfill_window_deadline_seconds": EXECUTOR_TIMEOUT_SECONDS,
+    "log_level": "INFO",
+    "log_buffer_size": 50,
+    "log_rate_limit_seconds": 10,
+    "log_rate_limit_burst": 5,
+    "span_info_seconds": 1.0,
 }
@@ -0,0 +1,84 @@
+# Per-schedule lease preventing two runs of the same schedule from overlapping
+
+from .configs import config
+import json
+import time
+
+LEASE_PREFIX = "_leases"
+
+
+class RunLease:
+    """
+    A lease on a schedule, held by one run at a time and expiring after a TTL.
+
+    Every acquisition creates the next numbered lease object with a create-if-absent write,
+    so two runs racing for the same schedule cannot both win. A lease is free once it has
+    been released or its TTL has passed, which covers runs that crashed while holding it.
+
+    Args:
+        store: The object store holding the leases (GCSStore, LocalStore or MemoryStore).
+        scheduler_id (str): The ID of the schedule, e.g. "2h".
+        ttl_seconds (float): The time after which an unreleased lease expires.
+            Defaults to config["lease_ttl_seconds"].
+        clock (callable): The wall clock to use, shared by every run.
+    """
+
+    def __init__(self, store, scheduler_id, ttl_seconds=None, clock=time.time):
+        self.store = store
+        self.prefix = f"{LEASE_PREFIX}/{scheduler_id}"
+        self.ttl_seconds = ttl_seconds or config["lease_ttl_seconds"]
+        self.clock = clock
+        self.generation = None
+
+    def _name(self, generation):
+        return f"{self.prefix}/{generation:010d}"
+
+    def _state(self):
+        """Returns the existing lease generations, oldest first, and the holder of the last one if it is live."""
+        names = self.store.list(f"{self.prefix}/")
+        generations = sorted(
+            int(name.rsplit("/", 1)[1]) for name in names if not name.endswith(".released")
+        )
+        if not generations or f"{self._name(generations[-1])}.released" in names:
+            return generations, None
+        data = self.store.read(self._name(generations[-1]))
+        if data is None:
+            return generations, None
+        lease = json.loads(data)
+        return generations, lease["holder"] if lease["expires_at"] > self.clock() else None
+
+    def holder(self):
+        """Returns the run holding the lease, or None if the schedule is free."""
+        return self._state()[1]
+
+    def acquire(self, holder):
+        """
+        Takes the lease if the schedule is free.
+
+        Args:
+            holder (str): The ID of the run taking the lease, e.g. its staging prefix.
+
+        Returns:
+            bool: True if the lease was taken, False if another run holds it.
+        """
+        generations, current_holder = self._state()
+        if current_holder is not None:
+            return False
+        generation = generations[-1] + 1 if generations else 0
+        lease = {"holder": holder, "expires_at": self.clock() + self.ttl_seconds}
+        if not self.store.create(self._name(generation), json.dumps(lease)):
+            # another run took the same generation first
+            return False
+        self.generation = generation
+        # drop the leases this one supersedes
+        for old_generation in generations:
+            self.store.delete(self._name(old_generation))
+            self.store.delete(f"{self._name(old_generation)}.released")
+        return True
+
+    def release(self):
+        """Frees the schedule if this lease is held. Releasing twice is a no-op."""
+        if self.generation is None:
+            return
+        self.store.create(f"{self._name(self.generation)}.released")
+        self.generation = None
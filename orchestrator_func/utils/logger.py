@@ -0,0 +1,161 @@
+# Buffered, level-filtered structured logger for Cloud Logging. Keep in sync with executor_func/utils/logger.py
+
+from .configs import config
+from collections import OrderedDict
+import atexit
+import os
+import sys
+import threading
+import time
+import orjson
+
+SEVERITIES = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40, "CRITICAL": 50}
+MAX_RATE_WINDOWS = 1000
+
+
+class Logger:
+    """
+    Writes log entries as JSON lines that Cloud Logging parses into structured entries.
+
+    Entries below the level are dropped before any formatting. The others are encoded with orjson
+    into a buffer, which is written out when it is full, on WARNING and above, and by `flush` at
+    the end of the invocation. Below ERROR, a message repeated more than `rate_limit_burst` times
+    within `rate_limit_seconds` is dropped, and the next entry let through counts the dropped ones.
+
+    Args:
+        level (str): The lowest severity written. Defaults to the LOG_LEVEL environment variable,
+            then config["log_level"].
+        buffer_size (int): The number of entries buffered before writing. Defaults to config["log_buffer_size"].
+        rate_limit_seconds (float): The rate limiting window. Defaults to config["log_rate_limit_seconds"].
+        rate_limit_burst (int): The entries per message allowed in a window. Defaults to config["log_rate_limit_burst"].
+        stream: The text stream to write to. Defaults to the current sys.stdout.
+        clock (callable): The monotonic clock of the rate limiting windows.
+    """
+
+    def __init__(
+        self,
+        level=None,
+        buffer_size=None,
+        rate_limit_seconds=None,
+        rate_limit_burst=None,
+        stream=None,
+        clock=time.monotonic,
+    ):
+        self.level = SEVERITIES[level or os.environ.get("LOG_LEVEL", config["log_level"])]
+        self.buffer_size = buffer_size or config["log_buffer_size"]
+        self.rate_limit_seconds = rate_limit_seconds or config["log_rate_limit_seconds"]
+        self.rate_limit_burst = rate_limit_burst or config["log_rate_limit_burst"]
+        self.stream = stream
+        self.clock = clock
+        self.buffer = []
+        self.windows = OrderedDict()
+        self.pruned_at = clock()
+        self.lock = threading.Lock()
+
+    def enabled(self, severity):
+        """Returns True if entries of this severity are written, to skip building costly ones."""
+        return SEVERITIES[severity] >= self.level
+
+    def _admit(self, key):
+        """Returns the number of entries dropped since the last admitted one, or None to drop this one."""
+        now = self.clock()
+        if now - self.pruned_at >= self.rate_limit_seconds:
+            # the windows are kept oldest first, so the expired ones are at the front. Those that
+            # dropped entries are kept, for the next entry of their message to count them
+            expired = []
+            for k, w in self.windows.items():
+                if now - w[0] < self.rate_limit_seconds:
+                    break
+                if not w[2]:
+                    expired.append(k)
+            for k in expired:
+                del self.windows[k]
+            self.pruned_at = now
+        window = self.windows.get(key)
+        if window is None or now - window[0] >= self.rate_limit_seconds:
+            dropped = window[2] if window else 0
+            self.windows[key] = [now, 1, 0]
+            self.windows.move_to_end(key)
+            if len(self.windows) > MAX_RATE_WINDOWS:
+                # most messages embed changing values, so forget the oldest window
+                self.windows.popitem(last=False)
+            return dropped
+        if window[1] < self.rate_limit_burst:
+            window[1] += 1
+            return 0
+        window[2] += 1
+        return None
+
+    def log(self, main_msg, details=None, severity="INFO", rate_key=None):
+        """
+        Logs a message with the given details and severity.
+
+        Args:
+            main_msg (str): The main message of the log.
+            details: Additional details, any JSON-serializable value. A callable is only called
+                if the entry is written.
+            severity (str): One of 'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'.
+            rate_key (str): The key entries are rate limited by. Defaults to the main message,
+                so pass a constant key for messages embedding changing values.
+        """
+        if SEVERITIES[severity] < self.level:
+            return
+        with self.lock:
+            dropped = 0
+            if SEVERITIES[severity] < SEVERITIES["ERROR"]:
+                dropped = self._admit(rate_key or main_msg)
+                if dropped is None:
+                    return
+        entry = {
+            "severity": severity,
+            "message": main_msg,
+            "custom_property": details() if callable(details) else details,
+        }
+        if dropped:
+            entry["suppressed"] = dropped
+        line = orjson.dumps(entry, default=str)
+        with self.lock:
+            self.buffer.append(line)
+            full = len(self.buffer) >= self.buffer_size
+        if full or SEVERITIES[severity] >= SEVERITIES["WARNING"]:
+            self.flush()
+
+    def debug(self, main_msg, details=None, rate_key=None):
+        self.log(main_msg, details, "DEBUG", rate_key)
+
+    def info(self, main_msg, details=None, rate_key=None):
+        self.log(main_msg, details, "INFO", rate_key)
+
+    def warning(self, main_msg, details=None, rate_key=None):
+        self.log(main_msg, details, "WARNING", rate_key)
+
+    def error(self, main_msg, details=None, rate_key=None):
+        self.log(main_msg, details, "ERROR", rate_key)
+
+    def flush(self):
+        """Writes out the buffered entries, one JSON object per line."""
+        with self.lock:
+            lines, self.buffer = self.buffer, []
+            if not lines:
+                return
+            stream = self.stream or sys.stdout
+            data = b"\n".join(lines) + b"\n"
+            binary = getattr(stream, "buffer", None)
+            if binary is not None:
+                # skip the decoding of the text layer, after writing out what it holds
+                stream.flush()
+                binary.write(data)
+                binary.flush()
+            else:
+                stream.write(data.decode())
+                stream.flush()
+
+    def reset(self):
+        """Forgets the rate limiting windows, as warm instances reuse the module state."""
+        with self.lock:
+            self.windows = OrderedDict()
+            self.pruned_at = self.clock()
+
+
+logger = Logger()
+atexit.register(logger.flush)
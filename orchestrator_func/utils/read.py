@@ -1,55 +1,130 @@
 from .configs import config
-from .write import write_log
-from google.cloud import storage
-import google.auth.transport.requests
-import google.oauth2.id_token
+from .logger import logger
 import json
 import datetime
 import time
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
 
+_id_tokens = {}
+_id_tokens_lock = threading.Lock()
 
-def _post_with_url(url, data={}):
+
+class _RateLimiter:
+    """
+    Spaces out calls so that no more than `rate_per_second` start in any second.
+
+    Args:
+        rate_per_second (float): The maximum call rate. A falsy value disables the limit.
+    """
+
+    def __init__(self, rate_per_second):
+        self.interval = 1.0 / rate_per_second if rate_per_second else 0.0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """Blocks until the caller is allowed to proceed."""
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _get_id_token(audience):
+    """
+    Returns an ID token for the given audience, reusing a cached one until it is about to expire.
+
+    Args:
+        audience (str): The URL the token is issued for.
+
+    Returns:
+        str: The ID token.
+    """
+    with _id_tokens_lock:
+        cached = _id_tokens.get(audience)
+        if cached and cached[1] - config["id_token_refresh_margin_seconds"] > time.time():
+            return cached[0]
+        import google.auth.jwt
+        import google.auth.transport.requests
+        import google.oauth2.id_token
+
+        request = google.auth.transport.requests.Request()
+        token = google.oauth2.id_token.fetch_id_token(request, audience)
+        try:
+            expiry = google.auth.jwt.decode(token, verify=False)["exp"]
+        except (ValueError, KeyError):
+            expiry = time.time() + config["id_token_default_ttl_seconds"]
+        _id_tokens[audience] = (token, expiry)
+        return token
+
+
+def _post_with_url(url, data={}, session=None):
     """
     Post data to a URL with GCP service account authentication.
 
     Args:
         url (str): The URL to POST to.
         data (dict): The data to send in the POST request.
+        session (requests.Session): The HTTP session to use. Defaults to `requests`.
+
+    Returns:
+        bool: True if the executor accepted the request, False otherwise.
 
     Notes:
-        - The function uses the `fetch_id_token` method from the `google.auth.transport.requests` module to
-          authenticate the request with the service account.
+        - The ID token is cached per audience and reused until it is about to expire.
         - The function sets the `Authorization` and `Content-Type` headers to `Bearer <token>` and
           `application/json`, respectively.
-        - The function attempts to POST the data with a very short timeout (5 seconds) to emulate a
-          fire-and-forget mechanism. If a `ReadTimeout` exception is raised, it is caught and ignored.
-    """
-    request = google.auth.transport.requests.Request()
-    token = google.oauth2.id_token.fetch_id_token(request, url)
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-    }
-    print(write_log(f'Sending POST request for {data["start_date"]}', f"Data: {data}"))
+        - The function attempts to POST the data with a very short timeout to emulate a
+          fire-and-forget mechanism. A `ReadTimeout` means the request was delivered and the
+          executor is still working on it, so it counts as accepted. Failures to fetch the ID
+          token, connection errors and HTTP error statuses count as failed.
+    """
+    import google.auth.exceptions
+
+    session = session or requests
+    logger.debug(f'Sending POST request for {data["start_date"]}', data, rate_key="Sending POST request")
     try:
+        headers = {
+            "Authorization": f"Bearer {_get_id_token(url)}",
+            "Content-Type": "application/json",
+        }
         # use a very short timeout for a hacky fire-and-forget mechanism
-        response = requests.post(url, data=json.dumps(data), headers=headers, timeout=5)
+        response = session.post(
+            url,
+            data=json.dumps(data),
+            headers=headers,
+            timeout=config["dispatch_timeout_seconds"],
+        )
+        response.raise_for_status()
     except requests.exceptions.ReadTimeout:
         pass
-    return
+    except (requests.exceptions.RequestException, google.auth.exceptions.GoogleAuthError) as req_err:
+        logger.warning(f'POST request for {data["start_date"]} failed: {req_err}', rate_key="POST request failed")
+        return False
+    return True
 
 
-def _get_date_periods(scheduler_id):
+def _get_date_periods(scheduler_id, window_days=None):
     """
     Generate a list of date periods for a given scheduler ID.
 
+    Consecutive days are grouped into windows of `window_days` days, so that a single
+    FASS API request (and a single executor) covers a whole window.
+
     Args:
         scheduler_id (str): The ID of the scheduler.
+        window_days (int): The number of days per period. Defaults to config["request_window_days"].
 
     Returns:
-        list: A list of date periods in the format "start_date=<date>&end_date=<date>".
+        list: A list of date periods in the format "start_date=<date>&end_date=<date>", most recent first.
     """
+    window_days = window_days or config["request_window_days"]
     date_now = datetime.date.today()
     date_periods = []
     if scheduler_id == "2h":
@@ -61,20 +136,41 @@ def _get_date_periods(scheduler_id):
     if scheduler_id == "1m":
         # monthly run takes 30 days
         days = 30
-    for i in range(days):
-        start_date = date_now - datetime.timedelta(days=i)
+    for i in range(0, days, window_days):
         end_date = date_now - datetime.timedelta(days=i)
+        start_date = date_now - datetime.timedelta(days=min(i + window_days, days) - 1)
         date_period = f"start_date={start_date}&end_date={end_date}"
         date_periods.append(date_period)
     return date_periods
 
 
-def build_urls(scheduler_id):
+def count_days(urls):
+    """
+    Counts the days covered by a list of FASS API URLs.
+
+    Args:
+        urls (list): The list of URLs, each with a start_date and an end_date.
+
+    Returns:
+        int: The total number of days.
+    """
+    days = 0
+    for url in urls:
+        start_date = url.split("start_date=")[1].split("&")[0]
+        end_date = url.split("end_date=")[1].split("&")[0]
+        days += (
+            datetime.date.fromisoformat(end_date) - datetime.date.fromisoformat(start_date)
+        ).days + 1
+    return days
+
+
+def build_urls(scheduler_id, window_days=None):
     """
     Builds a list of URLs for the FASS API based on the provided scheduler ID.
 
     Args:
         scheduler_id (str): The ID of the scheduler. Valid values are "2h", "7d", and "1m".
+        window_days (int): The number of days per URL. Defaults to config["request_window_days"].
 
     Returns:
         list: A list of URLs for the FASS API.
@@ -90,9 +186,9 @@ def build_urls(scheduler_id):
     base_url = f"{config['base_url']}?"
     try:
         if scheduler_id not in ["2h", "7d", "1m"]:
-            e = write_log("Scheduler ID not valid", None, severity="ERROR")
+            logger.error("Scheduler ID not valid", scheduler_id)
 
-        date_periods = _get_date_periods(scheduler_id)
+        date_periods = _get_date_periods(scheduler_id, window_days)
         for date_period in date_periods:
             urls.append((base_url + date_period).strip())
     except:
@@ -100,75 +196,92 @@ def build_urls(scheduler_id):
     return urls
 
 
-def run_execution(executor_url, urls, datetime_now, scheduler_id):
+def build_range_urls(start_date, end_date, window_days=None):
+    """
+    Builds the FASS API URLs covering an arbitrary date range, for backfills.
+
+    Args:
+        start_date (str): The first day, in YYYY-MM-DD format.
+        end_date (str): The last day, in YYYY-MM-DD format.
+        window_days (int): The number of days per URL. Defaults to config["request_window_days"].
+
+    Returns:
+        list: A list of URLs for the FASS API, oldest window first.
+
+    Raises:
+        ValueError: If the dates are malformed or the range is empty.
+    """
+    window_days = window_days or config["request_window_days"]
+    first_day = datetime.date.fromisoformat(start_date)
+    last_day = datetime.date.fromisoformat(end_date)
+    if last_day < first_day:
+        raise ValueError(f"Empty date range: {start_date} to {end_date}")
+    urls = []
+    window_start = first_day
+    while window_start <= last_day:
+        window_end = min(window_start + datetime.timedelta(days=window_days - 1), last_day)
+        urls.append(f"{config['base_url']}?start_date={window_start}&end_date={window_end}")
+        window_start = window_end + datetime.timedelta(days=1)
+    return urls
+
+
+def run_execution(executor_url, urls, datetime_now, scheduler_id, max_workers=None, rate_per_second=None):
     """
     Runs the execution of the FASS API for the given list of URLs.
 
     This function takes the list of URLs and runs them in parallel by sending
-    an asynchronous POST request to the Executor Cloud Function. The Executor
-    Cloud Function will then call the FASS API and write the data to either
-    GCS (for 7d and 1m schedulers) or BigQuery (for 2h scheduler).
+    POST requests to the Executor Cloud Function from a bounded thread pool.
+    The Executor Cloud Function will then call the FASS API and write the data
+    to GCS, and the executor flagged with batch_load loads it to BigQuery.
 
-    The function also sets the destination and batch_load flags depending on
-    the scheduler ID and the position of the URL in the list.
+    The function also sets the batch_load flag depending on the position of the
+    URL in the list.
 
     Args:
         executor_url (str): The URL of the Executor Cloud Function.
         urls (list): The list of URLs to run.
         datetime_now (str): The current datetime in ISO format.
         scheduler_id (str): The ID of the scheduler.
+        max_workers (int): The maximum number of concurrent POSTs. Defaults to config["dispatch_max_workers"].
+        rate_per_second (float): The maximum POSTs started per second. Defaults to config["dispatch_rate_per_second"].
 
     Returns:
-        None
+        dict: The start dates whose dispatch was "accepted" and those that "failed".
     """
+    if not urls:
+        return {"accepted": [], "failed": []}
+    max_workers = max_workers or config["dispatch_max_workers"]
+    if rate_per_second is None:
+        rate_per_second = config["dispatch_rate_per_second"]
+    limiter = _RateLimiter(rate_per_second)
     last_url = urls[-1]
-    # Always False beside for last URL in 1m and 7d schedulers
-    batch_load = False
-    print(write_log("Sending async POST requests"))
+    payloads = []
     for url in urls:
-        if url == last_url:
-            # At the last processed URL, load temp CSV from GCS to BigQuery
-            batch_load = True
         start_date = url.split("start_date=")[1].split("&")[0]
-        data = {
-            "url": url,
-            "datetime_now": datetime_now,
-            "start_date": start_date,
-            "batch_load": batch_load,
-            "scheduler_id": scheduler_id,
-        }
-        _post_with_url(executor_url, data)
-        time.sleep(15)
-    return
-
-def check_running_routines(bucket_name, folder_name):
-    storage_client = storage.Client()
-    bucket = storage_client.get_bucket(bucket_name)
-    blobs = bucket.list_blobs(prefix=folder_name)
-    return any(blob.name != folder_name for blob in blobs)
-
-def check_files_count(bucket_name, scheduler_id):
-    client = storage.Client()
-    if scheduler_id == "2h":
-        # the 2h Scheduler should generate 5 (days) * 2 (platforms) files
-        expected_num_files = 10
-    if scheduler_id == "7d":
-        # the 7d Scheduler should generate 14 (days) * 2 (platforms) files
-        expected_num_files = 28
-    if scheduler_id == "1m":
-        # the 1m Scheduler should generate 30 (days) * 2 (platforms) files
-        expected_num_files = 60
-    
-
-    all_files = [
-            f"{bucket_name}/{blob.name}"
-            for blob in client.list_blobs(bucket_name, prefix="temp_data")
-        ]
-    print(
-        write_log(
-            f"Expected {expected_num_files} files, found {len(all_files)} files in GCS bucket"
-            )
+        end_date = url.split("end_date=")[1].split("&")[0]
+        payloads.append(
+            {
+                "url": url,
+                "datetime_now": datetime_now,
+                "start_date": start_date,
+                "end_date": end_date,
+                # Always False beside for the last URL, which loads temp data from GCS to BigQuery
+                "batch_load": url == last_url,
+                "scheduler_id": scheduler_id,
+                "platforms": config["platforms"],
+            }
         )
-    return len(all_files) == expected_num_files
-        
-    
\ No newline at end of file
+
+    def _dispatch(data):
+        limiter.wait()
+        return _post_with_url(executor_url, data, session)
+
+    logger.info("Sending async POST requests")
+    with requests.Session() as session:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(payloads))) as pool:
+            accepted = list(pool.map(_dispatch, payloads))
+    results = {"accepted": [], "failed": []}
+    for data, ok in zip(payloads, accepted):
+        results["accepted" if ok else "failed"].append(data["start_date"])
+    return results
+
@@ -0,0 +1,119 @@
+# Lightweight timing spans emitting structured logs. Keep in sync with executor_func/utils/tracing.py
+
+from .configs import config
+from .logger import logger
+import threading
+import time
+
+
+class Tracer:
+    """Collects the finished spans of an invocation, to summarize where its time went."""
+
+    def __init__(self):
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def record(self, span):
+        with self.lock:
+            self.spans.append(span)
+
+    def reset(self):
+        """Drops the spans of the previous invocation, as warm instances reuse the module state."""
+        with self.lock:
+            self.spans = []
+
+    def summary(self):
+        """
+        Aggregates the finished spans per name.
+
+        Returns:
+            dict: A mapping of span name to its count, total and max seconds, and the sum of
+                its numeric attributes (e.g. rows, bytes), slowest stage first.
+        """
+        with self.lock:
+            spans = list(self.spans)
+        stages = {}
+        for span in spans:
+            stage = stages.setdefault(span.name, {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+            stage["count"] += 1
+            stage["seconds"] += span.duration
+            stage["max_seconds"] = max(stage["max_seconds"], span.duration)
+            for key, value in span.attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    stage[key] = stage.get(key, 0) + value
+        for stage in stages.values():
+            stage["seconds"] = round(stage["seconds"], 3)
+            stage["max_seconds"] = round(stage["max_seconds"], 3)
+        return dict(sorted(stages.items(), key=lambda item: item[1]["seconds"], reverse=True))
+
+
+tracer = Tracer()
+
+
+class Span:
+    """
+    Times a block of code and logs its duration with its attributes when it ends, at INFO level
+    if it took at least config["span_info_seconds"] or failed, and at DEBUG level otherwise.
+
+    Args:
+        name (str): The name of the stage, e.g. "get_with_url".
+        **attributes: Values describing the work done, e.g. rows or bytes. More can be added with `set`.
+    """
+
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self.duration = 0.0
+
+    def set(self, **attributes):
+        """Adds attributes to the span, e.g. the number of rows once they are known."""
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        tracer.record(self)
+        slow = self.duration >= config["span_info_seconds"] or exc_type is not None
+        severity = "INFO" if slow else "DEBUG"
+        if logger.enabled(severity):
+            logger.log(
+                f"{self.name} took {self.duration:.3f}s",
+                {"span": self.name, "duration_seconds": round(self.duration, 3), **self.attributes},
+                severity=severity,
+                rate_key=f"span {self.name}",
+            )
+
+
+def span(name, **attributes):
+    """
+    Returns a span timing the enclosed block.
+
+    Args:
+        name (str): The name of the stage.
+        **attributes: Values describing the work done.
+
+    Returns:
+        Span: The span, to use as a context manager.
+    """
+    return Span(name, **attributes)
+
+
+def log_run_summary(main_msg="Run summary"):
+    """
+    Logs the per-stage summary of the spans recorded since the last reset, then resets them.
+
+    Args:
+        main_msg (str): The message of the log entry.
+
+    Returns:
+        dict: The summary that was logged.
+    """
+    summary = tracer.summary()
+    logger.info(main_msg, {"stages": summary})
+    tracer.reset()
+    return summary
@@ -1,40 +1,39 @@
-import json
-from google.cloud import storage
+from .configs import config
+from .clients import get_storage_client
+from .logger import logger
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-def write_log(main_msg, details=None, severity="INFO"):
-    """
-    Writes a log message with the given main message, details, and severity level.
-
-    Args:
-        main_msg (str): The main message of the log.
-        details (str): Additional details to include in the log.
-        severity (str): The severity level of the log. Must be one of the following: 'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'.
+def _delete_blob(blob):
+    """Deletes a blob. Returns False if it was already gone."""
+    from google.api_core.exceptions import NotFound
 
-    Returns:
-        str: A JSON string representing the log message.
+    try:
+        blob.delete()
+    except NotFound:
+        return False
+    return True
 
-    """
-    return json.dumps(
-        dict(
-            severity=severity,
-            message=main_msg,
-            custom_property=details,
-        )
-    )
 
-def clean_all_temp_files(bucket_name):
+def clean_all_temp_files(bucket_name, prefix="temp_data", max_workers=None, client=None):
     """
-    Deletes all files in the given GCS bucket with the prefix "temp_data".
+    Deletes all files in the given GCS bucket under a prefix, through a bounded pool of concurrent deletes.
 
     Args:
         bucket_name (str): The name of the GCS bucket to delete files from.
+        prefix (str): The prefix to clean, e.g. the staging prefix of a single run. Defaults to "temp_data".
+        max_workers (int): The number of concurrent deletes. Defaults to config["cleanup_max_workers"].
+        client (google.cloud.storage.Client): The client to use. Defaults to the shared client.
 
     Returns:
-        None
+        dict: The number of deleted files under "deleted" and the time it took under "seconds".
     """
-    client = storage.Client()
-    all_files = [blob for blob in client.list_blobs(bucket_name, prefix="temp_data")]
-    for file in all_files:
-        file.delete()
-    return
-
+    max_workers = max_workers or config["cleanup_max_workers"]
+    client = client or get_storage_client()
+    start = time.perf_counter()
+    blobs = client.list_blobs(bucket_name, prefix=prefix)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        deleted = sum(pool.map(_delete_blob, blobs))
+    summary = {"deleted": deleted, "seconds": round(time.perf_counter() - start, 3)}
+    logger.info(f"Deleted {deleted} files under {prefix}", summary)
+    return summary